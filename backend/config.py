@@ -31,9 +31,86 @@ class Settings(BaseSettings):
 
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
     
+    DB_ECHO: bool = False  # Log every SQL statement
+    DB_POOL_SIZE: int = 10  # Connections kept open per process
+    DB_MAX_OVERFLOW: int = 10  # Extra connections opened under load and closed when returned
+    DB_POOL_TIMEOUT: float = 30.0  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # Seconds before a connection is replaced, ahead of server/proxy idle timeouts
+    DB_POOL_PRE_PING: bool = False  # Test each connection with a round trip when it is checked out; only for networks that drop connections before DB_POOL_RECYCLE
+    DB_STATEMENT_CACHE_SIZE: int = 256  # Prepared statements cached per asyncpg connection; 0 behind PgBouncer transaction pooling
+
     # Telegram
     TELEGRAM_API_ID: Optional[str] = None
     TELEGRAM_API_HASH: Optional[str] = None
+    TELEGRAM_HEALTH_INTERVAL: float = 60.0  # Seconds between account connection checks and last_used writes
+    TELEGRAM_IN_API: bool = False  # Run the Telegram client inside the API process instead of `python -m backend.worker`
+
+    # Forwarding workers
+    WORKER_SHARDS: int = 1  # Hash shards of source chats, spread over the running workers
+    WORKER_LEASE_SECONDS: float = 30.0  # Shard leases not renewed within this time are taken over
+    WORKER_HANDOFF_INTERVAL: float = 1.0  # Seconds between lease rounds while a shard is offered to another worker
+    WORKER_METRICS_PORT: int = 9100  # Port serving /metrics from a worker process; 0 disables it
+
+    # Delivery
+    DELIVERY_MAX_CONCURRENCY: int = 16  # Sends in flight at once across all destinations
+
+    # Duplicate suppression (content cross-posted to several sources)
+    DEDUPE_WINDOW_SECONDS: float = 0.0  # Window for rules without their own dedupe_window; 0 disables
+    DEDUPE_MAX_ENTRIES: int = 100000  # (destination, content hash) pairs remembered per process
+
+    # AI text transforms (Rule.ai_config)
+    AI_BACKEND: str = "gemini"  # "gemini", or "echo" to send texts unchanged without calling a model
+    GEMINI_API_KEY: Optional[str] = None
+    AI_DEFAULT_MODEL: str = "gemini-3-flash-preview"  # For rules whose ai_config has no model
+    AI_MAX_CONCURRENCY: int = 4  # Batches in flight to the model backend at once
+    AI_BATCH_SIZE: int = 8  # Texts per model request
+    AI_BATCH_WINDOW: float = 0.05  # Seconds to wait for more texts with the same model and instruction
+    AI_CACHE_SIZE: int = 5000  # Results kept, keyed by (model, instruction, text hash)
+    AI_TIMEOUT: float = 30.0  # Seconds per model request
+
+    # Durable delivery outbox
+    OUTBOX_BATCH_SIZE: int = 100  # Rows claimed per query
+    OUTBOX_MAX_ATTEMPTS: int = 5  # Attempts before a delivery is dead-lettered
+    OUTBOX_BACKOFF_BASE: float = 5.0  # Seconds before the first retry, doubled per attempt
+    OUTBOX_BACKOFF_MAX: float = 600.0
+    OUTBOX_POLL_INTERVAL: float = 2.0  # Seconds between claims when nothing signalled new work
+    OUTBOX_CLAIM_TIMEOUT: float = 900.0  # In-flight rows older than this are assumed orphaned and reclaimed
+    OUTBOX_MESSAGE_CACHE_SIZE: int = 1000  # Recently received messages kept to avoid refetching for delivery
+    OUTBOX_SHUTDOWN_TIMEOUT: float = 10.0  # Seconds to wait for in-flight sends on shutdown before releasing them
+    MEDIA_CACHE_SIZE: int = 10000  # Media references kept for copy-mode sends, per (account, file)
+
+    # Outbound rate limiting (token buckets, rates in messages per second)
+    RATE_LIMIT_DESTINATION_RATE: float = 1.0
+    RATE_LIMIT_DESTINATION_BURST: float = 3
+    RATE_LIMIT_ACCOUNT_RATE: float = 25.0
+    RATE_LIMIT_ACCOUNT_BURST: float = 30
+    RATE_LIMIT_MAX_FLOOD_RETRIES: int = 3  # FloodWaits absorbed per send before it is reported as failed
+
+    # Regex conditions
+    REGEX_MAX_LENGTH: int = 512  # Longer patterns are rejected when rules are saved
+    REGEX_TIME_BUDGET: float = 0.05  # Seconds of regex evaluation per message; rules over it get a strike
+    REGEX_MAX_STRIKES: int = 3  # Strikes before a rule is disabled automatically
+
+    # Bulk rule import
+    RULE_IMPORT_CHUNK_SIZE: int = 500  # Rules written per transaction
+    RULE_IMPORT_MAX_ERRORS: int = 1000  # Row errors listed in the response; the rest are only counted
+
+    # Rule change propagation between processes
+    RULE_EVENTS_CHANNEL: str = "rule_changes"  # Postgres LISTEN/NOTIFY channel
+    RULE_VERSION_CHECK_INTERVAL: float = 10.0  # Seconds between rule-set version checks that recover missed notifications
+
+    # Rule backtests
+    BACKTEST_BATCH_SIZE: int = 1000  # Messages evaluated per worker-thread call
+    BACKTEST_MAX_MESSAGES: int = 200000  # Larger corpora are rejected with 413
+
+    # Delivery log buffering
+    LOG_BUFFER_SIZE: int = 10000  # Max records held in memory before the full policy applies
+    LOG_BATCH_SIZE: int = 500  # Records per INSERT; a full batch triggers an early flush
+    LOG_FLUSH_INTERVAL: float = 1.0  # Seconds between time-based flushes
+    LOG_BUFFER_FULL_POLICY: str = "drop"  # "drop" new records or "block" the caller until space frees up
+    LOG_RETENTION_DAYS: float = 30.0  # Raw log rows older than this are compacted into hourly rollups and deleted; 0 keeps them
+    LOG_RETENTION_INTERVAL: float = 3600.0  # Seconds between retention runs
+    LOG_RETENTION_MAX_CHUNKS: int = 24  # Hours compacted per run, so a large backlog is worked off gradually
     
     class Config:
         env_file = ".env"
@@ -1,18 +1,94 @@
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import Table, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlmodel import SQLModel
 from backend.config import settings
+from backend.models import Log, Outbox, ResolvedPeer, Rule, Worker
+from backend.services.metrics import registry
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True, future=True)
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    create_async_engine() keyword arguments for the given database URL.
+    """
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO}
+    if url.startswith("sqlite"):
+        # SQLite pools are per-file connections; the sizing settings do not apply
+        return options
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if "+asyncpg" in url:
+        # Statements are prepared once per connection and reused, so the hot queries
+        # (log inserts, rollup upserts, outbox claims) skip parsing and planning
+        options["connect_args"] = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+    return options
+
+engine = create_async_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+
+# Built once; creating a session from it is cheap
+async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+def _pool_usage():
+    pool = engine.pool
+    usage = {}
+    # Only queue-based pools track these; SQLite test setups use other pool classes
+    for state in ("checkedout", "checkedin", "size", "overflow"):
+        method = getattr(pool, state, None)
+        if method is not None:
+            usage[(state,)] = method()
+    return usage
+
+registry.gauge("tgforwarder_db_pool_connections", "Database connection pool usage", ("state",), callback=_pool_usage)
 
 async def init_db():
     async with engine.begin() as conn:
         # await conn.run_sync(SQLModel.metadata.drop_all)
+        await conn.run_sync(_drop_outdated_caches)
         await conn.run_sync(SQLModel.metadata.create_all)
+        # create_all skips tables that already exist; add columns and indexes introduced since they were created
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+
+def _drop_outdated_caches(conn):
+    # Before peers were cached per account, chat alone was ResolvedPeer's primary key. The
+    # table only caches what the client re-resolves at startup, so it is recreated instead
+    # of migrated.
+    inspector = inspect(conn)
+    table = ResolvedPeer.__table__
+    if inspector.has_table(table.name) and "account" not in {c["name"] for c in inspector.get_columns(table.name)}:
+        table.drop(conn)
+
+# Columns added to tables after their first release, in the order they were introduced
+ADDED_COLUMNS: List[Tuple[Table, str]] = [
+    (Rule.__table__, "dedupe_window"),
+    (Rule.__table__, "disabled_reason"),
+    (Outbox.__table__, "shard"),
+    (Outbox.__table__, "transform"),
+    (Worker.__table__, "state"),
+]
+
+def _add_missing_columns(conn):
+    inspector = inspect(conn)
+    quote = conn.dialect.identifier_preparer.quote
+    for table, name in ADDED_COLUMNS:
+        if name in {column["name"] for column in inspector.get_columns(table.name)}:
+            continue
+        column = table.c[name]
+        ddl = f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(name)} {column.type.compile(dialect=conn.dialect)}"
+        if not column.nullable:
+            # Existing rows need a value; the model's default is a plain scalar for every such column
+            ddl += f" DEFAULT {column.default.arg!r} NOT NULL"
+        conn.execute(text(ddl))
+
+def _create_missing_indexes(conn):
+    for table in (Log.__table__, Rule.__table__, Outbox.__table__):
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
 
 async def get_session() -> AsyncSession:
-    async_session = sessionmaker(
-        engine, class_=AsyncSession, expire_on_commit=False
-    )
     async with async_session() as session:
         yield session
@@ -4,9 +4,14 @@ import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from backend.config import settings
 from backend.database import init_db
+from backend.services.rule_index import rule_index
+from backend.services.rule_events import rule_events
+from backend.services.log_sink import log_sink
+from backend.services.log_retention import log_retention
 from backend.telegram.client import telegram_service
-from backend.routes import rules
+from backend.routes import rules, delivery, logs, metrics
 
 logger = logging.getLogger(__name__)
 
@@ -15,28 +20,47 @@ async def lifespan(app: FastAPI):
     # Startup:
     await init_db()
 
-    # Start Telegram client in the background to avoid blocking server startup
-    # This is important if authentication requires user interaction or takes time.
-    async def start_telegram():
-        try:
-            await telegram_service.start()
-        except Exception as e:
-            logger.error(f"Failed to start Telegram client: {e}")
+    # Load active rules into memory so the message path never queries for them, and
+    # follow changes made through other replicas
+    await rule_events.start(rule_index)
 
-    # Keep a reference to the task to prevent garbage collection
-    telegram_task = asyncio.create_task(start_telegram())
+    await log_sink.start()
+    # Retention runs in the API process only, so worker replicas do not compete for the same chunks
+    await log_retention.start()
+
+    # Forwarding normally runs in separate `python -m backend.worker` processes, so API
+    # replicas can be scaled freely; TELEGRAM_IN_API keeps the single-process setup.
+    telegram_task = None
+    if settings.TELEGRAM_IN_API:
+        # Start Telegram client in the background to avoid blocking server startup
+        # This is important if authentication requires user interaction or takes time.
+        async def start_telegram():
+            try:
+                await telegram_service.start()
+            except Exception as e:
+                logger.error(f"Failed to start Telegram client: {e}")
+
+        # Keep a reference to the task to prevent garbage collection
+        telegram_task = asyncio.create_task(start_telegram())
     
     yield
     
     # Shutdown:
-    if not telegram_task.done():
-        telegram_task.cancel()
-        try:
-            await telegram_task
-        except asyncio.CancelledError:
-            pass
+    if telegram_task is not None:
+        if not telegram_task.done():
+            telegram_task.cancel()
+            try:
+                await telegram_task
+            except asyncio.CancelledError:
+                pass
+
+        await telegram_service.stop()
+
+    await log_retention.stop()
+    await rule_events.stop()
 
-    await telegram_service.stop()
+    # Drain buffered delivery logs only after the client has stopped producing them
+    await log_sink.stop()
 
 app = FastAPI(title="tgForwarder-2026 API", lifespan=lifespan)
 
@@ -57,9 +81,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"], # Read by the dashboard when paging and polling the rules list
 )
 
 app.include_router(rules.router)
+app.include_router(delivery.router)
+app.include_router(logs.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 def read_root():
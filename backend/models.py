@@ -1,6 +1,7 @@
 from typing import Optional, List, Any
 from datetime import datetime
-from sqlmodel import SQLModel, Field, Relationship, JSON, Column
+from sqlmodel import SQLModel, Field, Relationship, JSON, Column, BigInteger
+from sqlalchemy import Index
 from sqlalchemy.dialects.postgresql import JSONB
 from enum import Enum
 
@@ -8,9 +9,14 @@ class DeliveryMethod(str, Enum):
     FORWARD = "forward"
     COPY = "copy"
 
+class OutboxStatus(str, Enum):
+    PENDING = "pending"
+    IN_FLIGHT = "in_flight"
+    DEAD = "dead"
+
 class RuleBase(SQLModel):
     name: Optional[str] = Field(default=None, index=True)
-    source: str  # e.g., "chat_id_123"
+    source: str = Field(index=True) # e.g., "chat_id_123"
     destination: str # e.g., "chat_id_456"
     filters: Optional[dict] = Field(
         default=None, 
@@ -22,11 +28,26 @@ class RuleBase(SQLModel):
     ) # e.g. { "enabled": true, "systemInstruction": "...", "model": "..." }
     delivery_method: str = Field(default=DeliveryMethod.FORWARD.value) # "forward" or "copy"
     is_active: bool = Field(default=True)
+    dedupe_window: Optional[float] = Field(default=None) # Seconds to suppress repeats of the same content to the destination; None uses DEDUPE_WINDOW_SECONDS, 0 disables
 
 class Rule(RuleBase, table=True):
+    __table_args__ = (
+        # The rules list pages by (updated_at, id) when sorted by last change
+        Index("ix_rule_updated_at_id", "updated_at", "id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    disabled_reason: Optional[str] = None # Set when the rule was deactivated automatically
+
+class RuleSetVersion(SQLModel, table=True):
+    """
+    Single-row counter bumped in the same transaction as every rule create, update and delete.
+    """
+    id: int = Field(default=1, primary_key=True)
+    version: int = Field(default=0)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 class RuleCreate(RuleBase):
     pass
@@ -35,6 +56,7 @@ class RuleRead(RuleBase):
     id: int
     created_at: datetime
     updated_at: datetime
+    disabled_reason: Optional[str] = None
 
 class RuleUpdate(SQLModel):
     name: Optional[str] = None
@@ -44,6 +66,7 @@ class RuleUpdate(SQLModel):
     ai_config: Optional[dict] = None
     delivery_method: Optional[str] = None
     is_active: Optional[bool] = None
+    dedupe_window: Optional[float] = None
 
 class SessionBase(SQLModel):
     session_string: str
@@ -58,9 +81,85 @@ class Session(SessionBase, table=True):
 class LogBase(SQLModel):
     rule_id: Optional[int] = Field(default=None, foreign_key="rule.id")
     source_message_id: int
-    status: str # "forwarded", "filtered", "failed"
+    status: str # "forwarded", "filtered", "failed", "duplicate"
     details: Optional[str] = None
 
 class Log(LogBase, table=True):
+    __table_args__ = (
+        # Log queries page by (timestamp, id); each filter leads its own index so a page is a range scan
+        Index("ix_log_timestamp_id", "timestamp", "id"),
+        Index("ix_log_rule_id_timestamp_id", "rule_id", "timestamp", "id"),
+        Index("ix_log_status_timestamp_id", "status", "timestamp", "id"),
+        Index("ix_log_source_message_id", "source_message_id"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+class LogRead(LogBase):
+    id: int
+    timestamp: datetime
+
+class LogRollup(SQLModel, table=True):
+    """
+    Log row counts per hour, rule and status, updated in the same transaction as each log batch.
+    """
+    hour: datetime = Field(primary_key=True) # Start of the UTC hour
+    rule_id: int = Field(default=0, primary_key=True) # 0 for records without a rule
+    status: str = Field(primary_key=True)
+    count: int = Field(default=0)
+
+class OutboxBase(SQLModel):
+    source_chat_id: str
+    source_message_id: int
+    destination: str
+    delivery_method: str = Field(default=DeliveryMethod.FORWARD.value)
+    rule_ids: List[int] = Field(
+        default_factory=list,
+        sa_column=Column(JSON().with_variant(JSONB, "postgresql"))
+    ) # Rules coalesced into this delivery; each gets its own Log row
+    status: str = Field(default=OutboxStatus.PENDING.value, index=True) # "pending", "in_flight", "dead"
+    attempts: int = Field(default=0)
+    next_attempt_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    last_error: Optional[str] = None
+    shard: int = Field(default=0, index=True) # Source shard; only the worker owning it claims the row
+    transform: Optional[List[str]] = Field(
+        default=None,
+        sa_column=Column(JSON().with_variant(JSONB, "postgresql"))
+    ) # [model, system instruction] of an AI transform applied to the text when sending; the message is then sent as a copy
+
+class Outbox(OutboxBase, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    claimed_at: Optional[datetime] = Field(default=None)
+    claimed_by: Optional[str] = Field(default=None)
+
+class ResolvedPeer(SQLModel, table=True):
+    """
+    Telegram peer resolved from a rule's chat reference, so sends never have to resolve it again.
+    """
+    account: str = Field(default="default", primary_key=True) # Access hashes are only valid for the account that resolved them
+    chat: str = Field(primary_key=True) # As written in the rule, e.g. "-100123" or "@channel"
+    peer_type: str # "user", "chat", "channel" or "self"
+    peer_id: int = Field(sa_column=Column(BigInteger, nullable=False))
+    access_hash: Optional[int] = Field(default=None, sa_column=Column(BigInteger))
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+class Worker(SQLModel, table=True):
+    """
+    Running forwarding worker process; rows not refreshed within the lease are considered dead.
+    """
+    id: str = Field(primary_key=True)
+    heartbeat_at: datetime = Field(default_factory=datetime.utcnow)
+    state: Optional[dict] = Field(
+        default=None,
+        sa_column=Column(JSON().with_variant(JSONB, "postgresql"))
+    ) # Rate limiter and account pool snapshot written with each heartbeat, served by the API's /delivery routes
+
+class WorkerShard(SQLModel, table=True):
+    """
+    Lease on one hash shard of source chats, held by a forwarding worker process.
+    """
+    shard: int = Field(primary_key=True)
+    owner: Optional[str] = Field(default=None) # Worker id; None when free
+    lease_expires_at: Optional[datetime] = Field(default=None)
@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+from typing import List
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from backend.config import settings
+from backend.database import get_session
+from backend.models import Worker
+from backend.telegram.delivery import delivery_dispatcher
+from backend.telegram.pool import client_pool
+from backend.telegram.rate_limiter import rate_limiter
+
+router = APIRouter(prefix="/delivery", tags=["delivery"])
+
+async def live_workers(session: AsyncSession) -> List[Worker]:
+    """
+    Forwarding workers whose heartbeat is within the lease, with the state they reported.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=settings.WORKER_LEASE_SECONDS)
+    result = await session.execute(
+        select(Worker).where(Worker.heartbeat_at > cutoff, Worker.state.is_not(None)).order_by(Worker.id)
+    )
+    return result.scalars().all()
+
+@router.get("/rate-limits")
+async def read_rate_limits(session: AsyncSession = Depends(get_session)):
+    """
+    Current rate limiter state: parked destinations, waiting sends, bucket levels,
+    and the number of queued sends per destination lane.
+
+    The top-level keys describe this process (empty unless TELEGRAM_IN_API); "workers"
+    holds the same state as last reported by each forwarding worker.
+    """
+    state = rate_limiter.state()
+    state["queued"] = delivery_dispatcher.pending()
+    state["workers"] = {
+        worker.id: {**worker.state.get("rate_limits", {}), "reported_at": worker.heartbeat_at}
+        for worker in await live_workers(session)
+    }
+    return state
+
+@router.get("/accounts")
+async def read_accounts(session: AsyncSession = Depends(get_session)):
+    """
+    Telegram accounts in the client pool with their health and send statistics: this
+    process's pool, then each forwarding worker's as last reported (tagged with "worker").
+    """
+    accounts = client_pool.state()
+    for worker in await live_workers(session):
+        accounts += [{**account, "worker": worker.id} for account in worker.state.get("accounts", [])]
+    return accounts
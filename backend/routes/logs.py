@@ -0,0 +1,116 @@
+import base64
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from sqlalchemy import func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from backend.database import get_session
+from backend.models import Log, LogRead, LogRollup
+from backend.services.log_rollup import hour_of
+
+router = APIRouter(prefix="/logs", tags=["logs"])
+
+class LogPage(BaseModel):
+    items: List[LogRead]
+    next_cursor: Optional[str] = None # Pass back as ?cursor= for the next (older) page; None on the last page
+
+def encode_cursor(log: Log) -> str:
+    raw = f"{log.timestamp.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        timestamp, log_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """
+    Log timestamps are stored as naive UTC; aware query values (e.g. with a "Z" suffix)
+    are converted so they compare with them.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+def time_range(since: Optional[datetime] = None, until: Optional[datetime] = None) -> Tuple[Optional[datetime], Optional[datetime]]:
+    return naive_utc(since), naive_utc(until)
+
+@router.get("/", response_model=LogPage)
+async def read_logs(
+    rule_id: Optional[int] = None,
+    status: Optional[str] = None,
+    source_message_id: Optional[int] = None,
+    window: Tuple[Optional[datetime], Optional[datetime]] = Depends(time_range),
+    cursor: Optional[str] = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Delivery logs, newest first, paged by a (timestamp, id) cursor so deep pages cost the
+    same as the first one.
+    """
+    since, until = window
+    query = select(Log)
+    if rule_id is not None:
+        query = query.where(Log.rule_id == rule_id)
+    if status is not None:
+        query = query.where(Log.status == status)
+    if source_message_id is not None:
+        query = query.where(Log.source_message_id == source_message_id)
+    if since is not None:
+        query = query.where(Log.timestamp >= since)
+    if until is not None:
+        query = query.where(Log.timestamp < until)
+    if cursor is not None:
+        query = query.where(tuple_(Log.timestamp, Log.id) < decode_cursor(cursor))
+
+    query = query.order_by(Log.timestamp.desc(), Log.id.desc()).limit(limit + 1)
+    result = await session.execute(query)
+    logs = result.scalars().all()
+
+    next_cursor = encode_cursor(logs[limit - 1]) if len(logs) > limit else None
+    return LogPage(items=logs[:limit], next_cursor=next_cursor)
+
+@router.get("/stats")
+async def read_log_stats(
+    window: Tuple[Optional[datetime], Optional[datetime]] = Depends(time_range),
+    rule_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Log counts per rule and status over a window (default: the last 24 hours).
+
+    Served from the hourly LogRollup table, so the window is widened to whole hours.
+    """
+    since, until = window
+    until = until or datetime.utcnow()
+    since = since or until - timedelta(hours=24)
+    if since >= until:
+        raise HTTPException(status_code=422, detail="since must be before until")
+
+    query = (
+        select(LogRollup.rule_id, LogRollup.status, func.sum(LogRollup.count))
+        .where(LogRollup.hour >= hour_of(since), LogRollup.hour < until)
+        .group_by(LogRollup.rule_id, LogRollup.status)
+    )
+    if rule_id is not None:
+        query = query.where(LogRollup.rule_id == rule_id)
+    result = await session.execute(query)
+
+    rules: Dict[int, Dict[str, int]] = {}
+    for row_rule_id, status, count in result.all():
+        counts = rules.setdefault(row_rule_id, {"forwarded": 0, "failed": 0})
+        counts[status] = int(count)
+
+    return {
+        "since": hour_of(since),
+        "until": until,
+        "rules": [
+            {"rule_id": row_rule_id or None, **counts}
+            for row_rule_id, counts in sorted(rules.items())
+        ],
+    }
@@ -0,0 +1,12 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+from backend.services.metrics import CONTENT_TYPE, registry
+
+router = APIRouter(tags=["metrics"])
+
+@router.get("/metrics")
+async def read_metrics():
+    """
+    Process metrics in the Prometheus text exposition format.
+    """
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
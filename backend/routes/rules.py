@@ -1,10 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+import base64
+import json
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import tuple_
 from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from backend.config import settings
 from backend.database import get_session
 from backend.models import Rule, RuleCreate, RuleRead, RuleUpdate
-from backend.services.rule_engine import RuleEngine
-from pydantic import BaseModel
+from backend.services.backtest import Backtest, Message, iter_lines, message_record, ndjson, to_message
+from backend.services.regex_guard import validate_filters
+from backend.services.rule_io import BARE_ID_PREFIXES, CSV_COLUMNS, Record, csv_line, csv_row, iter_csv, iter_json_array, iter_ndjson
+from backend.services.rule_index import rule_index
+from backend.services.rule_events import rule_events
+from backend.services.rule_version import read_rule_version
+from pydantic import BaseModel, ValidationError
 
 router = APIRouter(prefix="/rules", tags=["rules"])
 
@@ -17,26 +30,169 @@ class RuleTestResponse(BaseModel):
     rule_id: int
     message_text: str
 
+class BacktestRequest(BaseModel):
+    rule_ids: List[int] = []
+    filters: List[dict] = [] # Ad-hoc LogicNode trees (or legacy filter dicts)
+    messages: List[Any] = [] # Strings or {"id": ..., "text": ...}
+    only_matches: bool = False # Leave messages that matched nothing out of the results
+
+def check_filters(filters) -> None:
+    """
+    Reject filters with invalid or backtracking-prone regex patterns before they are saved.
+    """
+    problems = validate_filters(filters)
+    if problems:
+        raise HTTPException(status_code=422, detail=problems)
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "json": "application/json", "csv": "text/csv"}
+
 @router.post("/", response_model=RuleRead)
 async def create_rule(
     rule: RuleCreate, 
     session: AsyncSession = Depends(get_session)
 ):
+    check_filters(rule.filters)
     db_rule = Rule.model_validate(rule)
     session.add(db_rule)
+    await session.flush()
+    await rule_events.publish(session, [db_rule.id])
     await session.commit()
     await session.refresh(db_rule)
+    rule_index.upsert(db_rule)
     return db_rule
 
 @router.get("/", response_model=list[RuleRead])
 async def read_rules(
+    request: Request,
+    response: Response,
+    source: Optional[str] = None,
+    destination: Optional[str] = None,
+    is_active: Optional[bool] = None,
+    name: Optional[str] = None,
+    order_by: str = "id",
+    cursor: Optional[str] = None,
     offset: int = 0,
-    limit: int = 100,
+    limit: int = Query(default=100, ge=1, le=1000),
     session: AsyncSession = Depends(get_session)
 ):
-    result = await session.execute(select(Rule).offset(offset).limit(limit))
+    """
+    Rules filtered by exact source/destination, active flag and a case-insensitive name
+    substring, ordered by id (ascending) or updated_at (most recently changed first).
+
+    Pages are keyset-based: when more rules follow, the X-Next-Cursor header holds the
+    value to pass back as ?cursor=. (offset still works for old clients but costs more
+    the deeper it goes.) The ETag is the rule-set version, so a poll with a matching
+    If-None-Match gets 304 Not Modified without the rules being read.
+    """
+    if order_by not in ("id", "updated_at"):
+        raise HTTPException(status_code=422, detail="order_by must be id or updated_at")
+
+    # Read the version before the rows: a change committed in between then yields a stale
+    # ETag and is fetched again on the next poll, never the other way round
+    etag = f'"rules-{await read_rule_version(session)}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    query = select(Rule)
+    if source is not None:
+        query = query.where(Rule.source == source)
+    if destination is not None:
+        query = query.where(Rule.destination == destination)
+    if is_active is not None:
+        query = query.where(Rule.is_active == is_active)
+    if name:
+        query = query.where(Rule.name.icontains(name, autoescape=True))
+
+    if order_by == "id":
+        if cursor is not None:
+            query = query.where(Rule.id > decode_rule_cursor(cursor, order_by))
+        query = query.order_by(Rule.id)
+    else:
+        if cursor is not None:
+            query = query.where(tuple_(Rule.updated_at, Rule.id) < decode_rule_cursor(cursor, order_by))
+        query = query.order_by(Rule.updated_at.desc(), Rule.id.desc())
+    if cursor is None and offset:
+        query = query.offset(offset)
+
+    result = await session.execute(query.limit(limit + 1))
     rules = result.scalars().all()
-    return rules
+    if len(rules) > limit:
+        headers["X-Next-Cursor"] = encode_rule_cursor(rules[limit - 1], order_by)
+    response.headers.update(headers)
+    return rules[:limit]
+
+def encode_rule_cursor(rule: Rule, order_by: str) -> str:
+    raw = str(rule.id) if order_by == "id" else f"{rule.updated_at.isoformat()}|{rule.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_rule_cursor(cursor: str, order_by: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        if order_by == "id":
+            return int(raw)
+        updated_at, rule_id = raw.split("|")
+        return datetime.fromisoformat(updated_at), int(rule_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison (RFC 9110): a W/ prefix does not matter for If-None-Match
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+@router.get("/export")
+async def export_rules(
+    format: str = "ndjson",
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Stream every rule as NDJSON, a JSON array or CSV, reading them in id order one chunk
+    at a time. The output can be fed back to POST /rules/import.
+    """
+    if format not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(EXPORT_MEDIA_TYPES)}")
+
+    async def rules() -> AsyncIterator[Rule]:
+        last_id = 0
+        while True:
+            result = await session.execute(
+                select(Rule).where(Rule.id > last_id).order_by(Rule.id).limit(settings.RULE_IMPORT_CHUNK_SIZE)
+            )
+            chunk = result.scalars().all()
+            if not chunk:
+                return
+            for rule in chunk:
+                yield rule
+            last_id = chunk[-1].id
+            session.expunge_all()
+
+    async def body():
+        if format == "csv":
+            yield csv_line(CSV_COLUMNS)
+        elif format == "json":
+            yield b"["
+        first = True
+        async for rule in rules():
+            if format == "csv":
+                yield csv_row(rule)
+                continue
+            record = RuleRead.model_validate(rule).model_dump_json().encode()
+            if format == "json":
+                yield record if first else b"," + record
+            else:
+                yield record + b"\n"
+            first = False
+        if format == "json":
+            yield b"]"
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="rules.{format}"'},
+    )
 
 @router.get("/{rule_id}", response_model=RuleRead)
 async def read_rule(
@@ -61,12 +217,20 @@ async def update_rule(
         raise HTTPException(status_code=404, detail="Rule not found")
     
     rule_data = rule_update.model_dump(exclude_unset=True)
+    if "filters" in rule_data:
+        check_filters(rule_data["filters"])
+    if rule_data.get("is_active"):
+        db_rule.disabled_reason = None
     for key, value in rule_data.items():
         setattr(db_rule, key, value)
+    # Bump the version so compiled evaluators keyed on (id, updated_at) are rebuilt
+    db_rule.updated_at = datetime.utcnow()
     
     session.add(db_rule)
+    await rule_events.publish(session, [rule_id])
     await session.commit()
     await session.refresh(db_rule)
+    rule_index.upsert(db_rule)
     return db_rule
 
 @router.delete("/{rule_id}")
@@ -80,7 +244,9 @@ async def delete_rule(
         raise HTTPException(status_code=404, detail="Rule not found")
     
     await session.delete(rule)
+    await rule_events.publish(session, [rule_id])
     await session.commit()
+    rule_index.remove(rule_id)
     return {"ok": True}
 
 @router.post("/test", response_model=RuleTestResponse)
@@ -93,9 +259,236 @@ async def test_rule(
     if not rule:
         raise HTTPException(status_code=404, detail="Rule not found")
     
-    matches = RuleEngine.evaluate_logic_node(rule.filters, request.message_text)
+    # Evaluate with the same compiled form the message handler uses
+    matches = rule_index.compiled_for(rule).matches(request.message_text)
     return RuleTestResponse(
         matches=matches,
         rule_id=request.rule_id,
         message_text=request.message_text
     )
+
+@router.post("/backtest")
+async def backtest_rules(
+    request: Request,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Evaluate saved rules and/or ad-hoc filter trees against a corpus of messages.
+
+    The body is either a JSON BacktestRequest, or NDJSON (application/x-ndjson) whose
+    first line is a BacktestRequest and every further line one message. The response is
+    NDJSON: one {"type": "message"} record per message with the keys of the rules it
+    matched ("rule:<id>" / "filter:<position>"), then a {"type": "summary"} record with
+    hits and evaluation time per rule. Evaluation runs in a worker thread, batch by batch.
+    """
+    spec, messages = await _read_backtest(request)
+    if not spec.rule_ids and not spec.filters:
+        raise HTTPException(status_code=422, detail="Provide rule_ids and/or filters")
+    for node in spec.filters:
+        check_filters(node)
+
+    rules: List[Rule] = []
+    if spec.rule_ids:
+        result = await session.execute(select(Rule).where(Rule.id.in_(spec.rule_ids)))
+        found = {rule.id: rule for rule in result.scalars().all()}
+        missing = [rule_id for rule_id in spec.rule_ids if rule_id not in found]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Rules not found: {missing}")
+        rules = [found[rule_id] for rule_id in dict.fromkeys(spec.rule_ids)]
+
+    backtest = Backtest.from_rules(rules, spec.filters)
+
+    async def results():
+        for start in range(0, len(messages), settings.BACKTEST_BATCH_SIZE):
+            batch = messages[start:start + settings.BACKTEST_BATCH_SIZE]
+            matched = await run_in_threadpool(backtest.evaluate_batch, batch)
+            yield b"".join(
+                ndjson(message_record(message, matches))
+                for message, matches in zip(batch, matched)
+                if matches or not spec.only_matches
+            )
+        yield ndjson(backtest.summary())
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+async def _read_backtest(request: Request) -> "tuple[BacktestRequest, List[Message]]":
+    # The whole corpus is read before responding: servers only promise the request body
+    # until the response starts, and NDJSON lines are parsed as they arrive
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            spec = None
+            messages: List[Message] = []
+            line_number = 0
+            async for line in iter_lines(request.stream()):
+                line_number += 1
+                if not line.strip():
+                    continue
+                if spec is None:
+                    spec = BacktestRequest.model_validate_json(line)
+                    messages = [to_message(i, item) for i, item in enumerate(spec.messages)]
+                    continue
+                try:
+                    messages.append(to_message(len(messages), json.loads(line)))
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=f"Line {line_number}: {e}")
+                if len(messages) > settings.BACKTEST_MAX_MESSAGES:
+                    break
+            if spec is None:
+                raise HTTPException(status_code=422, detail="Missing backtest header line")
+        else:
+            spec = BacktestRequest.model_validate_json(await request.body())
+            messages = [to_message(i, item) for i, item in enumerate(spec.messages)]
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=json.loads(e.json()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if len(messages) > settings.BACKTEST_MAX_MESSAGES:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BACKTEST_MAX_MESSAGES} messages per backtest")
+    return spec, messages
+
+@router.post("/import")
+async def import_rules(
+    request: Request,
+    layout: str = "rules",
+    bare_ids: str = "channel",
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Create or update rules in bulk from a JSON array, NDJSON or CSV body (chosen by
+    Content-Type), parsed as it streams in and written RULE_IMPORT_CHUNK_SIZE rules per
+    transaction. Records with an id update that rule; records without one create a rule,
+    as do records whose id no longer exists (e.g. an export imported into another
+    database). Those get a new id, listed under "renumbered" with the record's row.
+    CSV bodies from the old Google Sheet setup are read with ?layout=legacy_sheet; its
+    unmarked source ids are taken as channels unless ?bare_ids=chat or ?bare_ids=user.
+
+    Invalid records are skipped and reported by their position in the payload; the rule
+    index is refreshed once per chunk.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        if layout not in ("rules", "legacy_sheet"):
+            raise HTTPException(status_code=422, detail="layout must be rules or legacy_sheet")
+        if bare_ids not in BARE_ID_PREFIXES:
+            raise HTTPException(status_code=422, detail="bare_ids must be channel, chat or user")
+        records = iter_csv(request.stream(), layout, bare_ids)
+    elif "ndjson" in content_type:
+        records = iter_ndjson(request.stream())
+    else:
+        records = iter_json_array(request.stream())
+
+    summary: Dict[str, Any] = {"created": 0, "updated": 0, "failed": 0, "errors": [], "renumbered": []}
+    chunk: List[Record] = []
+    try:
+        async for record in records:
+            chunk.append(record)
+            if len(chunk) >= settings.RULE_IMPORT_CHUNK_SIZE:
+                await _import_chunk(session, chunk, summary)
+                chunk = []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if chunk:
+        await _import_chunk(session, chunk, summary)
+    return summary
+
+def _import_error(summary: Dict[str, Any], position: int, error: Any) -> None:
+    summary["failed"] += 1
+    if len(summary["errors"]) < settings.RULE_IMPORT_MAX_ERRORS:
+        summary["errors"].append({"row": position, "error": error})
+
+async def _import_chunk(session: AsyncSession, chunk: List[Record], summary: Dict[str, Any]) -> None:
+    creates: List[tuple] = []
+    updates: List[tuple] = []
+    for position, record, error in chunk:
+        if error is not None:
+            _import_error(summary, position, error)
+            continue
+        record = dict(record)
+        rule_id = record.pop("id", None)
+        # Validation ignores unknown keys, so a misspelt field would be dropped silently;
+        # read-only fields of exported rules are accepted and ignored
+        model = RuleCreate if rule_id in (None, "") else RuleUpdate
+        unknown = sorted(set(record) - set(model.model_fields) - set(RuleRead.model_fields))
+        if unknown:
+            _import_error(summary, position, f"Unknown fields: {', '.join(unknown)}")
+            continue
+        try:
+            if rule_id in (None, ""):
+                parsed = RuleCreate.model_validate(record)
+                problems = validate_filters(parsed.filters)
+                target = creates
+            else:
+                rule_id = int(rule_id)
+                parsed = RuleUpdate.model_validate(record)
+                problems = validate_filters(parsed.filters) if "filters" in parsed.model_fields_set else []
+                target = updates
+        except ValidationError as e:
+            _import_error(summary, position, json.loads(e.json(include_url=False)))
+            continue
+        except (TypeError, ValueError):
+            _import_error(summary, position, f"Invalid rule id: {rule_id!r}")
+            continue
+        if problems:
+            _import_error(summary, position, problems)
+            continue
+        target.append((position, rule_id, parsed))
+
+    existing: Dict[int, Rule] = {}
+    if updates:
+        result = await session.execute(select(Rule).where(Rule.id.in_({rule_id for _, rule_id, _ in updates})))
+        existing = {rule.id: rule for rule in result.scalars().all()}
+
+    # Ids without a rule are upserted as new rules, which needs a complete record
+    renumbered: List[tuple] = []
+    for position, rule_id, parsed in updates:
+        if rule_id in existing:
+            continue
+        try:
+            creates.append((position, rule_id, RuleCreate.model_validate(parsed.model_dump(exclude_unset=True))))
+        except ValidationError as e:
+            _import_error(summary, position, json.loads(e.json(include_url=False)))
+
+    changed: List[Rule] = []
+    written: List[int] = []
+    for position, rule_id, parsed in creates:
+        rule = Rule.model_validate(parsed)
+        session.add(rule)
+        changed.append(rule)
+        written.append(position)
+        if rule_id is not None:
+            renumbered.append((position, rule_id, rule))
+    updated = 0
+    now = datetime.utcnow()
+    for position, rule_id, parsed in updates:
+        rule = existing.get(rule_id)
+        if rule is None:
+            continue
+        data = parsed.model_dump(exclude_unset=True)
+        if data.get("is_active"):
+            rule.disabled_reason = None
+        for key, value in data.items():
+            setattr(rule, key, value)
+        rule.updated_at = now
+        changed.append(rule)
+        written.append(position)
+        updated += 1
+
+    if not changed:
+        return
+    try:
+        await session.flush()
+        await rule_events.publish(session, [rule.id for rule in changed])
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        for position in written:
+            _import_error(summary, position, f"Chunk could not be written: {e}")
+        return
+
+    summary["created"] += len(creates)
+    summary["updated"] += updated
+    summary["renumbered"] += [{"row": position, "id": rule_id, "new_id": rule.id} for position, rule_id, rule in renumbered]
+    rule_index.upsert_many(changed)
+    # Keep the identity map from growing with the size of the import
+    session.expunge_all()
@@ -0,0 +1,62 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from backend.config import settings
+from backend.telegram.media import media_identity
+
+_WHITESPACE = re.compile(r"\s+")
+
+def content_key(message: Any, text: str) -> Optional[bytes]:
+    """
+    Digest of a message's normalized text and media identity, or None when it has neither.
+
+    Text is case-folded with whitespace collapsed, so reposts differing only in spacing or
+    case count as the same; media is identified by Telegram's photo/document id, which
+    stays the same when a file is forwarded or reposted.
+    """
+    normalized = _WHITESPACE.sub(" ", text).strip().casefold()
+    identity = media_identity(message)
+    if not normalized and identity is None:
+        return None
+    media = "{}:{}".format(*identity) if identity else ""
+    return hashlib.blake2b(f"{media}\0{normalized}".encode(), digest_size=16).digest()
+
+class DedupeCache:
+    """
+    Recently delivered content per destination, bounded to max_entries (least recently
+    delivered first out).
+
+    The window is chosen per check, so rules with different windows can share one cache;
+    an entry older than the window of the current check does not count as a duplicate.
+    """
+
+    def __init__(self, max_entries: int = settings.DEDUPE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[Tuple[str, bytes], float]" = OrderedDict()
+        self.suppressed = 0
+
+    def check(self, destination: str, key: bytes, window: float) -> bool:
+        """
+        True if the same content went to this destination within the last `window` seconds;
+        otherwise remember it as delivered now and return False.
+        """
+        now = time.monotonic()
+        entry = (destination, key)
+        delivered_at = self._seen.get(entry)
+        if delivered_at is not None and now - delivered_at < window:
+            # The window runs from the first delivery, so steady reposting cannot extend it forever
+            self.suppressed += 1
+            return True
+
+        self._seen[entry] = now
+        self._seen.move_to_end(entry)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        return False
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+dedupe_cache = DedupeCache()
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, func, insert
+from sqlmodel import select
+from backend.config import settings
+from backend.database import get_session
+from backend.models import Log, LogRollup
+from backend.services.log_rollup import hour_of
+
+logger = logging.getLogger(__name__)
+
+class LogRetention:
+    """
+    Drops raw Log rows older than the retention period, one hour-sized chunk at a time.
+
+    Each chunk is compacted first: its LogRollup counts are recomputed from the raw rows
+    (covering rows written before rollups were maintained) in the same transaction that
+    deletes them, so stats for expired hours stay available.
+    """
+
+    def __init__(
+        self,
+        retention_days: float = settings.LOG_RETENTION_DAYS,
+        interval: float = settings.LOG_RETENTION_INTERVAL,
+        max_chunks: int = settings.LOG_RETENTION_MAX_CHUNKS,
+    ):
+        self.retention_days = retention_days
+        self.interval = interval
+        self.max_chunks = max_chunks
+        self._task: Optional[asyncio.Task] = None
+
+        self.deleted = 0
+
+    async def start(self) -> None:
+        if self._task is not None or self.retention_days <= 0:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Log retention started ({self.retention_days} days).")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run_once(self, now: Optional[datetime] = None) -> int:
+        """
+        Compact and delete up to max_chunks expired hours, oldest first. Returns the rows deleted.
+        """
+        cutoff = hour_of((now or datetime.utcnow()) - timedelta(days=self.retention_days))
+        deleted = 0
+        for _ in range(self.max_chunks):
+            async for session in get_session():
+                result = await session.execute(select(func.min(Log.timestamp)))
+                oldest = result.scalar()
+                break
+            if oldest is None or oldest >= cutoff:
+                break
+            deleted += await self.compact_hour(hour_of(oldest))
+        self.deleted += deleted
+        return deleted
+
+    async def compact_hour(self, hour: datetime) -> int:
+        end = hour + timedelta(hours=1)
+        in_hour = (Log.timestamp >= hour, Log.timestamp < end)
+        async for session in get_session():
+            result = await session.execute(
+                select(Log.rule_id, Log.status, func.count(Log.id)).where(*in_hour).group_by(Log.rule_id, Log.status)
+            )
+            counts = {}
+            for rule_id, status, count in result.all():
+                key = (rule_id or 0, status)
+                counts[key] = counts.get(key, 0) + count
+
+            await session.execute(delete(LogRollup).where(LogRollup.hour == hour))
+            if counts:
+                await session.execute(insert(LogRollup), [
+                    {"hour": hour, "rule_id": rule_id, "status": status, "count": count}
+                    for (rule_id, status), count in counts.items()
+                ])
+            result = await session.execute(delete(Log).where(*in_hour))
+            await session.commit()
+            logger.info(f"Compacted and deleted {result.rowcount} log rows for {hour.isoformat()}.")
+            return result.rowcount
+        return 0
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Error applying log retention: {e}")
+            await asyncio.sleep(self.interval)
+
+log_retention = LogRetention()
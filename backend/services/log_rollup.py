@@ -0,0 +1,49 @@
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterable, Tuple
+from sqlalchemy.dialects import postgresql, sqlite
+from backend.models import LogRollup
+
+# (hour, rule_id, status)
+RollupKey = Tuple[datetime, int, str]
+
+def hour_of(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def rollup_counts(records: Iterable[Dict[str, Any]]) -> Dict[RollupKey, int]:
+    """
+    Count Log records (as inserted by the log sink) per hour, rule and status.
+    """
+    return dict(Counter(
+        (hour_of(record["timestamp"]), record["rule_id"] or 0, record["status"])
+        for record in records
+    ))
+
+_upserts: Dict[str, Any] = {}
+
+def _upsert(dialect: str):
+    # One statement per dialect, executed with a parameter list: it is compiled once and,
+    # on asyncpg, prepared once per connection however many rows a batch has
+    stmt = _upserts.get(dialect)
+    if stmt is None:
+        table = LogRollup.__table__
+        stmt = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table)
+        stmt = _upserts[dialect] = stmt.on_conflict_do_update(
+            index_elements=["hour", "rule_id", "status"],
+            set_={"count": table.c.count + stmt.excluded.count},
+        )
+    return stmt
+
+async def add_rollups(session, counts: Dict[RollupKey, int]) -> None:
+    """
+    Add counts to the rollup table. Does not commit.
+
+    Several processes write logs, so the increment happens in the database
+    (ON CONFLICT ... count = count + excluded.count) rather than read-modify-write.
+    """
+    if not counts:
+        return
+    await session.execute(_upsert(session.bind.dialect.name), [
+        {"hour": hour, "rule_id": rule_id, "status": status, "count": count}
+        for (hour, rule_id, status), count in counts.items()
+    ])
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+from sqlalchemy import insert
+from backend.config import settings
+from backend.database import get_session
+from backend.models import Log
+from backend.services.log_rollup import add_rollups, rollup_counts
+from backend.services.metrics import registry, stage_seconds
+
+logger = logging.getLogger(__name__)
+
+_log_commit_seconds = stage_seconds.labels("log_commit")
+
+class LogSink:
+    """
+    Bounded in-memory buffer of delivery Log records, written in batches by a background task.
+
+    The message handler only appends to the buffer; rows are inserted with one multi-row
+    INSERT per batch when the batch fills up or the flush interval elapses; the hourly
+    LogRollup counts are updated in the same transaction.
+    When the buffer is full, new records are either dropped or the caller waits for
+    the next flush, depending on LOG_BUFFER_FULL_POLICY.
+    """
+
+    def __init__(
+        self,
+        max_size: int = settings.LOG_BUFFER_SIZE,
+        batch_size: int = settings.LOG_BATCH_SIZE,
+        flush_interval: float = settings.LOG_FLUSH_INTERVAL,
+        full_policy: str = settings.LOG_BUFFER_FULL_POLICY,
+    ):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.block_on_full = full_policy == "block"
+
+        self._buffer: Deque[Dict[str, Any]] = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._stopping = False
+
+        self.dropped = 0
+        self.written = 0
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._task = asyncio.create_task(self._run())
+        logger.info("Log sink started.")
+
+    async def stop(self) -> None:
+        """
+        Stop the background task and write everything still buffered.
+        """
+        if self._task is not None:
+            # Let the loop finish its current flush instead of cancelling it mid-write,
+            # which would lose the batch it already took from the buffer
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+
+        await self.flush()
+        if self.dropped:
+            logger.warning(f"Log sink dropped {self.dropped} records because the buffer was full.")
+        logger.info("Log sink stopped.")
+
+    async def record(
+        self,
+        rule_id: Optional[int],
+        source_message_id: int,
+        status: str,
+        details: Optional[str] = None,
+    ) -> None:
+        """
+        Buffer one Log row. The timestamp is taken now, not at flush time.
+        """
+        if len(self._buffer) >= self.max_size:
+            if not (self.block_on_full and self._task is not None):
+                self.dropped += 1
+                return
+            while len(self._buffer) >= self.max_size:
+                self._space.clear()
+                self._wakeup.set()
+                await self._space.wait()
+
+        self._buffer.append({
+            "rule_id": rule_id,
+            "source_message_id": source_message_id,
+            "status": status,
+            "details": details,
+            "timestamp": datetime.utcnow(),
+        })
+        if len(self._buffer) >= self.batch_size and self._wakeup is not None:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    async def flush(self) -> int:
+        """
+        Write all currently buffered records. Returns the number of rows written.
+        """
+        if self._flush_lock is None:
+            return await self._flush()
+        async with self._flush_lock:
+            return await self._flush()
+
+    async def _flush(self) -> int:
+        written = 0
+        while self._buffer:
+            batch: List[Dict[str, Any]] = []
+            while self._buffer and len(batch) < self.batch_size:
+                batch.append(self._buffer.popleft())
+            if self._space is not None:
+                self._space.set()
+
+            try:
+                started = time.perf_counter()
+                async for session in get_session():
+                    await session.execute(insert(Log), batch)
+                    await add_rollups(session, rollup_counts(batch))
+                    await session.commit()
+                    break
+                _log_commit_seconds.observe(time.perf_counter() - started)
+            except Exception as e:
+                logger.error(f"Failed to write {len(batch)} log records: {e}")
+                # Put the batch back for the next attempt if there is room, oldest first
+                room = self.max_size - len(self._buffer)
+                requeue = batch[:room] if room > 0 else []
+                self._buffer.extendleft(reversed(requeue))
+                self.dropped += len(batch) - len(requeue)
+                break
+
+            written += len(batch)
+        self.written += written
+        return written
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._stopping:
+                break
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error inside log sink: {e}")
+
+log_sink = LogSink()
+
+registry.gauge(
+    "tgforwarder_log_buffer_records", "Delivery log records buffered by the log sink",
+    callback=lambda: {(): log_sink.pending()},
+)
+registry.counter(
+    "tgforwarder_log_records_total", "Delivery log records written or dropped by the log sink", ("outcome",),
+    callback=lambda: {("written",): log_sink.written, ("dropped",): log_sink.dropped},
+)
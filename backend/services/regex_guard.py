@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy import update
+from backend.config import settings
+from backend.database import get_session
+from backend.models import Rule
+from backend.services.rule_events import rule_events
+
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_constants
+
+logger = logging.getLogger(__name__)
+
+_REPEATS = {sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT}
+_BACKREFERENCES = {sre_constants.GROUPREF, sre_constants.GROUPREF_EXISTS}
+_ZERO_WIDTH = {sre_constants.AT, sre_constants.ASSERT, sre_constants.ASSERT_NOT}
+
+# Characters alternatives are compared on: ASCII and Latin-1 plus a few samples of other
+# scripts, digits and spaces, enough to tell whether two branches can start alike
+_SAMPLE = frozenset(range(0x180)) | {ord(c) for c in "\u00a0\u0410\u05d0\u0660\u2028\u3000\u4e00"}
+_CATEGORIES = {
+    sre_constants.CATEGORY_DIGIT: r"\d", sre_constants.CATEGORY_NOT_DIGIT: r"\D",
+    sre_constants.CATEGORY_SPACE: r"\s", sre_constants.CATEGORY_NOT_SPACE: r"\S",
+    sre_constants.CATEGORY_WORD: r"\w", sre_constants.CATEGORY_NOT_WORD: r"\W",
+}
+_CATEGORY_CHARS = {
+    category: frozenset(c for c in _SAMPLE if re.match(expression, chr(c)))
+    for category, expression in _CATEGORIES.items()
+}
+
+def check_pattern(pattern: Any) -> Optional[str]:
+    """
+    Reason a user-supplied pattern is rejected, or None if it is acceptable.
+
+    Besides syntax errors this rejects the constructs behind catastrophic backtracking
+    in Python's engine: a repeated group that itself contains an unbounded repeat
+    (e.g. `(a+)+`, `(\\w+\\s?)*`), an unbounded repeat over alternatives that can start
+    with the same character (e.g. `(a|a)*`, `(a|ab)+`) and backreferences.
+    """
+    if not isinstance(pattern, str):
+        return "Regex pattern must be a string"
+    if len(pattern) > settings.REGEX_MAX_LENGTH:
+        return f"Regex pattern is longer than {settings.REGEX_MAX_LENGTH} characters"
+    try:
+        re.compile(pattern)
+        parsed = sre_parse.parse(pattern)
+    except re.error as e:
+        return f"Invalid regex pattern {pattern!r}: {e}"
+    problem = _check_subpattern(parsed, inside_repeat=False)
+    if problem:
+        return f"Regex pattern {pattern!r} rejected: {problem}"
+    return None
+
+def _check_subpattern(subpattern, inside_repeat: bool) -> Optional[str]:
+    for op, av in subpattern:
+        if op in _REPEATS:
+            low, high, item = av
+            unbounded = high == sre_constants.MAXREPEAT
+            if unbounded and inside_repeat:
+                return "nested quantifiers can take exponential time"
+            problem = _check_subpattern(item, inside_repeat or high > 1)
+            if not problem and unbounded and _overlapping_branches(item, item):
+                problem = "overlapping alternatives under a quantifier can take exponential time"
+        elif op in _BACKREFERENCES:
+            return "backreferences are not allowed"
+        elif op == sre_constants.SUBPATTERN:
+            problem = _check_subpattern(av[-1], inside_repeat)
+        elif op == sre_constants.BRANCH:
+            problem = next(filter(None, (_check_subpattern(branch, inside_repeat) for branch in av[1])), None)
+        elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+            problem = _check_subpattern(av[1], inside_repeat)
+        else:
+            problem = None
+        if problem:
+            return problem
+    return None
+
+def _first(subpattern) -> Tuple[Set[int], bool]:
+    """
+    Characters (of _SAMPLE) a match of the subpattern can start with, and whether it can
+    match the empty string.
+    """
+    first: Set[int] = set()
+    for op, av in subpattern:
+        chars, nullable = _first_of(op, av)
+        first |= chars
+        if not nullable:
+            return first, False
+    return first, True
+
+def _first_of(op, av) -> Tuple[Set[int], bool]:
+    if op == sre_constants.LITERAL:
+        return {av}, False
+    if op == sre_constants.NOT_LITERAL:
+        return set(_SAMPLE - {av}), False
+    if op == sre_constants.IN:
+        return _class_chars(av), False
+    if op == sre_constants.SUBPATTERN:
+        return _first(av[-1])
+    if op == sre_constants.BRANCH:
+        firsts = [_first(branch) for branch in av[1]]
+        return set().union(*(chars for chars, _ in firsts)), any(nullable for _, nullable in firsts)
+    if op in _REPEATS:
+        chars, nullable = _first(av[2])
+        return chars, nullable or av[0] == 0
+    if op in _ZERO_WIDTH:
+        return set(), True
+    return set(_SAMPLE), False
+
+def _class_chars(items) -> Set[int]:
+    chars: Set[int] = set()
+    negate = False
+    for op, av in items:
+        if op == sre_constants.NEGATE:
+            negate = True
+        elif op == sre_constants.LITERAL:
+            chars.add(av)
+        elif op == sre_constants.RANGE:
+            chars |= {c for c in _SAMPLE if av[0] <= c <= av[1]}
+        else:
+            chars |= _CATEGORY_CHARS.get(av, _SAMPLE)
+    return set(_SAMPLE - chars) if negate else chars
+
+def _overlapping_branches(subpattern, repeated) -> bool:
+    """
+    Whether two alternatives inside a repeated item can start with the same character.
+    An alternative that can match nothing starts with whatever follows it, including the
+    next repetition: in `(a|aa)+` the empty branch left after factoring out the common
+    "a" overlaps the "a" one.
+    """
+    for i, (op, av) in enumerate(subpattern):
+        if op == sre_constants.BRANCH:
+            follow, tail_nullable = _first(subpattern[i + 1:])
+            if tail_nullable:
+                follow |= _first(repeated)[0]
+            seen: Set[int] = set()
+            for branch in av[1]:
+                chars, nullable = _first(branch)
+                if nullable:
+                    chars |= follow
+                if chars & seen:
+                    return True
+                seen |= chars
+            children = av[1]
+        elif op == sre_constants.SUBPATTERN:
+            children = [av[-1]]
+        elif op in _REPEATS:
+            children = [av[2]]
+        else:
+            children = []
+        if any(_overlapping_branches(child, repeated) for child in children):
+            return True
+    return False
+
+def filter_patterns(node: Any) -> List[Any]:
+    """
+    Every regex pattern in a LogicNode tree or legacy filter dict.
+    """
+    if not isinstance(node, dict) or not node:
+        return []
+    if "type" not in node:
+        return [node["regex"]] if node.get("regex") else []
+    if node.get("type") == "group":
+        return [p for child in node.get("children") or [] for p in filter_patterns(child)]
+    if node.get("type") == "condition" and node.get("condition") == "regex":
+        return [node.get("value", "")]
+    return []
+
+def validate_filters(filters: Optional[Dict[str, Any]]) -> List[str]:
+    """
+    Problems with the regex patterns of a rule's filters; empty when they are all acceptable.
+    """
+    return [problem for problem in map(check_pattern, filter_patterns(filters)) if problem]
+
+class RegexGuard:
+    """
+    Tracks rules whose regex evaluation exceeded the per-message time budget and disables
+    a rule once it has done so max_strikes times, so one bad pattern cannot keep stalling
+    the event loop that serves every chat.
+
+    Disabling sets is_active to False with a disabled_reason in the database, then calls
+    the listeners (the rule index drops the rule from memory right away).
+    """
+
+    def __init__(self, budget: float = settings.REGEX_TIME_BUDGET, max_strikes: int = settings.REGEX_MAX_STRIKES):
+        self.budget = budget
+        self.max_strikes = max_strikes
+        self.strikes: Dict[int, int] = {}
+        self._disabling: Set[int] = set()
+        self._listeners: List[Callable[[int], None]] = []
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add_listener(self, listener: Callable[[int], None]) -> None:
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def strike(self, rule: Rule, elapsed: float) -> None:
+        if rule.id is None or rule.id in self._disabling:
+            return
+        count = self.strikes[rule.id] = self.strikes.get(rule.id, 0) + 1
+        logger.warning(
+            f"Rule {rule.id} took {elapsed * 1000:.1f}ms to evaluate its regex "
+            f"(budget {self.budget * 1000:.0f}ms, strike {count}/{self.max_strikes})."
+        )
+        if count < self.max_strikes:
+            return
+        self._disabling.add(rule.id)
+        reason = f"Disabled automatically: regex evaluation exceeded {self.budget * 1000:.0f}ms {count} times"
+        try:
+            task = asyncio.get_running_loop().create_task(self.disable(rule.id, reason))
+        except RuntimeError:
+            # Not on the event loop (e.g. a backtest thread): nothing to disable from here
+            self._disabling.discard(rule.id)
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def disable(self, rule_id: int, reason: str) -> None:
+        try:
+            async for session in get_session():
+                await session.execute(
+                    update(Rule).where(Rule.id == rule_id)
+                    .values(is_active=False, disabled_reason=reason, updated_at=datetime.utcnow())
+                )
+                await rule_events.publish(session, [rule_id])
+                await session.commit()
+                break
+            logger.error(f"Rule {rule_id}: {reason}")
+        except Exception as e:
+            logger.error(f"Failed to disable rule {rule_id}: {e}")
+        finally:
+            self.strikes.pop(rule_id, None)
+            self._disabling.discard(rule_id)
+        for listener in self._listeners:
+            try:
+                listener(rule_id)
+            except Exception as e:
+                logger.error(f"Error in regex guard listener: {e}")
+
+regex_guard = RegexGuard()
@@ -1,12 +1,221 @@
 import re
 import logging
-from typing import List, Optional, Dict, Any
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Dict, Any, Callable, Tuple, Iterable, Set, FrozenSet
 from sqlmodel import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from backend.models import Rule
+from backend.services.regex_guard import regex_guard
 
 logger = logging.getLogger(__name__)
 
+_EMPTY: FrozenSet[str] = frozenset()
+
+# Rules sharing a pattern share its compiled form; new patterns are validated by the rules routes
+compile_pattern = lru_cache(maxsize=4096)(re.compile)
+
+class MessageContext:
+    """
+    Per-message view of the text shared by every compiled rule evaluated against it,
+    so normalisation and literal scanning happen once per message rather than once per condition.
+
+    `hits` holds every literal found anywhere in the lowercased text, `prefixes` and
+    `suffixes` the literals found at its start and end.
+    """
+    __slots__ = ("text", "lower", "hits", "prefixes", "suffixes")
+
+    def __init__(self, text: Optional[str]):
+        self.text = str(text) if text is not None else ""
+        self.lower = self.text.lower()
+        self.hits = _EMPTY
+        self.prefixes = _EMPTY
+        self.suffixes = _EMPTY
+
+Evaluator = Callable[[MessageContext], bool]
+
+def _always(ctx: MessageContext) -> bool:
+    return True
+
+def _never(ctx: MessageContext) -> bool:
+    return False
+
+class Literals:
+    """
+    Lowercased literals a compiled filter looks up in the MessageContext hit sets,
+    and whether it also runs regular expressions.
+    """
+    __slots__ = ("contains", "prefixes", "suffixes", "regex")
+
+    def __init__(self):
+        self.contains: Set[str] = set()
+        self.prefixes: Set[str] = set()
+        self.suffixes: Set[str] = set()
+        self.regex = False
+
+    def update(self, other: "Literals") -> None:
+        self.contains |= other.contains
+        self.prefixes |= other.prefixes
+        self.suffixes |= other.suffixes
+        self.regex = self.regex or other.regex
+
+class _Automaton:
+    """
+    Aho-Corasick automaton: finds every literal occurring in a text in a single pass.
+    """
+    __slots__ = ("_goto", "_fail", "_out")
+
+    def __init__(self, literals: Iterable[str]):
+        goto: List[Dict[str, int]] = [{}]
+        out: List[Tuple[str, ...]] = [()]
+        for literal in literals:
+            state = 0
+            for ch in literal:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto.append({})
+                    out.append(())
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state] = out[state] + (literal,)
+
+        # Breadth-first pass to link each state to its longest proper suffix in the trie
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0) if state else 0
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def scan(self, text: str) -> Tuple[Set[str], Set[str], Set[str]]:
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+
+        hits: Set[str] = set()
+        prefixes: Set[str] = set()
+        state = 0
+        for i, ch in enumerate(text):
+            nxt = goto[state].get(ch)
+            while nxt is None and state:
+                state = fail[state]
+                nxt = goto[state].get(ch)
+            state = nxt if nxt is not None else 0
+            found = out[state]
+            if found:
+                hits.update(found)
+                for literal in found:
+                    if len(literal) == i + 1:
+                        prefixes.add(literal)
+
+        # Literals ending at the last position are exactly the outputs of the final state
+        return hits, prefixes, set(out[state])
+
+class LiteralMatcher:
+    """
+    Resolves all literals of one or more compiled rules against a message in one scan.
+
+    Small literal sets are checked directly with `in`/startswith/endswith, which is cheaper
+    than walking the automaton in Python; larger sets are merged into one Aho-Corasick
+    automaton so the cost is linear in text length regardless of the keyword count.
+    """
+    __slots__ = ("_contains", "_prefixes", "_suffixes", "_automaton")
+
+    DIRECT_SCAN_LIMIT = 256
+
+    def __init__(self, literals: Literals):
+        self._contains = tuple(literals.contains)
+        self._prefixes = tuple(literals.prefixes)
+        self._suffixes = tuple(literals.suffixes)
+        all_literals = literals.contains | literals.prefixes | literals.suffixes
+        self._automaton = _Automaton(all_literals) if len(all_literals) > self.DIRECT_SCAN_LIMIT else None
+
+    def context(self, text: Optional[str]) -> MessageContext:
+        ctx = MessageContext(text)
+        lower = ctx.lower
+        if self._automaton is not None:
+            ctx.hits, ctx.prefixes, ctx.suffixes = self._automaton.scan(lower)
+        else:
+            if self._contains:
+                ctx.hits = {literal for literal in self._contains if literal in lower}
+            if self._prefixes:
+                ctx.prefixes = {literal for literal in self._prefixes if lower.startswith(literal)}
+            if self._suffixes:
+                ctx.suffixes = {literal for literal in self._suffixes if lower.endswith(literal)}
+        return ctx
+
+class CompiledRule:
+    """
+    A rule together with its precompiled filter evaluator.
+    The evaluator is built once per rule version (id, updated_at) and reused for every message.
+    """
+    __slots__ = ("rule", "version", "evaluate", "literals", "_matcher")
+
+    def __init__(self, rule: Rule, evaluate: Evaluator, literals: Literals):
+        self.rule = rule
+        self.version = RuleEngine.rule_version(rule)
+        self.evaluate = evaluate
+        self.literals = literals
+        self._matcher: Optional[LiteralMatcher] = None
+
+    def matches(self, text: Optional[str]) -> bool:
+        if self._matcher is None:
+            self._matcher = LiteralMatcher(self.literals)
+        return self.evaluate(self._matcher.context(text))
+
+class CompiledRuleSet:
+    """
+    All compiled rules of one source chat sharing a single literal matcher.
+
+    Rules using regexes are timed: once they have spent the regex guard's budget on a
+    message, the remaining ones are skipped for it (fail closed), and a rule going over
+    the budget on its own gets a strike towards being disabled.
+    """
+    __slots__ = ("rules", "_matcher")
+
+    def __init__(self, rules: Tuple[CompiledRule, ...]):
+        self.rules = rules
+        literals = Literals()
+        for compiled in rules:
+            literals.update(compiled.literals)
+        self._matcher = LiteralMatcher(literals)
+
+    def match(self, text: Optional[str]) -> List[Rule]:
+        ctx = self._matcher.context(text)
+        matching_rules = []
+        budget = regex_guard.budget
+        spent = 0.0
+        for compiled in self.rules:
+            timed = compiled.literals.regex
+            if timed:
+                if spent > budget:
+                    logger.warning(f"Regex budget spent, skipping rule {compiled.rule.id} for this message.")
+                    continue
+                started = time.perf_counter()
+            try:
+                if compiled.evaluate(ctx):
+                    matching_rules.append(compiled.rule)
+            except Exception as e:
+                logger.error(f"Error evaluating rule {compiled.rule.id}: {e}")
+            if timed:
+                elapsed = time.perf_counter() - started
+                spent += elapsed
+                if elapsed > budget:
+                    regex_guard.strike(compiled.rule, elapsed)
+        return matching_rules
+
 class RuleEngine:
     @staticmethod
     async def get_matching_rules(
@@ -75,12 +284,10 @@ class RuleEngine:
         if not children:
             return True
 
-        results = [RuleEngine.evaluate_logic_node(child, text) for child in children]
-
         if operator == "AND":
-            return all(results)
+            return all(RuleEngine.evaluate_logic_node(child, text) for child in children)
         elif operator == "OR":
-            return any(results)
+            return any(RuleEngine.evaluate_logic_node(child, text) for child in children)
 
         return False
 
@@ -114,7 +321,7 @@ class RuleEngine:
             try:
                 # Regex is usually case-sensitive unless specified, but user expectation might vary.
                 # We'll use case-insensitive matching to be consistent with others.
-                return bool(re.search(target_str, text_str, re.IGNORECASE))
+                return compile_pattern(target_str, re.IGNORECASE).search(text_str) is not None
             except re.error:
                 logger.error(f"Invalid regex pattern: {target_str}")
                 return False
@@ -139,17 +346,173 @@ class RuleEngine:
         
         blacklist = filters.get("blacklist", [])
         if blacklist:
+            if isinstance(blacklist, str):
+                blacklist = [blacklist]
             if any(b.lower() in message_lower for b in blacklist):
                 return False
 
         regex_pattern = filters.get("regex")
         if regex_pattern:
             try:
-                if not re.search(regex_pattern, message_text or ""):
+                if not compile_pattern(regex_pattern).search(message_text or ""):
                     return False
             except re.error:
                 return False
 
         return True
 
+    @staticmethod
+    def rule_version(rule: Rule) -> Tuple[Optional[int], Optional[datetime]]:
+        return (rule.id, rule.updated_at)
+
+    @staticmethod
+    def compile_rule(rule: Rule) -> CompiledRule:
+        """
+        Compile a rule's filters into a reusable evaluator.
+        A rule whose filters cannot be compiled never matches (fail closed).
+        """
+        literals = Literals()
+        try:
+            evaluate = RuleEngine.compile(rule.filters, literals)
+        except Exception as e:
+            logger.error(f"Error compiling rule {rule.id}: {e}")
+            evaluate = _never
+            literals = Literals()
+        return CompiledRule(rule, evaluate, literals)
+
+    @staticmethod
+    def compile(node: Optional[Dict[str, Any]], literals: Literals) -> Evaluator:
+        """
+        Compile a LogicNode tree (or legacy filter dict) into a callable taking a MessageContext.
+        Semantics match evaluate_logic_node. Substring, prefix and suffix tests are resolved
+        against the context's hit sets; the literals they need are added to `literals`.
+        """
+        if not node:
+            return _always
+
+        if "type" not in node:
+            if "keywords" in node or "blacklist" in node or "regex" in node:
+                return RuleEngine._compile_legacy_filters(node, literals)
+            return _always
+
+        node_type = node.get("type")
+
+        if node_type == "group":
+            return RuleEngine._compile_group(node, literals)
+        elif node_type == "condition":
+            return RuleEngine._compile_condition(node, literals)
+
+        return _always
+
+    @staticmethod
+    def _compile_group(node: Dict[str, Any], literals: Literals) -> Evaluator:
+        operator = node.get("operator", "AND")
+        children = node.get("children", [])
+
+        if not children:
+            return _always
+
+        compiled = tuple(RuleEngine.compile(child, literals) for child in children)
+        if len(compiled) == 1 and operator in ("AND", "OR"):
+            return compiled[0]
+
+        if operator == "AND":
+            def evaluate_and(ctx: MessageContext) -> bool:
+                for child in compiled:
+                    if not child(ctx):
+                        return False
+                return True
+            return evaluate_and
+        elif operator == "OR":
+            def evaluate_or(ctx: MessageContext) -> bool:
+                for child in compiled:
+                    if child(ctx):
+                        return True
+                return False
+            return evaluate_or
+
+        return _never
+
+    @staticmethod
+    def _compile_condition(node: Dict[str, Any], literals: Literals) -> Evaluator:
+        condition = node.get("condition", "contains")
+        target_str = str(node.get("value", ""))
+        target_lower = target_str.lower()
+
+        if condition in ("contains", "not_contains", "starts_with", "ends_with") and not target_lower:
+            # The empty string is contained in, starts and ends every text
+            return _never if condition == "not_contains" else _always
+
+        if condition == "contains":
+            literals.contains.add(target_lower)
+            return lambda ctx: target_lower in ctx.hits
+        elif condition == "not_contains":
+            literals.contains.add(target_lower)
+            return lambda ctx: target_lower not in ctx.hits
+        elif condition == "equals":
+            return lambda ctx: ctx.lower == target_lower
+        elif condition == "starts_with":
+            literals.prefixes.add(target_lower)
+            return lambda ctx: target_lower in ctx.prefixes
+        elif condition == "ends_with":
+            literals.suffixes.add(target_lower)
+            return lambda ctx: target_lower in ctx.suffixes
+        elif condition == "regex":
+            try:
+                pattern = compile_pattern(target_str, re.IGNORECASE)
+            except re.error:
+                logger.error(f"Invalid regex pattern: {target_str}")
+                return _never
+            literals.regex = True
+            search = pattern.search
+            return lambda ctx: search(ctx.text) is not None
+
+        return _never
+
+    @staticmethod
+    def _compile_legacy_filters(filters: dict, literals: Literals) -> Evaluator:
+        checks: List[Evaluator] = []
+
+        keywords = filters.get("keywords", [])
+        if keywords:
+            if isinstance(keywords, str):
+                keywords = [keywords]
+            if isinstance(keywords, list):
+                keywords_lower = frozenset(k.lower() for k in keywords)
+                # An empty keyword matches every message, so the check always passes
+                if "" not in keywords_lower:
+                    literals.contains |= keywords_lower
+                    checks.append(lambda ctx: not keywords_lower.isdisjoint(ctx.hits))
+
+        blacklist = filters.get("blacklist", [])
+        if blacklist:
+            if isinstance(blacklist, str):
+                blacklist = [blacklist]
+            blacklist_lower = frozenset(b.lower() for b in blacklist)
+            if "" in blacklist_lower:
+                return _never
+            literals.contains |= blacklist_lower
+            checks.append(lambda ctx: blacklist_lower.isdisjoint(ctx.hits))
+
+        regex_pattern = filters.get("regex")
+        if regex_pattern:
+            try:
+                search = compile_pattern(regex_pattern).search
+            except re.error:
+                return _never
+            literals.regex = True
+            checks.append(lambda ctx: search(ctx.text) is not None)
+
+        if not checks:
+            return _always
+        if len(checks) == 1:
+            return checks[0]
+
+        def evaluate_legacy(ctx: MessageContext) -> bool:
+            for check in checks:
+                if not check(ctx):
+                    return False
+            return True
+        return evaluate_legacy
+
 rule_engine = RuleEngine()
@@ -0,0 +1,225 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+import asyncpg
+from sqlalchemy import event, text
+from sqlalchemy.engine import URL
+from sqlalchemy.orm import Session
+from sqlmodel import select
+from backend.config import settings
+from backend.database import get_session
+from backend.models import Rule
+from backend.services.metrics import registry
+from backend.services.rule_version import bump_rule_version, read_rule_version
+
+logger = logging.getLogger(__name__)
+
+# NOTIFY payloads are limited to 8000 bytes; bigger changes are announced without their ids
+MAX_PAYLOAD = 7900
+
+# session.info key for changes delivered in-process once the transaction commits
+_PENDING = "rule_events"
+
+class RuleEvents:
+    """
+    Propagates rule changes between processes (API replicas and forwarding workers), so
+    each keeps its rule index current without reloading every rule.
+
+    Every rule mutation calls publish() in its transaction. That bumps the rule-set version
+    and, on Postgres, sends a NOTIFY with the new version and the changed rule ids, which
+    Postgres delivers to every listening process when the transaction commits. Other
+    databases have no cross-process channel; there the change is delivered in-process
+    after commit.
+
+    A subscribed process re-reads the changed rules by id and applies them to its index;
+    changes it made itself were already applied by the routes, so only the version is
+    taken over. A gap in the version sequence or a change announced without ids triggers
+    a full reload, as does a periodic version check that still finds the database ahead
+    of the index (notifications lost while the listen connection was down, or rules
+    changed by another process sharing a SQLite database).
+    """
+
+    def __init__(
+        self,
+        channel: str = settings.RULE_EVENTS_CHANNEL,
+        check_interval: float = settings.RULE_VERSION_CHECK_INTERVAL,
+    ):
+        self.channel = channel
+        self.check_interval = check_interval
+        self.origin = uuid.uuid4().hex
+        self.index = None
+        self.version: Optional[int] = None
+        self._lagging: Optional[int] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._connection: Optional[asyncpg.Connection] = None
+        self._url: Optional[URL] = None # Set when the database is Postgres and supports LISTEN
+
+        self.applied = 0
+        self.reloads = 0
+
+    async def publish(self, session, rule_ids: Iterable[int]) -> int:
+        """
+        Announce changes to the given rules. Does not commit: call it in the transaction
+        that makes them (after a flush, so created rules have ids). Returns the new version.
+        """
+        version = await bump_rule_version(session)
+        change: Dict[str, Any] = {"version": version, "ids": sorted(set(rule_ids)), "origin": self.origin}
+        payload = json.dumps(change, separators=(",", ":"))
+        if len(payload) > MAX_PAYLOAD:
+            change["ids"] = None
+            payload = json.dumps(change, separators=(",", ":"))
+
+        if session.bind.dialect.name == "postgresql":
+            await session.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+        else:
+            session.info.setdefault(_PENDING, []).append((self, change))
+        return version
+
+    async def start(self, index) -> None:
+        """
+        Subscribe to rule changes and load the index. Listening starts before the load, so
+        a change committed meanwhile is either in the loaded rules or queued after them.
+        """
+        if self._tasks:
+            return
+        self.index = index
+        self._queue = asyncio.Queue()
+        async for session in get_session():
+            bind = session.bind
+        if bind.dialect.name == "postgresql":
+            self._url = bind.url
+            await self._listen()
+        await self.reload()
+        self._tasks.append(asyncio.create_task(self._consume()))
+        if self.check_interval > 0:
+            self._tasks.append(asyncio.create_task(self._check_periodically()))
+        logger.info(f"Rule change events started at rule-set version {self.version}.")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        if self._connection is not None:
+            try:
+                await self._connection.close()
+            except Exception as e:
+                logger.error(f"Error closing the rule events connection: {e}")
+            self._connection = None
+
+    def receive(self, change: Dict[str, Any]) -> None:
+        """
+        Queue a change for the index; changes are applied one at a time, in order.
+        """
+        if self._queue is not None:
+            self._queue.put_nowait(change)
+
+    async def drain(self) -> None:
+        """
+        Wait until every change queued so far has been applied.
+        """
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def apply(self, change: Dict[str, Any]) -> None:
+        version = change["version"]
+        if self.version is not None and version <= self.version:
+            # Already included in a reload
+            return
+        if self.version is None or version != self.version + 1 or change.get("ids") is None:
+            logger.warning(f"Rule change {version} does not follow version {self.version}; reloading all rules.")
+            await self.reload()
+            return
+        if change.get("origin") != self.origin:
+            async for session in get_session():
+                result = await session.execute(select(Rule).where(Rule.id.in_(change["ids"])))
+                self.index.refresh(change["ids"], result.scalars().all())
+        self.version = version
+        self.applied += 1
+
+    async def reload(self) -> None:
+        async for session in get_session():
+            # Version first: a change committed before the rules are read is then applied again, never skipped
+            version = await read_rule_version(session)
+            await self.index.load(session)
+        self.version = version
+        self._lagging = None
+        self.reloads += 1
+
+    async def check(self) -> bool:
+        """
+        Compare the database version with the index and reload if notifications were missed.
+
+        A notification may still be on its way when the database is read, so the index is
+        only reloaded when it is ahead two checks in a row without catching up.
+        """
+        async for session in get_session():
+            version = await read_rule_version(session)
+        if version == self.version:
+            self._lagging = None
+            return False
+        if version > self.version and (self._lagging is None or self.version >= self._lagging):
+            self._lagging = version
+            return False
+        logger.warning(f"Rule set is at version {version} but the index at {self.version}; reloading all rules.")
+        await self.reload()
+        return True
+
+    async def _consume(self) -> None:
+        while True:
+            change = await self._queue.get()
+            try:
+                # None is the periodic check, queued so it never runs between two changes
+                if change is None:
+                    await self.check()
+                else:
+                    await self.apply(change)
+            except Exception as e:
+                # The version is left behind, so the next check reloads
+                logger.error(f"Error applying rule change {change}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _check_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if self._url is not None and (self._connection is None or self._connection.is_closed()):
+                # Notifications sent while disconnected are lost; the check below recovers them
+                await self._listen()
+            self.receive(None)
+
+    async def _listen(self) -> None:
+        try:
+            # A dedicated connection outside the pool: it stays open and idle in LISTEN
+            dsn = self._url.set(drivername="postgresql").render_as_string(hide_password=False)
+            self._connection = await asyncpg.connect(dsn)
+            await self._connection.add_listener(self.channel, self._on_notify)
+        except Exception as e:
+            logger.error(f"Could not listen for rule changes (falling back to version checks): {e}")
+            self._connection = None
+
+    def _on_notify(self, connection, pid: int, channel: str, payload: str) -> None:
+        try:
+            self.receive(json.loads(payload))
+        except ValueError:
+            logger.error(f"Ignoring malformed rule change notification: {payload!r}")
+
+rule_events = RuleEvents()
+
+@event.listens_for(Session, "after_commit")
+def _deliver_pending(session) -> None:
+    for events, change in session.info.pop(_PENDING, ()):
+        events.receive(change)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session) -> None:
+    session.info.pop(_PENDING, None)
+
+registry.counter(
+    "tgforwarder_rule_events_total", "Rule changes applied incrementally and full rule index reloads", ("kind",),
+    callback=lambda: {("applied",): rule_events.applied, ("reloads",): rule_events.reloads},
+)
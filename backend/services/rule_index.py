@@ -0,0 +1,175 @@
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from sqlmodel import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.models import Rule
+from backend.services.rule_engine import RuleEngine, CompiledRule, CompiledRuleSet
+from backend.services.metrics import stage_seconds
+from backend.services.regex_guard import regex_guard
+
+logger = logging.getLogger(__name__)
+
+_lookup_seconds = stage_seconds.labels("lookup")
+_evaluate_seconds = stage_seconds.labels("evaluate")
+
+class RuleIndex:
+    """
+    Process-local index of active, compiled rules keyed by source chat.
+
+    The index is loaded once at startup and kept current by the rule CRUD
+    routes (and, for changes made by other processes, by rule change events), so
+    the message path can look up rules without touching the database.
+    Every mutation builds a new mapping and swaps it in with a single assignment,
+    which keeps readers on the event loop from ever seeing a half-applied update.
+    Listeners registered with add_listener() are called after every change.
+    """
+
+    def __init__(self):
+        self._by_source: Dict[str, CompiledRuleSet] = {}
+        self._source_by_rule: Dict[int, str] = {}
+        self._listeners: List[Callable[[], None]] = []
+
+    async def load(self, session: AsyncSession) -> None:
+        """
+        Replace the index contents with all active rules from the database.
+        """
+        result = await session.execute(select(Rule).where(Rule.is_active == True))
+        by_source: Dict[str, List[CompiledRule]] = {}
+        source_by_rule: Dict[int, str] = {}
+        for rule in result.scalars().all():
+            by_source.setdefault(rule.source, []).append(self._compile(rule))
+            source_by_rule[rule.id] = rule.source
+
+        self._by_source = {source: CompiledRuleSet(tuple(rules)) for source, rules in by_source.items()}
+        self._source_by_rule = source_by_rule
+        logger.info(f"Rule index loaded: {len(source_by_rule)} active rules across {len(by_source)} sources")
+        self._notify()
+
+    def get_rules(self, source_chat_id: str) -> Tuple[Rule, ...]:
+        rule_set = self._by_source.get(source_chat_id)
+        return tuple(compiled.rule for compiled in rule_set.rules) if rule_set else ()
+
+    def match(self, source_chat_id: str, message_text: str) -> List[Rule]:
+        """
+        Return the active rules for the source whose filters match the message text.
+        """
+        started = time.perf_counter()
+        rule_set = self._by_source.get(source_chat_id)
+        looked_up = time.perf_counter()
+        _lookup_seconds.observe(looked_up - started)
+        if rule_set is None:
+            return []
+        matching_rules = rule_set.match(message_text)
+        _evaluate_seconds.observe(time.perf_counter() - looked_up)
+        return matching_rules
+
+    def compiled_for(self, rule: Rule) -> CompiledRule:
+        """
+        Return the compiled form of a rule, reusing the indexed one when it is the same version.
+        """
+        source = self._source_by_rule.get(rule.id)
+        if source is not None:
+            version = RuleEngine.rule_version(rule)
+            for compiled in self._by_source[source].rules:
+                if compiled.rule.id == rule.id and compiled.version == version:
+                    return compiled
+        return RuleEngine.compile_rule(rule)
+
+    def upsert(self, rule: Rule) -> None:
+        """
+        Insert or replace a rule after it was created or updated.
+        Inactive rules are removed from the index.
+        """
+        self._apply({rule.id: self._compile(rule) if rule.is_active else None})
+
+    def upsert_many(self, rules: Iterable[Rule]) -> None:
+        """
+        upsert() for a batch of rules, rebuilding each affected source's rule set once.
+        """
+        self._apply({rule.id: self._compile(rule) if rule.is_active else None for rule in rules})
+
+    def refresh(self, rule_ids: Iterable[int], rules: Iterable[Rule]) -> None:
+        """
+        Bring rule_ids in line with their current database rows: rules are upserted, and
+        ids without a row (deleted rules) are removed.
+        """
+        changes: Dict[int, Optional[CompiledRule]] = dict.fromkeys(rule_ids)
+        changes.update({rule.id: self._compile(rule) if rule.is_active else None for rule in rules})
+        self._apply(changes)
+
+    def remove(self, rule_id: int) -> None:
+        if rule_id in self._source_by_rule:
+            self._apply({rule_id: None})
+
+    def sources(self) -> List[str]:
+        return list(self._by_source.keys())
+
+    def destinations(self) -> Set[str]:
+        return {c.rule.destination for rule_set in self._by_source.values() for c in rule_set.rules}
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Register a callback run synchronously after the index changes.
+        Listeners must not block; anything slow should be scheduled as a task.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self) -> None:
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.error(f"Error in rule index listener: {e}")
+
+    def __contains__(self, rule_id: int) -> bool:
+        return rule_id in self._source_by_rule
+
+    def __len__(self) -> int:
+        return len(self._source_by_rule)
+
+    def _apply(self, changes: Dict[int, Optional[CompiledRule]]) -> None:
+        """
+        Apply per-rule replacements (None removes the rule), rebuilding each affected
+        source's rule set once and swapping the new mappings in together.
+        """
+        by_source = dict(self._by_source)
+        source_by_rule = dict(self._source_by_rule)
+        touched: Dict[str, Dict[int, CompiledRule]] = {}
+
+        def rules_of(source: str) -> Dict[int, CompiledRule]:
+            if source not in touched:
+                existing = by_source.get(source)
+                touched[source] = {c.rule.id: c for c in existing.rules} if existing else {}
+            return touched[source]
+
+        for rule_id, compiled in changes.items():
+            old_source = source_by_rule.pop(rule_id, None)
+            if old_source is not None:
+                rules_of(old_source).pop(rule_id, None)
+            if compiled is not None:
+                rules_of(compiled.rule.source)[rule_id] = compiled
+                source_by_rule[rule_id] = compiled.rule.source
+
+        for source, rules in touched.items():
+            if rules:
+                by_source[source] = CompiledRuleSet(tuple(rules.values()))
+            else:
+                by_source.pop(source, None)
+
+        self._by_source = by_source
+        self._source_by_rule = source_by_rule
+        self._notify()
+
+    @staticmethod
+    def _compile(rule: Rule) -> CompiledRule:
+        # Compile a detached copy so later ORM activity on the original instance can't leak into the index
+        return RuleEngine.compile_rule(Rule(**rule.model_dump()))
+
+rule_index = RuleIndex()
+# Rules disabled for blowing the regex time budget stop matching right away
+regex_guard.add_listener(rule_index.remove)
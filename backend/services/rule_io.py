@@ -0,0 +1,176 @@
+import csv
+import io
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from backend.models import DeliveryMethod, Rule
+from backend.services.backtest import iter_lines
+
+# Column order of CSV exports; imports accept any order, matched by header
+CSV_COLUMNS = ["id", "name", "source", "destination", "delivery_method", "is_active", "dedupe_window", "filters", "ai_config"]
+JSON_COLUMNS = {"filters", "ai_config"}
+
+# How bare (unmarked) chat ids of the old Google Sheet are marked, as Telethon's chat_id
+BARE_ID_PREFIXES = {"channel": "-100", "chat": "-", "user": ""}
+
+# One parsed import record: its 1-based position in the payload, and either the
+# record's fields or the reason it could not be parsed
+Record = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+async def iter_json_array(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    """
+    Yield the items of a streamed top-level JSON array one at a time, decoding each as
+    soon as it is complete rather than after the whole body has arrived.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pending = b""
+    started = False
+    position = 0
+    async for chunk in chunks:
+        # Multi-byte characters may be split across chunks
+        pending += chunk
+        try:
+            buffer += pending.decode()
+            pending = b""
+        except UnicodeDecodeError as e:
+            buffer += pending[:e.start].decode()
+            pending = pending[e.start:]
+
+        while True:
+            buffer = buffer.lstrip()
+            if not started:
+                if not buffer:
+                    break
+                if buffer[0] != "[":
+                    raise ValueError("Expected a JSON array of rules")
+                buffer, started = buffer[1:], True
+                continue
+            if buffer[:1] == ",":
+                buffer = buffer[1:]
+                continue
+            if buffer[:1] == "]":
+                return
+            if not buffer:
+                break
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Incomplete item; wait for more data
+                break
+            buffer = buffer[end:]
+            position += 1
+            yield (position, item, None) if isinstance(item, dict) else (position, None, "Expected an object")
+
+    if buffer.strip() or not started:
+        position += 1
+        yield position, None, "Malformed or unterminated JSON array"
+
+async def iter_ndjson(chunks: AsyncIterator[bytes]) -> AsyncIterator[Record]:
+    position = 0
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        position += 1
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            yield position, None, f"Invalid JSON: {e}"
+            continue
+        yield (position, item, None) if isinstance(item, dict) else (position, None, "Expected an object")
+
+async def iter_csv(chunks: AsyncIterator[bytes], layout: str = "rules", bare_ids: str = "channel") -> AsyncIterator[Record]:
+    """
+    Parse a streamed CSV payload with a header row.
+
+    With layout "rules" the header names Rule fields (as written by the CSV export);
+    filters and ai_config hold JSON. Layout "legacy_sheet" reads the old Google Sheet
+    (source chat, ", "-separated keywords, ", "-separated destinations, status) and
+    yields one keyword rule per destination; rows with status "off" become inactive.
+
+    The old app kept its /sync settings in the sheet's first data row, which is skipped,
+    and stored sources as bare channel/chat ids: positive numbers are marked as `bare_ids`
+    (channel, chat or user) to match event.chat_id. Destinations were already marked.
+    """
+    header: Optional[List[str]] = None
+    record_lines: List[str] = []
+    position = 0
+    async for raw in iter_lines(chunks):
+        record_lines.append(raw.decode("utf-8-sig" if header is None and not record_lines else "utf-8").rstrip("\r"))
+        text = "\n".join(record_lines)
+        # Quotes come in pairs ("" escapes one), so an odd count means a quoted field continues on the next line
+        if text.count('"') % 2:
+            continue
+        record_lines = []
+        if not text.strip():
+            continue
+        values = next(csv.reader(io.StringIO(text)))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+
+        position += 1
+        if layout == "legacy_sheet":
+            if position == 1:
+                continue
+            for record in _legacy_rules(values, bare_ids):
+                yield position, record, None
+            if len(values) < 3:
+                yield position, None, "Expected source, keywords and destinations columns"
+            continue
+        try:
+            yield position, _csv_record(header, values), None
+        except ValueError as e:
+            yield position, None, str(e)
+
+    if record_lines:
+        yield position + 1, None, "Unterminated quoted field at the end of the payload"
+
+def _csv_record(header: List[str], values: List[str]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {}
+    for name, value in zip(header, values):
+        if value == "":
+            continue
+        if name in JSON_COLUMNS:
+            try:
+                record[name] = json.loads(value)
+            except ValueError:
+                raise ValueError(f"Column {name} is not valid JSON")
+        elif name == "is_active":
+            record[name] = value.strip().lower() in ("1", "true", "yes", "on")
+        else:
+            record[name] = value
+    return record
+
+def _legacy_rules(values: List[str], bare_ids: str = "channel") -> List[Dict[str, Any]]:
+    if len(values) < 3:
+        return []
+    source, keywords, destinations = (v.strip() for v in values[:3])
+    if source.isdigit():
+        source = BARE_ID_PREFIXES[bare_ids] + source
+    status = values[3].strip().lower() if len(values) > 3 else ""
+    keywords_list = [k for k in keywords.split(", ") if k]
+    return [
+        {
+            "name": f"{source} -> {destination}",
+            "source": source,
+            "destination": destination,
+            "delivery_method": DeliveryMethod.FORWARD.value,
+            "filters": {"keywords": keywords_list} if keywords_list else None,
+            "is_active": status != "off",
+        }
+        for destination in (d.strip() for d in destinations.split(", ")) if destination
+    ]
+
+def export_record(rule: Rule) -> Dict[str, Any]:
+    return {column: getattr(rule, column) for column in CSV_COLUMNS}
+
+def csv_line(values: List[Any]) -> bytes:
+    out = io.StringIO()
+    csv.writer(out, lineterminator="\n").writerow(values)
+    return out.getvalue().encode()
+
+def csv_row(rule: Rule) -> bytes:
+    return csv_line([
+        json.dumps(value) if column in JSON_COLUMNS and value is not None else value
+        for column, value in export_record(rule).items()
+    ])
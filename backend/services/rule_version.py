@@ -0,0 +1,37 @@
+from datetime import datetime
+from typing import Any, Dict
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from backend.models import RuleSetVersion
+
+_bumps: Dict[str, Any] = {}
+
+def _bump(dialect: str):
+    stmt = _bumps.get(dialect)
+    if stmt is None:
+        table = RuleSetVersion.__table__
+        stmt = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table)
+        stmt = _bumps[dialect] = stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={"version": table.c.version + 1, "updated_at": stmt.excluded.updated_at},
+        ).returning(table.c.version)
+    return stmt
+
+async def bump_rule_version(session) -> int:
+    """
+    Advance the rule-set version and return the new one. Does not commit: call it in the
+    transaction that changes the rules, so the new version becomes visible together with
+    the change (and concurrent changes are numbered in commit order, as the row stays
+    locked until then).
+    """
+    result = await session.execute(
+        _bump(session.bind.dialect.name), {"id": 1, "version": 1, "updated_at": datetime.utcnow()}
+    )
+    return result.scalar_one()
+
+async def read_rule_version(session) -> int:
+    """
+    Current rule-set version; 0 before the rules were first changed.
+    """
+    result = await session.execute(select(RuleSetVersion.version).where(RuleSetVersion.id == 1))
+    return result.scalar_one_or_none() or 0
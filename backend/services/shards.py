@@ -0,0 +1,197 @@
+import asyncio
+import logging
+import math
+import uuid
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+from sqlalchemy import delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlmodel import select
+from backend.config import settings
+from backend.database import get_session
+from backend.models import Worker, WorkerShard
+
+logger = logging.getLogger(__name__)
+
+def shard_of(source: str, shard_count: int = settings.WORKER_SHARDS) -> int:
+    """
+    Shard a source chat belongs to. crc32 is stable across processes, unlike hash().
+    """
+    if shard_count <= 1:
+        return 0
+    return zlib.crc32(source.encode()) % shard_count
+
+_inserts: Dict[str, Any] = {}
+
+def _insert_shards(dialect: str):
+    stmt = _inserts.get(dialect)
+    if stmt is None:
+        stmt = _inserts[dialect] = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(
+            WorkerShard.__table__
+        ).on_conflict_do_nothing(index_elements=["shard"])
+    return stmt
+
+class ShardCoordinator:
+    """
+    Splits the source shards between running worker processes using leases in the
+    WorkerShard table.
+
+    Every round a worker refreshes its heartbeat in the Worker table, renews the leases
+    it holds, offers shards above its fair share (shards / live workers, rounded up)
+    and takes free or expired ones up to it.
+    A worker that cannot renew drops its shards once its lease has run out, which is
+    also when other workers may take them over.
+
+    Telegram does not replay updates, so an offered shard is not dropped right away: its
+    lease is expired (which lets any other worker take it) while the worker keeps
+    listening to it, and it is only dropped once a later round finds another owner.
+    Rounds run every handoff_interval while an offer is open, so the two workers overlap
+    for about that long instead of leaving the shard unheard until the next round.
+    """
+
+    def __init__(
+        self,
+        shard_count: int = settings.WORKER_SHARDS,
+        lease_seconds: float = settings.WORKER_LEASE_SECONDS,
+        worker_id: Optional[str] = None,
+        handoff_interval: float = settings.WORKER_HANDOFF_INTERVAL,
+    ):
+        self.shard_count = shard_count
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]
+        self.handoff_interval = handoff_interval
+        self.owned: FrozenSet[int] = frozenset()
+        # Shards offered to other workers but not taken yet; still listened to
+        self.offered: FrozenSet[int] = frozenset()
+        self._valid_until: Optional[datetime] = None
+        self._listeners: List[Callable[[FrozenSet[int]], None]] = []
+        # Returns the snapshot stored with each heartbeat (e.g. delivery state for the API)
+        self.state_provider: Optional[Callable[[], Dict[str, Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add_listener(self, listener: Callable[[FrozenSet[int]], None]) -> None:
+        """
+        Register a callback run with the new set of owned shards whenever it changes.
+        """
+        self._listeners.append(listener)
+
+    def owns(self, source: str) -> bool:
+        return shard_of(source, self.shard_count) in self.owned
+
+    async def start(self) -> None:
+        await self.rebalance()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._set_owned(frozenset())
+        self.offered = frozenset()
+        try:
+            async for session in get_session():
+                await session.execute(
+                    update(WorkerShard)
+                    .where(WorkerShard.owner == self.worker_id)
+                    .values(owner=None, lease_expires_at=None)
+                )
+                await session.execute(delete(Worker).where(Worker.id == self.worker_id))
+                await session.commit()
+                break
+        except Exception as e:
+            logger.error(f"Failed to release shard leases of worker {self.worker_id}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            interval = self.lease_seconds / 3
+            await asyncio.sleep(min(interval, self.handoff_interval) if self.offered else interval)
+            try:
+                await self.rebalance()
+            except Exception as e:
+                logger.error(f"Error renewing shard leases of worker {self.worker_id}: {e}")
+                if self._valid_until is not None and datetime.utcnow() >= self._valid_until:
+                    self.offered = frozenset()
+                    self._set_owned(frozenset())
+
+    async def rebalance(self) -> FrozenSet[int]:
+        """
+        Run one lease round and return the shards owned afterwards.
+        """
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.lease_seconds)
+
+        async for session in get_session():
+            await session.merge(Worker(id=self.worker_id, heartbeat_at=now, state=self._state()))
+            result = await session.execute(
+                select(Worker.id).where(Worker.heartbeat_at > now - timedelta(seconds=self.lease_seconds))
+            )
+            live = set(result.scalars().all()) | {self.worker_id}
+            fair_share = math.ceil(self.shard_count / len(live))
+
+            result = await session.execute(select(WorkerShard.shard))
+            existing = set(result.scalars().all())
+            missing = [{"shard": shard} for shard in range(self.shard_count) if shard not in existing]
+            if missing:
+                # Workers starting together may add the same rows
+                await session.execute(_insert_shards(session.bind.dialect.name), missing)
+            await session.commit()
+
+            # Not SKIP LOCKED: a row locked by another worker's round must not read as lost
+            result = await session.execute(
+                select(WorkerShard)
+                .where(WorkerShard.shard < self.shard_count)
+                .order_by(WorkerShard.shard)
+                .with_for_update()
+            )
+            rows = result.scalars().all()
+
+            held = [r for r in rows if r.owner == self.worker_id and r.shard not in self.offered]
+            still_offered = [r for r in rows if r.owner == self.worker_id and r.shard in self.offered]
+            free = [
+                r for r in rows
+                if r.owner != self.worker_id and (r.owner is None or r.lease_expires_at is None or r.lease_expires_at <= now)
+            ]
+            mine = held[:fair_share]
+            # Shards still on offer are taken back first, when the fair share allows it again
+            taken = (still_offered + free)[:max(0, fair_share - len(mine))]
+            offer = held[fair_share:] + [r for r in still_offered if r not in taken]
+            mine += taken
+
+            for row in mine:
+                row.owner = self.worker_id
+                row.lease_expires_at = expires
+            for row in offer:
+                row.lease_expires_at = now
+            await session.commit()
+            offered = frozenset(r.shard for r in offer)
+            owned = frozenset(r.shard for r in mine) | offered
+            break
+
+        if offered != self.offered:
+            logger.info(f"Worker {self.worker_id} offers shards {sorted(offered)} until another worker takes them")
+        self.offered = offered
+        self._valid_until = expires
+        self._set_owned(owned)
+        return owned
+
+    def _state(self) -> Optional[Dict[str, Any]]:
+        if self.state_provider is None:
+            return None
+        try:
+            return self.state_provider()
+        except Exception as e:
+            logger.error(f"Error collecting worker state: {e}")
+            return None
+
+    def _set_owned(self, owned: FrozenSet[int]) -> None:
+        if owned == self.owned:
+            return
+        logger.info(f"Worker {self.worker_id} now owns shards {sorted(owned)} of {self.shard_count}")
+        self.owned = owned
+        for listener in self._listeners:
+            try:
+                listener(owned)
+            except Exception as e:
+                logger.error(f"Error in shard listener: {e}")
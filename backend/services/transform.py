@@ -0,0 +1,202 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import httpx
+from backend.config import settings
+from backend.services.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+class TransformBackend:
+    """
+    Model backend: rewrites a batch of texts with one system instruction.
+    """
+
+    async def generate(self, model: str, instruction: str, texts: List[str]) -> List[str]:
+        raise NotImplementedError
+
+class EchoBackend(TransformBackend):
+    """
+    Local deterministic stand-in: returns every text unchanged.
+    """
+
+    def __init__(self):
+        self.calls: List[Tuple[str, str, List[str]]] = []
+
+    async def generate(self, model: str, instruction: str, texts: List[str]) -> List[str]:
+        self.calls.append((model, instruction, list(texts)))
+        return list(texts)
+
+class GeminiBackend(TransformBackend):
+    """
+    Google Gemini over its REST API. A batch of several texts goes out as one request
+    asking for a JSON array with one rewritten text per input.
+    """
+    URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+
+    def __init__(self, api_key: str, timeout: float = settings.AI_TIMEOUT):
+        self.api_key = api_key
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def generate(self, model: str, instruction: str, texts: List[str]) -> List[str]:
+        if len(texts) == 1:
+            return [await self._call(model, instruction, texts[0])]
+
+        prompt = (
+            "Apply the instruction to each message in the JSON array below independently. "
+            "Respond with a JSON array of the same length holding the results, in order.\n\n"
+            + json.dumps(texts, ensure_ascii=False)
+        )
+        try:
+            results = json.loads(await self._call(model, instruction, prompt, as_json=True))
+            if isinstance(results, list) and len(results) == len(texts) and all(isinstance(r, str) for r in results):
+                return results
+            logger.warning(f"Model {model} returned a malformed batch; retrying {len(texts)} texts one by one.")
+        except json.JSONDecodeError:
+            logger.warning(f"Model {model} returned invalid JSON for a batch; retrying {len(texts)} texts one by one.")
+        return list(await asyncio.gather(*(self._call(model, instruction, text) for text in texts)))
+
+    async def _call(self, model: str, instruction: str, text: str, as_json: bool = False) -> str:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        body = {
+            "systemInstruction": {"parts": [{"text": instruction}]},
+            "contents": [{"role": "user", "parts": [{"text": text}]}],
+        }
+        if as_json:
+            body["generationConfig"] = {"responseMimeType": "application/json"}
+        response = await self._client.post(
+            self.URL.format(model=model), params={"key": self.api_key}, json=body
+        )
+        response.raise_for_status()
+        parts = response.json()["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts)
+
+def make_backend() -> Optional[TransformBackend]:
+    if settings.AI_BACKEND == "echo":
+        return EchoBackend()
+    if settings.AI_BACKEND == "gemini" and settings.GEMINI_API_KEY:
+        return GeminiBackend(settings.GEMINI_API_KEY)
+    return None
+
+class Transformer:
+    """
+    Rewrites message text for rules with ai_config enabled, between matching and delivery.
+
+    Results are cached by (model, instruction, text hash) with LRU eviction, and identical
+    requests already in progress share one call, so cross-posted or repeated texts cost a
+    single model call. Requests for the same model and instruction arriving within
+    batch_window are sent as one batch of up to batch_size texts, and at most
+    max_concurrency batches are in flight at once.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[TransformBackend] = None,
+        max_concurrency: int = settings.AI_MAX_CONCURRENCY,
+        batch_size: int = settings.AI_BATCH_SIZE,
+        batch_window: float = settings.AI_BATCH_WINDOW,
+        cache_size: int = settings.AI_CACHE_SIZE,
+    ):
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.cache_size = cache_size
+
+        self._cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._in_progress: Dict[bytes, asyncio.Future] = {}
+        # (model, instruction) -> texts waiting for the batch window, with their cache keys
+        self._pending: Dict[Tuple[str, str], List[Tuple[bytes, str]]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: set = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.batches = 0
+
+    @staticmethod
+    def cache_key(model: str, instruction: str, text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{instruction}\0{text}".encode()).digest()
+
+    async def transform(self, model: str, instruction: str, text: str) -> str:
+        if self.backend is None:
+            raise RuntimeError("No AI backend configured (set AI_BACKEND and GEMINI_API_KEY)")
+
+        key = self.cache_key(model, instruction, text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return cached
+
+        future = self._in_progress.get(key)
+        if future is None:
+            self.misses += 1
+            future = self._in_progress[key] = asyncio.get_running_loop().create_future()
+            pending = self._pending.setdefault((model, instruction), [])
+            pending.append((key, text))
+            if len(pending) == 1:
+                self._spawn(self._flush_after_window(model, instruction))
+            elif len(pending) >= self.batch_size:
+                self._spawn(self._run_batch(model, instruction, self._pending.pop((model, instruction))))
+        else:
+            self.hits += 1
+        # Several callers may wait on one future; shield it so one cancelled caller does not cancel it for all
+        return await asyncio.shield(future)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_after_window(self, model: str, instruction: str) -> None:
+        await asyncio.sleep(self.batch_window)
+        batch = self._pending.pop((model, instruction), None)
+        if batch:
+            await self._run_batch(model, instruction, batch)
+
+    async def _run_batch(self, model: str, instruction: str, batch: List[Tuple[bytes, str]]) -> None:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            async with self._semaphore:
+                self.batches += 1
+                results = await self.backend.generate(model, instruction, [text for _, text in batch])
+            if len(results) != len(batch):
+                raise ValueError(f"Backend returned {len(results)} results for {len(batch)} texts")
+        except Exception as e:
+            for key, _ in batch:
+                future = self._in_progress.pop(key)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (key, _), result in zip(batch, results):
+            future = self._in_progress.pop(key)
+            if not isinstance(result, str) or not result.strip():
+                # Sending an empty message would fail; callers fall back to the original text
+                if not future.done():
+                    future.set_exception(ValueError(f"Model {model} returned no text"))
+                continue
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            if not future.done():
+                future.set_result(result)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+transformer = Transformer(make_backend())
+
+registry.counter(
+    "tgforwarder_ai_transform_cache_total", "AI transform lookups answered from the cache or sent to the model", ("result",),
+    callback=lambda: {("hit",): transformer.hits, ("miss",): transformer.misses},
+)
+registry.counter(
+    "tgforwarder_ai_transform_batches_total", "Batches of texts sent to the AI model backend",
+    callback=lambda: {(): transformer.batches},
+)
@@ -1,9 +1,15 @@
-from telethon import TelegramClient, events
+from telethon import events, utils
+from telethon.tl.types import InputPeerSelf
 import os
 import asyncio
 import logging
+from typing import Any, Callable, FrozenSet, Optional
 from backend.config import settings
+from backend.services.rule_index import rule_index
 from backend.telegram.handler import handle_new_message
+from backend.telegram.outbox import outbox
+from backend.telegram.peers import peer_cache
+from backend.telegram.pool import client_pool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -14,7 +20,12 @@ class TelegramService:
         self.api_id = settings.TELEGRAM_API_ID
         self.api_hash = settings.TELEGRAM_API_HASH
         self.client = None
-        
+        self.peers = peer_cache
+        self._subscribed: Optional[FrozenSet[str]] = None
+        # Set by a sharded worker to the sources it owns; None listens to every rule source
+        self.source_filter: Optional[Callable[[str], bool]] = None
+        rule_index.add_listener(self.subscribe)
+
         # Ensure session directory exists
         os.makedirs("sessions", exist_ok=True)
 
@@ -23,24 +34,88 @@ class TelegramService:
             logger.warning("Telegram API credentials not found. Skipping Telegram client start.")
             return
 
-        self.client = TelegramClient('sessions/bot_session', self.api_id, self.api_hash)
+        listener = await client_pool.start(self.api_id, self.api_hash)
+        if listener is None:
+            logger.error("No healthy Telegram account available. Skipping Telegram client start.")
+            return
+        self.client = listener.client
+        self.peers = listener.peers
+        # Sources resolved later (at warm-up or after a rule change) are added to the subscription
+        self.peers.add_listener(self.subscribe)
+
+        # Register the event handler for the chats that have active rules
+        self.subscribe()
 
-        # Register the event handler
-        self.client.add_event_handler(handle_new_message, events.NewMessage(incoming=True))
+        await client_pool.warm_peers()
 
-        # Start the client
-        # In a real deployment, we might need to handle authentication differently
-        # e.g., using a bot token or a pre-existing session file.
-        # For user accounts, interactive login is tricky in headless environments.
-        # Assuming the session file 'sessions/bot_session.session' is valid or we can interactive login once.
-        await self.client.start()
-        logger.info("Telegram client started and listening for messages!")
+        # Deliver queued messages, including any left over from a previous run
+        await outbox.start(self.client)
+        logger.info(f"Telegram client pool started with {len(client_pool)} accounts, {listener.name} listening for messages!")
 
     async def stop(self):
         if self.client:
-            await self.client.disconnect()
+            # Finish or release in-flight deliveries while the clients can still send
+            await outbox.stop()
+            self.client.remove_event_handler(handle_new_message, events.NewMessage)
+            await client_pool.stop()
+            self.client = None
+            self._subscribed = None
+            self.peers.remove_listener(self.subscribe)
+            self.peers = peer_cache
             logger.info("Telegram client stopped.")
 
+    def subscribe(self):
+        """
+        (Re-)register the message handler with a chats= filter built from the active rule
+        sources, so Telethon drops updates from every other chat before our code runs.
+        Called on start, whenever the rule index changes and when shard ownership moves.
+        """
+        if not self.client:
+            return
+        chats = {}
+        unresolved = []
+        for source in rule_index.sources():
+            if self.source_filter is not None and not self.source_filter(source):
+                continue
+            chat = self._chat_filter(source)
+            if chat is None:
+                unresolved.append(source)
+            else:
+                chats[source] = chat
+        sources = frozenset(chats)
+        if sources == self._subscribed:
+            return
+        if unresolved:
+            # Telethon resolves every chats= entry on every update and stops dispatching
+            # altogether when one fails, so these stay out until the peer cache resolves them
+            logger.warning(f"Not listening to unresolved chats until they resolve: {', '.join(sorted(unresolved))}")
+
+        self.client.remove_event_handler(handle_new_message, events.NewMessage)
+        self._subscribed = sources
+
+        # chats=None would mean every chat, so with no active rules there is no handler at all
+        if not sources:
+            logger.info("No active rules; not listening for messages.")
+            return
+        self.client.add_event_handler(
+            handle_new_message, events.NewMessage(incoming=True, chats=[chats[source] for source in sorted(sources)])
+        )
+        logger.info(f"Listening for messages from {len(sources)} chats.")
+
+    def _chat_filter(self, source: str) -> Any:
+        """
+        chats= entry for a source that needs no resolving on the update path: a marked id
+        for resolved peers and numeric ids, or None for a username not resolved yet.
+        """
+        peer = self.peers.get(source)
+        if isinstance(peer, InputPeerSelf):
+            return peer
+        if peer is not None:
+            return utils.get_peer_id(peer)
+        if source.lstrip('-').isdigit():
+            return int(source)
+        return None
+
     async def send_message(self, chat_id: str, message: str):
         if not self.client:
              logger.error("Telegram client not initialized.")
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Set, Tuple
+from telethon.errors import FloodError
+from backend.config import settings
+from backend.telegram.pool import Account, ClientPool, client_pool
+from backend.telegram.rate_limiter import DEFAULT_ACCOUNT, RateLimiter, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[..., Awaitable[Any]]
+
+class DeliveryDispatcher:
+    """
+    Runs outbound sends concurrently across destinations while keeping them
+    strictly ordered within each destination.
+
+    Every destination has a FIFO lane drained by one task, so sends submitted for the
+    same destination complete in submission order. Lanes for different destinations
+    run in parallel, bounded by a global concurrency limit.
+
+    With a rate limiter, each send first waits for its destination's and account's
+    tokens (outside the concurrency limit, so a parked destination holds no slot).
+    A FloodWait parks the destination and retries the same send, keeping lane order.
+
+    With a client pool, every attempt is assigned an account by the pool and the send
+    is called with that Account; a retry after a FloodWait may go out from another one.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = settings.DELIVERY_MAX_CONCURRENCY,
+        limiter: Optional[RateLimiter] = None,
+        pool: Optional[ClientPool] = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.limiter = limiter
+        self.pool = pool
+        self._lanes: Dict[str, Deque[Tuple[Send, asyncio.Future]]] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def submit(self, destination: str, send: Send) -> asyncio.Future:
+        """
+        Queue a send for the destination and return a future for its result.
+        Submission is synchronous, so the order of submit() calls is the delivery order.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        future = loop.create_future()
+        lane = self._lanes.get(destination)
+        if lane is None:
+            lane = deque()
+            self._lanes[destination] = lane
+            task = loop.create_task(self._drain(destination, lane))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        lane.append((send, future))
+        return future
+
+    def pending(self) -> Dict[str, int]:
+        """
+        Number of queued or running sends per destination.
+        """
+        return {destination: len(lane) for destination, lane in self._lanes.items()}
+
+    async def wait_idle(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _drain(self, destination: str, lane: Deque[Tuple[Send, asyncio.Future]]) -> None:
+        try:
+            while lane:
+                send, future = lane[0]
+                if not future.cancelled():
+                    await self._deliver(destination, send, future)
+                lane.popleft()
+        finally:
+            # No await between the empty check and removal, so a concurrent submit
+            # either lands in this lane before it closes or opens a new one
+            if self._lanes.get(destination) is lane:
+                del self._lanes[destination]
+            for _, future in lane:
+                if not future.done():
+                    future.cancel()
+
+    async def _deliver(self, destination: str, send: Send, future: asyncio.Future) -> None:
+        flood_retries = 0
+        while True:
+            account = None
+            account_name = DEFAULT_ACCOUNT
+            if self.pool is not None:
+                try:
+                    account = self.pool.pick(destination)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+                account_name = account.name
+            if self.limiter is not None:
+                await self.limiter.acquire(destination, account_name)
+            async with self._semaphore:
+                try:
+                    result = await self._attempt(send, account)
+                except FloodError as e:
+                    seconds = getattr(e, "seconds", None)
+                    if self.limiter is not None and seconds is not None and flood_retries < self.limiter.max_flood_retries:
+                        flood_retries += 1
+                        self.limiter.park(destination, seconds, account_name)
+                        continue
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+            if not future.done():
+                future.set_result(result)
+            return
+
+    async def _attempt(self, send: Send, account: Optional[Account]) -> Any:
+        if account is None:
+            return await send()
+        self.pool.sending(account)
+        try:
+            result = await send(account)
+        except BaseException as e:
+            self.pool.finished(account, e)
+            raise
+        self.pool.finished(account)
+        return result
+
+delivery_dispatcher = DeliveryDispatcher(limiter=rate_limiter, pool=client_pool)
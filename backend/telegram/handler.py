@@ -1,82 +1,119 @@
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 from telethon import events
-from backend.services.rule_engine import rule_engine
-from backend.database import get_session
-from backend.models import Log, DeliveryMethod
+from backend.config import settings
+from backend.services.dedupe import content_key, dedupe_cache
+from backend.services.log_sink import log_sink
+from backend.services.metrics import messages_in_flight, messages_received, rule_deliveries, rule_matches, stage_seconds
+from backend.services.rule_index import rule_index
+from backend.telegram.outbox import Delivery, outbox
+from backend.models import Rule
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_receive_seconds = stage_seconds.labels("receive")
+_enqueue_seconds = stage_seconds.labels("enqueue")
+
+# (model, system instruction) of a rule's AI transform, None for rules sending the text as is
+Transform = Optional[Tuple[str, str]]
+# (destination, delivery method, transform)
+GroupKey = Tuple[str, str, Transform]
+
 async def handle_new_message(event):
     """
     Event handler for new messages.
     """
     # We can inspect event to see if it's incoming, outgoing, etc.
     # By default NewMessage handles incoming.
-    
+    messages_received.inc()
+    messages_in_flight.inc()
+    try:
+        await _process_message(event)
+    finally:
+        messages_in_flight.dec()
+
+async def _process_message(event):
     sender_id = str(event.chat_id)
     # text might be None for media messages without caption
     message_text = event.text or "" 
     message_id = event.id
+
+    # Delay between Telegram timestamping the message and us handling it (1s resolution)
+    date = getattr(event, "date", None)
+    if isinstance(date, datetime):
+        _receive_seconds.observe(max(0.0, (datetime.now(timezone.utc) - date).total_seconds()))
     
     # Simple debug log
     # logger.debug(f"Processing message {message_id} from {sender_id}")
 
-    # Access DB session
-    async for session in get_session():
-        try:
-            # 1. Evaluate rules
-            matching_rules = await rule_engine.get_matching_rules(
-                session, sender_id, message_text
-            )
-            
-            if not matching_rules:
-                # No rules matched
-                return
+    # 1. Evaluate rules from the in-memory index (no database reads on this path)
+    matching_rules = rule_index.match(sender_id, message_text)
+    if not matching_rules:
+        # No rules matched
+        return
 
-            # 2. Process actions
-            for rule in matching_rules:
-                destination = rule.destination
-                delivery_method = rule.delivery_method
-                logger.info(f"Rule '{rule.name}' matched. {delivery_method.capitalize()} to {destination}")
-                
-                try:
-                    # Prepare destination entity (int if numeric string)
-                    dest_entity = destination
-                    if destination.lstrip('-').isdigit():
-                        dest_entity = int(destination)
-                    
-                    if delivery_method == DeliveryMethod.COPY.value:
-                         # Send a copy of the message (new message with same content)
-                         await event.client.send_message(dest_entity, event.message)
-                    else:
-                        # Use forward_messages to preserve media/metadata
-                        await event.client.forward_messages(dest_entity, event.message)
-                    
-                    # Log success
-                    log_entry = Log(
-                        rule_id=rule.id,
-                        source_message_id=message_id,
-                        status="forwarded",
-                        details=f"{delivery_method.capitalize()} to {destination}"
-                    )
-                    session.add(log_entry)
-                    
-                except Exception as e:
-                    logger.error(f"Failed to process rule {rule.id} to {destination}: {e}")
-                    log_entry = Log(
-                        rule_id=rule.id,
-                        source_message_id=message_id,
-                        status="failed",
-                        details=str(e)
-                    )
-                    session.add(log_entry)
-            
-            await session.commit()
-            
-        except Exception as e:
-            logger.error(f"Error inside message handler: {e}")
+    try:
+        # 2. Coalesce rules that deliver to the same destination the same way, so the
+        # destination gets the message once no matter how many of its rules matched.
+        # Rules rewriting the text with AI only coalesce with rules using the same transform.
+        groups: Dict[GroupKey, List[Rule]] = {}
+        for rule in matching_rules:
+            logger.info(f"Rule '{rule.name}' matched. {rule.delivery_method.capitalize()} to {rule.destination}")
+            rule_matches.labels(str(rule.id)).inc()
+            groups.setdefault((rule.destination, rule.delivery_method, _transform_of(rule)), []).append(rule)
+
+        # 3. Drop groups whose destination already got the same content within the dedupe window
+        groups = await _drop_duplicates(event.message, message_text, message_id, groups)
+        if not groups:
+            return
+
+        # 4. Durably queue one delivery per group, in arrival order; the outbox worker
+        # applies AI transforms, sends, retries failures and logs the outcome for every
+        # contributing rule.
+        deliveries = [
+            Delivery(destination, delivery_method, [r.id for r in rules], transform)
+            for (destination, delivery_method, transform), rules in groups.items()
+        ]
+        enqueue_started = time.perf_counter()
+        await outbox.enqueue(event.message, sender_id, message_id, deliveries)
+        _enqueue_seconds.observe(time.perf_counter() - enqueue_started)
         
-        # We only need one session pass
-        break
+    except Exception as e:
+        logger.error(f"Error inside message handler: {e}")
+
+def _transform_of(rule: Rule) -> Transform:
+    config = rule.ai_config or {}
+    instruction = (config.get("systemInstruction") or "").strip()
+    if not config.get("enabled") or not instruction:
+        return None
+    return (config.get("model") or settings.AI_DEFAULT_MODEL, instruction)
+
+def _dedupe_window(rules: List[Rule]) -> float:
+    windows = [settings.DEDUPE_WINDOW_SECONDS if r.dedupe_window is None else r.dedupe_window for r in rules]
+    return max(windows)
+
+async def _drop_duplicates(
+    message, message_text: str, message_id: int, groups: Dict[GroupKey, List[Rule]]
+) -> Dict[GroupKey, List[Rule]]:
+    key: Optional[bytes] = None
+    hashed = False
+    kept: Dict[GroupKey, List[Rule]] = {}
+    for group, rules in groups.items():
+        destination = group[0]
+        window = _dedupe_window(rules)
+        if window > 0:
+            if not hashed:
+                # Only hashed when some rule asks for deduplication
+                key, hashed = content_key(message, message_text), True
+            if key is not None and dedupe_cache.check(destination, key, window):
+                logger.info(f"Message {message_id} is a duplicate for {destination} within {window:g}s, skipping.")
+                for rule in rules:
+                    rule_deliveries.labels(str(rule.id), "duplicate").inc()
+                    await log_sink.record(rule.id, message_id, "duplicate", f"Already sent to {destination} within {window:g}s")
+                continue
+        kept[group] = rules
+    return kept
@@ -0,0 +1,78 @@
+import logging
+from collections import OrderedDict
+from typing import Any, Optional, Tuple, Union
+from telethon import utils
+from telethon.tl.types import Document, InputDocument, InputPhoto, Photo
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+InputFile = Union[InputPhoto, InputDocument]
+
+def media_identity(message: Any) -> Optional[Tuple[str, int]]:
+    """
+    ("photo" | "document", id) of a message's media, which Telegram keeps when the file
+    is forwarded or reposted; None for text, web previews, polls and other media.
+    """
+    for kind, cls in (("photo", Photo), ("document", Document)):
+        item = getattr(message, kind, None)
+        if isinstance(item, cls):
+            return kind, item.id
+    return None
+
+class MediaCache:
+    """
+    Input references (id, access hash, file reference) of media already on Telegram's
+    servers, per account and keyed by media identity, so copies are sent by reference
+    instead of being downloaded and uploaded again.
+
+    File references expire; when a send reports that, the outbox refetches the source
+    message and calls refresh() so every later copy of the file uses the new reference.
+    """
+
+    def __init__(self, max_entries: int = settings.MEDIA_CACHE_SIZE):
+        self.max_entries = max_entries
+        # (account, kind, media id) -> reference usable by that account
+        self._refs: "OrderedDict[Tuple[str, str, int], InputFile]" = OrderedDict()
+        self.hits = 0
+        self.refreshes = 0
+
+    def input_file(self, account: str, message: Any) -> Optional[InputFile]:
+        """
+        Reference for the message's media, preferring one already cached (which may carry
+        a fresher file reference than an old message object).
+        """
+        identity = media_identity(message)
+        if identity is None:
+            return None
+        key = (account, *identity)
+        ref = self._refs.get(key)
+        if ref is not None:
+            self.hits += 1
+            self._refs.move_to_end(key)
+            return ref
+        return self._store(key, message)
+
+    def refresh(self, account: str, message: Any) -> Optional[InputFile]:
+        """
+        Replace the cached reference with the one from a freshly fetched message.
+        """
+        identity = media_identity(message)
+        if identity is None:
+            return None
+        self.refreshes += 1
+        return self._store((account, *identity), message)
+
+    def _store(self, key: Tuple[str, str, int], message: Any) -> InputFile:
+        _, kind, _ = key
+        ref = utils.get_input_photo(message.photo) if kind == "photo" else utils.get_input_document(message.document)
+        self._refs[key] = ref
+        self._refs.move_to_end(key)
+        while len(self._refs) > self.max_entries:
+            self._refs.popitem(last=False)
+        return ref
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+media_cache = MediaCache()
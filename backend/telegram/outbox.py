@@ -0,0 +1,504 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+from sqlalchemy import delete, exists, insert, or_, and_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import select
+from backend.config import settings
+from backend.database import get_session
+from backend.models import Outbox, OutboxStatus, DeliveryMethod
+from backend.services.log_sink import log_sink
+from backend.services.metrics import registry, deliveries, delivery_latency_seconds, rule_deliveries, send_seconds, stage_seconds
+from backend.services.shards import shard_of
+from backend.services.transform import transformer
+from telethon.errors import FileReferenceExpiredError
+from telethon.tl.types import MessageMediaWebPage
+from backend.telegram.delivery import DeliveryDispatcher, delivery_dispatcher
+from backend.telegram.media import MediaCache, media_cache
+from backend.telegram.peers import peer_cache
+from backend.telegram.pool import Account
+from backend.telegram.rate_limiter import DEFAULT_ACCOUNT
+
+logger = logging.getLogger(__name__)
+
+_transform_seconds = stage_seconds.labels("transform")
+
+class Delivery(NamedTuple):
+    """
+    One message delivery to queue: where and how to send it, the rules it is for, and
+    the (model, system instruction) of an AI transform to rewrite the text with, if any.
+    """
+    destination: str
+    delivery_method: str
+    rule_ids: List[int]
+    transform: Optional[Tuple[str, str]] = None
+
+class DeliveryDeferred(Exception):
+    """
+    A send held back because an earlier row for the same destination failed and will be
+    retried; the row goes back to pending without counting an attempt.
+    """
+
+class OutboxWorker:
+    """
+    Durable delivery queue backed by the Outbox table.
+
+    The message handler only evaluates rules and calls enqueue(); rows are inserted by a
+    single writer (group commit, so row ids follow message order) and the handler resumes
+    once they are durable. A claim loop then takes due rows in id order in batches
+    (FOR UPDATE SKIP LOCKED where the database supports it), hands them to the delivery
+    dispatcher, deletes delivered rows, reschedules failures with exponential backoff and
+    dead-letters a row after OUTBOX_MAX_ATTEMPTS.
+
+    Rows for one destination are delivered in id order: while a row waits to be retried,
+    later rows for its destination are neither claimed nor sent (a row that is eventually
+    dead-lettered releases them).
+
+    Rows carry the shard of their source chat. When `shards` is set (by a sharded
+    forwarding worker), only rows of those shards are claimed, so messages from one
+    source are always delivered by the single worker that received them.
+    """
+
+    def __init__(
+        self,
+        dispatcher: DeliveryDispatcher = delivery_dispatcher,
+        batch_size: int = settings.OUTBOX_BATCH_SIZE,
+        max_attempts: int = settings.OUTBOX_MAX_ATTEMPTS,
+        backoff_base: float = settings.OUTBOX_BACKOFF_BASE,
+        backoff_max: float = settings.OUTBOX_BACKOFF_MAX,
+        poll_interval: float = settings.OUTBOX_POLL_INTERVAL,
+        claim_timeout: float = settings.OUTBOX_CLAIM_TIMEOUT,
+        message_cache_size: int = settings.OUTBOX_MESSAGE_CACHE_SIZE,
+        shutdown_timeout: float = settings.OUTBOX_SHUTDOWN_TIMEOUT,
+        media: MediaCache = media_cache,
+    ):
+        self.dispatcher = dispatcher
+        self.media = media
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.message_cache_size = message_cache_size
+        self.shutdown_timeout = shutdown_timeout
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.shards: Optional[FrozenSet[int]] = None  # None claims every shard
+
+        self.client = None
+        self._messages: "OrderedDict[Tuple[str, int], Any]" = OrderedDict()
+        self._in_flight: Set[int] = set()
+        self._completed: List[Tuple[Outbox, Optional[BaseException]]] = []
+        # Last row dispatched per destination, until it is finalized
+        self._last_dispatched: Dict[str, Tuple[Outbox, asyncio.Future]] = {}
+
+        self._pending_writes: List[Tuple[List[Dict[str, Any]], asyncio.Future]] = []
+        self._writer_task: Optional[asyncio.Task] = None
+        self._writer_wakeup: Optional[asyncio.Event] = None
+        self._claim_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._stopping = False
+
+    async def start(self, client) -> None:
+        if self._claim_task is not None:
+            return
+        self.client = client
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._writer_wakeup = asyncio.Event()
+        self._writer_task = asyncio.create_task(self._run_writer())
+        self._claim_task = asyncio.create_task(self._run_claims())
+        logger.info(f"Outbox worker {self.worker_id} started.")
+
+    async def stop(self) -> None:
+        """
+        Stop claiming, let in-flight sends finish, record their outcome and release
+        anything that did not complete so another worker can pick it up.
+        """
+        if self._claim_task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._writer_wakeup.set()
+        await asyncio.gather(self._claim_task, self._writer_task, return_exceptions=True)
+        self._claim_task = None
+        self._writer_task = None
+
+        try:
+            await asyncio.wait_for(self.dispatcher.wait_idle(), timeout=self.shutdown_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Outbox worker {self.worker_id} stopping with {len(self._in_flight)} deliveries unfinished.")
+        await self._finalize()
+        await self._release(self._in_flight)
+        self._last_dispatched.clear()
+        logger.info(f"Outbox worker {self.worker_id} stopped.")
+
+    # --- Enqueue side (message handler) ---
+
+    async def enqueue(
+        self,
+        message: Any,
+        source_chat_id: str,
+        source_message_id: int,
+        deliveries: List[Delivery],
+    ) -> None:
+        """
+        Durably queue one Outbox row per delivery.
+        """
+        self._remember(source_chat_id, source_message_id, message)
+        rows = [
+            {
+                "source_chat_id": source_chat_id,
+                "source_message_id": source_message_id,
+                "shard": shard_of(source_chat_id),
+                "destination": delivery.destination,
+                "delivery_method": delivery.delivery_method,
+                "rule_ids": delivery.rule_ids,
+                "transform": list(delivery.transform) if delivery.transform else None,
+                "status": OutboxStatus.PENDING.value,
+                "attempts": 0,
+                "next_attempt_at": datetime.utcnow(),
+                "created_at": datetime.utcnow(),
+            }
+            for delivery in deliveries
+        ]
+
+        if self._writer_task is None:
+            await self._insert(rows)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending_writes.append((rows, future))
+        self._writer_wakeup.set()
+        await future
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        async for session in get_session():
+            await session.execute(insert(Outbox), rows)
+            await session.commit()
+            break
+
+    async def _run_writer(self) -> None:
+        while True:
+            await self._writer_wakeup.wait()
+            self._writer_wakeup.clear()
+            if self._pending_writes:
+                await self._write_pending()
+            if self._stopping and not self._pending_writes:
+                return
+
+    async def _write_pending(self) -> None:
+        # Everything queued since the last commit goes out in one INSERT, in arrival order
+        writes, self._pending_writes = self._pending_writes, []
+        try:
+            await self._insert([row for rows, _ in writes for row in rows])
+        except Exception as e:
+            logger.error(f"Failed to enqueue {len(writes)} messages to the outbox: {e}")
+            for _, future in writes:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for _, future in writes:
+            if not future.done():
+                future.set_result(None)
+        self._wakeup.set()
+
+    def _remember(self, source_chat_id: str, source_message_id: int, message: Any) -> None:
+        key = (source_chat_id, source_message_id)
+        self._messages[key] = message
+        self._messages.move_to_end(key)
+        while len(self._messages) > self.message_cache_size:
+            self._messages.popitem(last=False)
+
+    # --- Delivery side (claim loop) ---
+
+    async def process_once(self) -> int:
+        """
+        Record finished deliveries, then claim and dispatch one batch of due rows.
+        Returns the number of rows claimed.
+        """
+        await self._finalize()
+        rows = await self._claim()
+        for row in rows:
+            self._dispatch(row)
+        return len(rows)
+
+    async def _run_claims(self) -> None:
+        while not self._stopping:
+            claimed = 0
+            try:
+                claimed = await self.process_once()
+            except Exception as e:
+                logger.error(f"Error inside outbox worker: {e}")
+
+            if claimed >= self.batch_size:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _claim(self) -> List[Outbox]:
+        shards = self.shards
+        if shards is not None and not shards:
+            return []
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=self.claim_timeout)
+        earlier = aliased(Outbox)
+        retrying_before = exists().where(
+            earlier.destination == Outbox.destination,
+            earlier.id < Outbox.id,
+            earlier.status == OutboxStatus.PENDING.value,
+            earlier.next_attempt_at > now,
+        )
+        statement = (
+            select(Outbox)
+            .where(or_(
+                and_(Outbox.status == OutboxStatus.PENDING.value, Outbox.next_attempt_at <= now),
+                and_(Outbox.status == OutboxStatus.IN_FLIGHT.value, Outbox.claimed_at < stale),
+            ))
+            .where(~retrying_before)
+            .order_by(Outbox.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        if shards is not None:
+            statement = statement.where(Outbox.shard.in_(shards))
+
+        claimed = []
+        async for session in get_session():
+            result = await session.execute(statement)
+            for row in result.scalars().all():
+                row.status = OutboxStatus.IN_FLIGHT.value
+                row.claimed_at = now
+                row.claimed_by = self.worker_id
+                # Still being sent by this worker (e.g. parked by a long FloodWait)
+                if row.id in self._in_flight:
+                    continue
+                row.attempts += 1
+                claimed.append(row)
+            await session.commit()
+            break
+        return claimed
+
+    def _dispatch(self, row: Outbox) -> None:
+        self._in_flight.add(row.id)
+        previous = self._last_dispatched.get(row.destination)
+        # Started now so rows of a batch share model calls; awaited in the destination's
+        # lane, so a transformed message never falls behind a later one
+        text = asyncio.ensure_future(self._transform(row)) if row.transform else None
+        future = self.dispatcher.submit(row.destination, lambda account=None: self._send(row, account, previous, text))
+        future.add_done_callback(lambda f: self._on_done(row, f))
+        self._last_dispatched[row.destination] = (row, future)
+
+    def _held_back(self, previous: Optional[Tuple[Outbox, asyncio.Future]]) -> bool:
+        """
+        Whether the row dispatched before this one (same destination, so same lane and
+        already finished) failed in a way that leaves it to be sent again.
+        """
+        if previous is None:
+            return False
+        row, future = previous
+        if not future.done():
+            return False
+        if future.cancelled():
+            return True
+        error = future.exception()
+        if error is None:
+            return False
+        return isinstance(error, DeliveryDeferred) or row.attempts < self.max_attempts
+
+    async def _transform(self, row: Outbox) -> Optional[str]:
+        """
+        The row's text rewritten by its AI transform, or None to send the message unchanged
+        (no text, or the transform failed: the original is delivered rather than lost).
+        """
+        message = self._messages.get((row.source_chat_id, row.source_message_id))
+        try:
+            if message is None:
+                message = await self.client.get_messages(peer_cache.entity(row.source_chat_id), ids=row.source_message_id)
+            text = (message.text if message is not None else None) or ""
+            if not text.strip():
+                return None
+            model, instruction = row.transform
+            started = time.perf_counter()
+            try:
+                return await transformer.transform(model, instruction, text)
+            finally:
+                _transform_seconds.observe(time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"AI transform failed for delivery {row.id}, sending the message unchanged: {e}")
+            return None
+
+    async def _send(
+        self,
+        row: Outbox,
+        account: Optional[Account] = None,
+        previous: Optional[Tuple[Outbox, asyncio.Future]] = None,
+        transformed: Optional[asyncio.Future] = None,
+    ) -> Any:
+        if self._held_back(previous):
+            raise DeliveryDeferred(f"Delivery {previous[0].id} to {row.destination} is waiting to be retried")
+        text = await transformed if transformed is not None else None
+        client = account.client if account is not None else self.client
+        peers = account.peers if account is not None else peer_cache
+        # Resolved ahead of time, so sends do not go through entity resolution
+        dest_entity = peers.entity(row.destination)
+        source_entity = peers.entity(row.source_chat_id)
+
+        # A received message carries the listening account's access hashes, so other
+        # accounts always go by message id
+        message = None
+        if client is self.client:
+            message = self._messages.get((row.source_chat_id, row.source_message_id))
+        # Forwarding cannot change the text, so transformed rows are always copied
+        copy = row.delivery_method == DeliveryMethod.COPY.value or text is not None
+        if copy:
+            if message is None:
+                message = await client.get_messages(source_entity, ids=row.source_message_id)
+                if message is None:
+                    raise ValueError(f"Message {row.source_message_id} no longer exists in {row.source_chat_id}")
+
+        started = time.perf_counter()
+        try:
+            if copy:
+                # Send a copy of the message (new message with same content)
+                account_name = account.name if account is not None else DEFAULT_ACCOUNT
+                try:
+                    return await self._copy(client, dest_entity, message, account_name, text)
+                except FileReferenceExpiredError:
+                    # Refetching the message yields a fresh file reference for this and later copies
+                    message = await client.get_messages(source_entity, ids=row.source_message_id)
+                    if message is None:
+                        raise
+                    self.media.refresh(account_name, message)
+                    if client is self.client:
+                        self._remember(row.source_chat_id, row.source_message_id, message)
+                    return await self._copy(client, dest_entity, message, account_name, text)
+            # Use forward_messages to preserve media/metadata
+            if message is not None:
+                return await client.forward_messages(dest_entity, message)
+            return await client.forward_messages(dest_entity, row.source_message_id, from_peer=source_entity)
+        finally:
+            send_seconds.labels(row.destination, row.delivery_method).observe(time.perf_counter() - started)
+
+    async def _copy(self, client, dest_entity: Any, message: Any, account_name: str, text: Optional[str] = None) -> Any:
+        file = self.media.input_file(account_name, message)
+        if file is None and text is None:
+            return await client.send_message(dest_entity, message)
+        # What send_message(dest, message) keeps besides the content; the original
+        # formatting only applies to the original text
+        extra = {"buttons": message.reply_markup, "silent": message.silent}
+        if file is None:
+            link_preview = isinstance(message.media, MessageMediaWebPage)
+            return await client.send_message(dest_entity, text, link_preview=link_preview, **extra)
+        # Same as send_message(dest, message) for media, but by the cached reference
+        if text is not None:
+            return await client.send_file(dest_entity, file, caption=text, **extra)
+        return await client.send_file(
+            dest_entity, file, caption=message.message, formatting_entities=message.entities, parse_mode=None, **extra
+        )
+
+    def _on_done(self, row: Outbox, future: asyncio.Future) -> None:
+        error = asyncio.CancelledError() if future.cancelled() else future.exception()
+        self._completed.append((row, error))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _finalize(self) -> None:
+        """
+        Delete delivered rows, reschedule or dead-letter failed ones, and log the outcome per rule.
+        """
+        if not self._completed:
+            return
+        completed, self._completed = self._completed, []
+
+        delivered_ids = []
+        failures = []
+        for row, error in completed:
+            if error is None:
+                delivered_ids.append(row.id)
+            else:
+                failures.append((row, error))
+
+        try:
+            async for session in get_session():
+                if delivered_ids:
+                    await session.execute(delete(Outbox).where(Outbox.id.in_(delivered_ids)))
+                for row, error in failures:
+                    await session.execute(update(Outbox).where(Outbox.id == row.id).values(**self._failure_values(row, error)))
+                await session.commit()
+                break
+        except Exception as e:
+            # Keep the outcomes so the next pass retries recording them
+            logger.error(f"Failed to record {len(completed)} outbox results: {e}")
+            self._completed = completed + self._completed
+            return
+
+        now = datetime.utcnow()
+        for row, error in completed:
+            self._in_flight.discard(row.id)
+            if self._last_dispatched.get(row.destination, (None,))[0] is row:
+                del self._last_dispatched[row.destination]
+            if isinstance(error, DeliveryDeferred):
+                logger.debug(f"{error}; delivery {row.id} goes back to pending.")
+            elif error is None:
+                deliveries.labels(row.destination, "delivered").inc()
+                delivery_latency_seconds.labels(row.destination).observe((now - row.created_at).total_seconds())
+                for rule_id in row.rule_ids:
+                    rule_deliveries.labels(str(rule_id), "delivered").inc()
+                    await log_sink.record(
+                        rule_id, row.source_message_id, "forwarded",
+                        f"{row.delivery_method.capitalize()} to {row.destination}"
+                    )
+            elif row.attempts >= self.max_attempts:
+                logger.error(f"Dead-lettering delivery {row.id} to {row.destination} after {row.attempts} attempts: {error}")
+                deliveries.labels(row.destination, "dead").inc()
+                for rule_id in row.rule_ids:
+                    rule_deliveries.labels(str(rule_id), "dead").inc()
+                    await log_sink.record(rule_id, row.source_message_id, "failed", str(error))
+            else:
+                logger.warning(f"Delivery {row.id} to {row.destination} failed (attempt {row.attempts}), retrying: {error}")
+                deliveries.labels(row.destination, "retry").inc()
+
+    def _failure_values(self, row: Outbox, error: BaseException) -> Dict[str, Any]:
+        if isinstance(error, DeliveryDeferred):
+            # Not attempted; claimed again once the earlier row is delivered or dead-lettered
+            return {"status": OutboxStatus.PENDING.value, "claimed_by": None, "attempts": row.attempts - 1}
+        values: Dict[str, Any] = {"last_error": str(error) or type(error).__name__, "claimed_by": None}
+        if row.attempts >= self.max_attempts:
+            values["status"] = OutboxStatus.DEAD.value
+        else:
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (row.attempts - 1)))
+            values["status"] = OutboxStatus.PENDING.value
+            values["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=delay)
+        return values
+
+    async def _release(self, ids: Set[int]) -> None:
+        if not ids:
+            return
+        try:
+            async for session in get_session():
+                await session.execute(
+                    update(Outbox)
+                    .where(Outbox.id.in_(list(ids)), Outbox.claimed_by == self.worker_id)
+                    .values(status=OutboxStatus.PENDING.value, claimed_by=None)
+                )
+                await session.commit()
+                break
+        except Exception as e:
+            logger.error(f"Failed to release {len(ids)} outbox rows: {e}")
+        ids.clear()
+
+outbox = OutboxWorker()
+
+registry.gauge(
+    "tgforwarder_deliveries_in_flight", "Outbox deliveries claimed by this process and not finished yet",
+    callback=lambda: {(): len(outbox._in_flight)},
+)
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from sqlmodel import select
+from telethon.tl.types import (
+    InputPeerChannel, InputPeerChat, InputPeerSelf, InputPeerUser, TypeInputPeer,
+)
+from backend.database import get_session
+from backend.models import ResolvedPeer
+from backend.services.rule_index import rule_index
+from backend.telegram.rate_limiter import DEFAULT_ACCOUNT
+
+logger = logging.getLogger(__name__)
+
+def parse_chat(chat: str) -> Any:
+    """
+    Turn a chat reference from a rule into what Telethon expects: an int for numeric ids,
+    the string itself for usernames and links.
+    """
+    if chat.lstrip('-').isdigit():
+        return int(chat)
+    return chat
+
+def to_input_peer(peer: ResolvedPeer) -> TypeInputPeer:
+    if peer.peer_type == "self":
+        return InputPeerSelf()
+    if peer.peer_type == "user":
+        return InputPeerUser(peer.peer_id, peer.access_hash or 0)
+    if peer.peer_type == "chat":
+        return InputPeerChat(peer.peer_id)
+    return InputPeerChannel(peer.peer_id, peer.access_hash or 0)
+
+def from_input_peer(account: str, chat: str, input_peer: TypeInputPeer) -> Optional[ResolvedPeer]:
+    if isinstance(input_peer, InputPeerSelf):
+        return ResolvedPeer(account=account, chat=chat, peer_type="self", peer_id=0)
+    if isinstance(input_peer, InputPeerUser):
+        return ResolvedPeer(account=account, chat=chat, peer_type="user", peer_id=input_peer.user_id, access_hash=input_peer.access_hash)
+    if isinstance(input_peer, InputPeerChat):
+        return ResolvedPeer(account=account, chat=chat, peer_type="chat", peer_id=input_peer.chat_id)
+    if isinstance(input_peer, InputPeerChannel):
+        return ResolvedPeer(account=account, chat=chat, peer_type="channel", peer_id=input_peer.channel_id, access_hash=input_peer.access_hash)
+    return None
+
+class PeerCache:
+    """
+    Chat reference (as written in a rule) -> InputPeer with its access hash, persisted in
+    the ResolvedPeer table. Access hashes differ between accounts, so every account has
+    its own cache.
+
+    Entries are loaded from the database and any missing ones resolved when the client
+    starts, and again whenever the rule index changes, so the send path only ever does a
+    dictionary lookup. Numeric ids Telethon has never seen cannot be resolved directly;
+    those are retried once after fetching the dialog list.
+    """
+
+    def __init__(self, account: str = DEFAULT_ACCOUNT):
+        self.account = account
+        self.client = None
+        self._peers: Dict[str, TypeInputPeer] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, listener: Callable[[], None]) -> None:
+        """
+        Register a callback run synchronously after newly resolved chats were added.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def get(self, chat: str) -> Optional[TypeInputPeer]:
+        return self._peers.get(chat)
+
+    def entity(self, chat: str) -> Any:
+        """
+        Peer to send to: the cached InputPeer, or the parsed reference when not resolved yet.
+        """
+        peer = self._peers.get(chat)
+        if peer is not None:
+            return peer
+        return parse_chat(chat)
+
+    def __contains__(self, chat: str) -> bool:
+        return chat in self._peers
+
+    def __len__(self) -> int:
+        return len(self._peers)
+
+    async def load(self) -> None:
+        async for session in get_session():
+            result = await session.execute(select(ResolvedPeer).where(ResolvedPeer.account == self.account))
+            self._peers = {peer.chat: to_input_peer(peer) for peer in result.scalars().all()}
+            break
+        logger.info(f"Peer cache for {self.account} loaded: {len(self._peers)} resolved chats")
+
+    async def start(self, client) -> None:
+        self.client = client
+        await self.load()
+        await self.warm(self.chats())
+        rule_index.add_listener(self._on_rules_changed)
+
+    def stop(self) -> None:
+        rule_index.remove_listener(self._on_rules_changed)
+        self.client = None
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    @staticmethod
+    def chats() -> Set[str]:
+        # Sources are needed too: forwarding by id and re-fetching a message use the source peer
+        return set(rule_index.sources()) | rule_index.destinations()
+
+    async def warm(self, chats: Iterable[str]) -> int:
+        """
+        Resolve and persist every chat not already cached. Returns the number newly resolved.
+        """
+        missing = [chat for chat in chats if chat not in self._peers]
+        if not missing or self.client is None:
+            return 0
+
+        resolved: Dict[str, ResolvedPeer] = {}
+        unresolved = await self._resolve(missing, resolved)
+        if unresolved:
+            # Fill Telethon's entity cache with every chat the account is in, then retry
+            try:
+                await self.client.get_dialogs()
+            except Exception as e:
+                logger.error(f"Failed to fetch dialogs while resolving peers: {e}")
+            unresolved = await self._resolve(unresolved, resolved)
+        for chat, error in unresolved.items():
+            logger.warning(f"Could not resolve chat {chat} for {self.account}: {error}")
+
+        if resolved:
+            await self._persist(resolved.values())
+            self._peers = {**self._peers, **{chat: to_input_peer(peer) for chat, peer in resolved.items()}}
+            logger.info(f"Resolved {len(resolved)} chats for {self.account}, {len(unresolved)} unresolved")
+            for listener in self._listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    logger.error(f"Error in peer cache listener: {e}")
+        return len(resolved)
+
+    async def _resolve(self, chats: Iterable[str], resolved: Dict[str, ResolvedPeer]) -> Dict[str, Exception]:
+        unresolved: Dict[str, Exception] = {}
+        for chat in chats:
+            try:
+                peer = from_input_peer(self.account, chat, await self.client.get_input_entity(parse_chat(chat)))
+            except Exception as e:
+                unresolved[chat] = e
+                continue
+            if peer is not None:
+                resolved[chat] = peer
+        return unresolved
+
+    async def _persist(self, peers: Iterable[ResolvedPeer]) -> None:
+        try:
+            async for session in get_session():
+                for peer in peers:
+                    peer.updated_at = datetime.utcnow()
+                    await session.merge(peer)
+                await session.commit()
+                break
+        except Exception as e:
+            # Still usable from memory; they will be resolved and stored again next start
+            logger.error(f"Failed to store resolved peers: {e}")
+
+    def _on_rules_changed(self) -> None:
+        if self.client is None:
+            return
+        if all(chat in self._peers for chat in self.chats()):
+            return
+        if self._refresh_task is not None and not self._refresh_task.done():
+            # The running refresh reads the current rules when it finishes; queue one more pass
+            self._refresh_task.add_done_callback(lambda _: self._on_rules_changed())
+            return
+        self._refresh_task = asyncio.get_running_loop().create_task(self._refresh())
+
+    async def _refresh(self) -> None:
+        try:
+            await self.warm(self.chats())
+        except Exception as e:
+            logger.error(f"Error refreshing peer cache: {e}")
+
+peer_cache = PeerCache()
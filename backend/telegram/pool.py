@@ -0,0 +1,265 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import update
+from sqlmodel import select
+from telethon import TelegramClient
+from telethon.errors import AuthKeyError, FloodError, UnauthorizedError
+from telethon.sessions import StringSession
+from backend.config import settings
+from backend.database import get_session
+from backend.models import Session
+from backend.services.metrics import registry
+from backend.telegram.peers import PeerCache, peer_cache
+from backend.telegram.rate_limiter import DEFAULT_ACCOUNT, RateLimiter, rate_limiter
+
+logger = logging.getLogger(__name__)
+
+class Account:
+    """
+    One logged-in Telegram client in the pool, with its own peer cache and send statistics.
+    """
+
+    def __init__(self, name: str, client: Any, session_id: Optional[int] = None, peers: Optional[PeerCache] = None):
+        self.name = name
+        self.client = client
+        self.session_id = session_id
+        self.peers = peers if peers is not None else PeerCache(name)
+        self.healthy = True
+        self.error: Optional[str] = None
+        self.destinations = 0  # Destinations currently assigned to this account
+        self.in_flight = 0
+        self.sent = 0
+        self.failures = 0  # Consecutive failed sends
+        self.last_used: Optional[datetime] = None
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "session_id": self.session_id,
+            "healthy": self.healthy,
+            "error": self.error,
+            "destinations": self.destinations,
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "failures": self.failures,
+            "last_used": self.last_used.isoformat() if self.last_used else None,
+        }
+
+class ClientPool:
+    """
+    Telegram clients for every active Session row, used to spread deliveries over several
+    accounts so each account's flood limits only cap its share of the traffic.
+
+    Each destination sticks to one account (keeping its per-chat pacing on one account)
+    and is moved to the least loaded healthy account when its account is parked by a
+    FloodWait for that destination or becomes unhealthy. New destinations go to the
+    account with the fewest destinations, then the fewest sends in flight.
+
+    The first healthy account also listens for new messages. Without any Session rows
+    the pool falls back to the single file session 'sessions/bot_session'.
+    """
+
+    def __init__(
+        self,
+        limiter: RateLimiter = rate_limiter,
+        health_interval: float = settings.TELEGRAM_HEALTH_INTERVAL,
+    ):
+        self.limiter = limiter
+        self.health_interval = health_interval
+        self.accounts: Dict[str, Account] = {}
+        self._assigned: Dict[str, Account] = {}
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def listener(self) -> Optional[Account]:
+        return next((a for a in self.accounts.values() if a.healthy), None)
+
+    def add(self, account: Account) -> None:
+        self.accounts[account.name] = account
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    # --- Lifecycle ---
+
+    async def start(self, api_id: str, api_hash: str) -> Optional[Account]:
+        """
+        Connect every active session. Returns the listening account, if any is healthy.
+        """
+        rows: List[Session] = []
+        async for session in get_session():
+            result = await session.execute(select(Session).where(Session.is_active == True).order_by(Session.id))
+            rows = result.scalars().all()
+            break
+
+        # flood_sleep_threshold=0 makes Telethon raise FloodWaitError instead of sleeping inside
+        # the call, so the rate limiter can park just the affected destination
+        if rows:
+            for row in rows:
+                client = TelegramClient(StringSession(row.session_string), api_id, api_hash, flood_sleep_threshold=0)
+                account = Account(f"session-{row.id}", client, session_id=row.id)
+                self.add(account)
+                try:
+                    await client.connect()
+                    if not await client.is_user_authorized():
+                        self._mark_unhealthy(account, "Session is not authorized")
+                except Exception as e:
+                    self._mark_unhealthy(account, str(e))
+        else:
+            client = TelegramClient('sessions/bot_session', api_id, api_hash, flood_sleep_threshold=0)
+            # In a real deployment, we might need to handle authentication differently
+            # e.g., using a bot token or a pre-existing session file.
+            # For user accounts, interactive login is tricky in headless environments.
+            # Assuming the session file 'sessions/bot_session.session' is valid or we can interactive login once.
+            await client.start()
+            self.add(Account(DEFAULT_ACCOUNT, client, peers=peer_cache))
+
+        healthy = sum(1 for a in self.accounts.values() if a.healthy)
+        logger.info(f"Telegram client pool started: {healthy} of {len(self.accounts)} accounts healthy")
+        self._health_task = asyncio.create_task(self._run_health_checks())
+        return self.listener
+
+    async def warm_peers(self) -> None:
+        """
+        Resolve every rule's chats for every healthy account, so deliveries never resolve entities themselves.
+        """
+        for account in self.accounts.values():
+            if account.healthy:
+                await account.peers.start(account.client)
+
+    async def stop(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        await self._persist_last_used()
+        for account in self.accounts.values():
+            account.peers.stop()
+            try:
+                await account.client.disconnect()
+            except Exception as e:
+                logger.error(f"Error disconnecting account {account.name}: {e}")
+        self.accounts = {}
+        self._assigned = {}
+
+    # --- Account selection ---
+
+    def pick(self, destination: str) -> Account:
+        """
+        Account to send the next message to the destination from.
+        """
+        account = self._assigned.get(destination)
+        if account is not None and account.healthy and not self.limiter.parked_for(destination, account.name):
+            return account
+
+        candidates = [a for a in self.accounts.values() if a.healthy]
+        if not candidates:
+            raise RuntimeError("No healthy Telegram account available")
+        best = min(candidates, key=lambda a: (
+            self.limiter.parked_for(destination, a.name),
+            a.destinations - (1 if a is account else 0),
+            a.in_flight,
+        ))
+        if best is not account:
+            if account is not None:
+                account.destinations -= 1
+            best.destinations += 1
+            self._assigned[destination] = best
+        return best
+
+    def sending(self, account: Account) -> None:
+        account.in_flight += 1
+        account.last_used = datetime.utcnow()
+
+    def finished(self, account: Account, error: Optional[BaseException] = None) -> None:
+        """
+        Record the outcome of a send from the account.
+        """
+        account.in_flight -= 1
+        if error is None:
+            account.sent += 1
+            account.failures = 0
+            return
+        if isinstance(error, FloodError):
+            # Handled by parking the destination, says nothing about the account's health
+            return
+        account.failures += 1
+        if isinstance(error, (UnauthorizedError, AuthKeyError)):
+            self._mark_unhealthy(account, str(error))
+
+    def _mark_unhealthy(self, account: Account, error: str) -> None:
+        if account.healthy:
+            logger.error(f"Telegram account {account.name} is unhealthy: {error}")
+        account.healthy = False
+        account.error = error
+
+    def state(self) -> List[Dict[str, Any]]:
+        return [account.state() for account in self.accounts.values()]
+
+    # --- Health checks ---
+
+    async def _run_health_checks(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+                await self._persist_last_used()
+            except Exception as e:
+                logger.error(f"Error inside client pool health check: {e}")
+
+    async def check_health(self) -> None:
+        """
+        Reconnect dropped clients and bring accounts back once they are authorized again.
+        """
+        for account in self.accounts.values():
+            try:
+                if not account.client.is_connected():
+                    await account.client.connect()
+                authorized = await account.client.is_user_authorized()
+            except Exception as e:
+                self._mark_unhealthy(account, str(e))
+                continue
+            if not authorized:
+                self._mark_unhealthy(account, "Session is not authorized")
+            elif not account.healthy:
+                logger.info(f"Telegram account {account.name} is healthy again")
+                account.healthy = True
+                account.error = None
+                account.failures = 0
+                if account.peers.client is None:
+                    await account.peers.start(account.client)
+
+    async def _persist_last_used(self) -> None:
+        used = [a for a in self.accounts.values() if a.session_id is not None and a.last_used is not None]
+        if not used:
+            return
+        try:
+            async for session in get_session():
+                for account in used:
+                    await session.execute(
+                        update(Session).where(Session.id == account.session_id).values(last_used=account.last_used)
+                    )
+                await session.commit()
+                break
+        except Exception as e:
+            logger.error(f"Failed to store account last_used times: {e}")
+
+client_pool = ClientPool()
+
+def _account_states():
+    states = {}
+    for account in list(client_pool.accounts.values()):
+        try:
+            connected = account.client.is_connected()
+        except Exception:
+            connected = False
+        states[(account.name, "connected")] = 1 if connected else 0
+        states[(account.name, "healthy")] = 1 if account.healthy else 0
+    return states
+
+registry.gauge(
+    "tgforwarder_telegram_account_state", "Telethon connection and health state per account (1 or 0)",
+    ("account", "state"), callback=_account_states,
+)
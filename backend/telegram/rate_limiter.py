@@ -0,0 +1,144 @@
+import asyncio
+import time
+import logging
+from typing import Any, Dict
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ACCOUNT = "default"
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, holding at most `capacity`.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        Seconds until one token is available (0 if one is available now).
+        """
+        self._refill(now)
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+class RateLimiter:
+    """
+    Throttles outbound Telegram calls with token buckets per destination and per account.
+
+    A FloodWait reported by Telegram parks only the affected destination, for the account
+    that hit it, until the required time has passed; sends to other destinations (or from
+    other accounts) keep flowing.
+    """
+
+    def __init__(
+        self,
+        destination_rate: float = settings.RATE_LIMIT_DESTINATION_RATE,
+        destination_burst: float = settings.RATE_LIMIT_DESTINATION_BURST,
+        account_rate: float = settings.RATE_LIMIT_ACCOUNT_RATE,
+        account_burst: float = settings.RATE_LIMIT_ACCOUNT_BURST,
+        max_flood_retries: int = settings.RATE_LIMIT_MAX_FLOOD_RETRIES,
+    ):
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self.max_flood_retries = max_flood_retries
+
+        self._destinations: Dict[str, TokenBucket] = {}
+        self._accounts: Dict[str, TokenBucket] = {}
+        self._parked_until: Dict[str, float] = {}
+        self._waiting: Dict[str, int] = {}
+        self.flood_waits = 0
+
+    async def acquire(self, destination: str, account: str = DEFAULT_ACCOUNT) -> None:
+        """
+        Wait until the destination is not parked and both buckets have a token, then take them.
+        """
+        dest_bucket = self._destinations.get(destination)
+        if dest_bucket is None:
+            dest_bucket = self._destinations[destination] = TokenBucket(self.destination_rate, self.destination_burst)
+        account_bucket = self._accounts.get(account)
+        if account_bucket is None:
+            account_bucket = self._accounts[account] = TokenBucket(self.account_rate, self.account_burst)
+
+        self._waiting[destination] = self._waiting.get(destination, 0) + 1
+        try:
+            while True:
+                now = time.monotonic()
+                wait = max(
+                    self._parked_until.get(self._park_key(destination, account), 0.0) - now,
+                    dest_bucket.delay(now),
+                    account_bucket.delay(now),
+                )
+                if wait <= 0:
+                    dest_bucket.take(now)
+                    account_bucket.take(now)
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting[destination] -= 1
+            if not self._waiting[destination]:
+                del self._waiting[destination]
+
+    @staticmethod
+    def _park_key(destination: str, account: str) -> str:
+        if account == DEFAULT_ACCOUNT:
+            return destination
+        return f"{destination}@{account}"
+
+    def park(self, destination: str, seconds: float, account: str = DEFAULT_ACCOUNT) -> None:
+        """
+        Hold all sends from the account to the destination for the given number of seconds.
+        """
+        self.flood_waits += 1
+        key = self._park_key(destination, account)
+        until = time.monotonic() + seconds
+        if until > self._parked_until.get(key, 0.0):
+            self._parked_until[key] = until
+        logger.warning(f"FloodWait: parking destination {key} for {seconds}s")
+
+    def parked_for(self, destination: str, account: str = DEFAULT_ACCOUNT) -> float:
+        return max(0.0, self._parked_until.get(self._park_key(destination, account), 0.0) - time.monotonic())
+
+    def state(self) -> Dict[str, Any]:
+        """
+        Snapshot of the current wait/queue state for inspection through the API.
+        """
+        now = time.monotonic()
+        parked = {}
+        for destination, until in list(self._parked_until.items()):
+            if until > now:
+                parked[destination] = round(until - now, 3)
+            else:
+                del self._parked_until[destination]
+
+        def bucket_state(bucket: TokenBucket) -> Dict[str, float]:
+            bucket._refill(now)
+            return {"tokens": round(bucket.tokens, 3), "rate": bucket.rate, "capacity": bucket.capacity}
+
+        return {
+            "parked_destinations": parked,
+            "waiting": dict(self._waiting),
+            "destinations": {d: bucket_state(b) for d, b in self._destinations.items()},
+            "accounts": {a: bucket_state(b) for a, b in self._accounts.items()},
+            "flood_waits": self.flood_waits,
+        }
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,52 @@
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel
+
+async def make_engine(url="sqlite+aiosqlite:///:memory:"):
+    # In-memory SQLite shares one connection between sessions; tests with concurrent
+    # sessions use a file database so each session gets its own transaction
+    engine = create_async_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool if ":memory:" in url else None,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    return engine
+
+@pytest_asyncio.fixture
+async def engine():
+    """
+    In-memory database with every table.
+    """
+    engine = await make_engine()
+    yield engine
+    await engine.dispose()
+
+@pytest_asyncio.fixture
+async def file_engine(tmp_path):
+    """
+    File database with every table, for tests whose sessions run concurrently.
+    """
+    engine = await make_engine(f"sqlite+aiosqlite:///{tmp_path}/test.db")
+    yield engine
+    await engine.dispose()
+
+@pytest.fixture
+def session_patch(engine):
+    """
+    Patch a module's get_session to open sessions on the in-memory database, or on the
+    one given: `with session_patch("backend.telegram.outbox"): ...`
+    """
+    def session_patch(module, database=None):
+        async_session = sessionmaker(database or engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def mock_get_session():
+            async with async_session() as session:
+                yield session
+        return patch(f"{module}.get_session", side_effect=mock_get_session)
+    return session_patch
@@ -0,0 +1,19 @@
+import json
+from benchmarks.rule_engine import main
+
+def test_rule_engine_benchmark_smoke(tmp_path):
+    output = tmp_path / "results.json"
+    assert main([
+        "--sizes", "5", "--lengths", "short", "--messages", "5",
+        "--budget", "0", "--min-messages", "3", "--output", str(output),
+    ]) == 0
+
+    report = json.loads(output.read_text())
+    cases = {(c["target"], c["mix"]) for c in report["results"]}
+    assert len(cases) == 15
+    # Every path evaluates the same rules, so they agree on what matched
+    by_mix = {}
+    for case in report["results"]:
+        assert case["messages"] == 3
+        by_mix.setdefault(case["mix"], set()).add(case["matches_per_msg"])
+    assert all(len(matches) == 1 for matches in by_mix.values())
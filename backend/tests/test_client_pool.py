@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from telethon.errors import AuthKeyUnregisteredError, FloodWaitError
+from backend.telegram.delivery import DeliveryDispatcher
+from backend.telegram.pool import Account, ClientPool
+from backend.telegram.rate_limiter import RateLimiter
+
+def make_pool(*names):
+    limiter = RateLimiter(destination_rate=1000, destination_burst=10, account_rate=1000, account_burst=10)
+    pool = ClientPool(limiter=limiter)
+    for name in names:
+        pool.add(Account(name, AsyncMock()))
+    return pool
+
+def test_destinations_are_spread_and_sticky():
+    pool = make_pool("a", "b")
+    picked = {dest: pool.pick(dest).name for dest in ["d1", "d2", "d3", "d4"]}
+    assert sorted(picked.values()) == ["a", "a", "b", "b"]
+    # The same destination keeps its account
+    assert all(pool.pick(dest).name == name for dest, name in picked.items())
+
+def test_parked_or_unhealthy_account_is_avoided():
+    pool = make_pool("a", "b")
+    assert pool.pick("d1").name == "a"
+
+    pool.limiter.park("d1", 30, "a")
+    assert pool.pick("d1").name == "b"
+    # Parking is per account, the destination was not parked for b
+    assert pool.limiter.parked_for("d1", "b") == 0
+    assert [a.destinations for a in pool.accounts.values()] == [0, 1]
+
+    account = pool.accounts["b"]
+    pool.sending(account)
+    pool.finished(account, AuthKeyUnregisteredError(None))
+    assert not account.healthy
+    assert account.last_used is not None
+    # Still parked, but the only healthy account left; the limiter holds the send until then
+    assert pool.pick("d1").name == "a"
+
+    pool.accounts["a"].healthy = False
+    with pytest.raises(RuntimeError):
+        pool.pick("d1")
+
+def test_flood_wait_is_not_an_account_failure():
+    pool = make_pool("a")
+    account = pool.accounts["a"]
+    pool.sending(account)
+    pool.finished(account, FloodWaitError(None, capture=5))
+    assert account.healthy
+    assert account.in_flight == 0
+    assert account.failures == 0
+
+@pytest.mark.asyncio
+async def test_dispatcher_sends_from_picked_account_and_fails_over_on_flood():
+    pool = make_pool("a", "b")
+    dispatcher = DeliveryDispatcher(limiter=pool.limiter, pool=pool)
+    used = []
+
+    async def send(account):
+        used.append(account.name)
+        if account.name == "a":
+            raise FloodWaitError(None, capture=30)
+        return account.name
+
+    assert await dispatcher.submit("d1", send) == "b"
+    assert used == ["a", "b"]
+    assert pool.accounts["b"].sent == 1
+    assert pool.limiter.parked_for("d1", "a") > 0
+
+    # Other destinations still go to a
+    async def ok(account):
+        return account.name
+
+    results = await asyncio.gather(*(dispatcher.submit(f"x{i}", ok) for i in range(4)))
+    assert "a" in results
+
+@pytest.mark.asyncio
+async def test_health_check_restores_reauthorized_account():
+    pool = make_pool("a")
+    account = pool.accounts["a"]
+    account.client.is_connected = MagicMock(return_value=False)
+    account.client.is_user_authorized.return_value = False
+
+    await pool.check_health()
+    account.client.connect.assert_called_once()
+    assert not account.healthy
+
+    account.peers = MagicMock(client=object())
+    account.client.is_user_authorized.return_value = True
+    await pool.check_health()
+    assert account.healthy
+    assert account.error is None
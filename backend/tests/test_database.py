@@ -0,0 +1,103 @@
+import pytest
+from unittest.mock import patch
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, select
+from backend.database import ADDED_COLUMNS, _add_missing_columns, _create_missing_indexes, _drop_outdated_caches, async_session, engine_options, get_session
+from backend.config import settings
+from backend.models import Outbox, ResolvedPeer
+from backend.services.rule_index import RuleIndex
+
+def test_sqlite_gets_no_pool_sizing():
+    with patch.object(settings, "DB_ECHO", False):
+        assert engine_options("sqlite+aiosqlite:///./test.db") == {"echo": False}
+
+def test_postgres_pool_and_statement_cache():
+    with patch.object(settings, "DB_POOL_SIZE", 7), patch.object(settings, "DB_STATEMENT_CACHE_SIZE", 0):
+        options = engine_options("postgresql+asyncpg://u:p@db:5432/app")
+    assert options["pool_size"] == 7
+    # No extra round trip per checkout unless asked for
+    assert options["pool_pre_ping"] is False
+    with patch.object(settings, "DB_POOL_PRE_PING", True):
+        assert engine_options("postgresql+asyncpg://u:p@db:5432/app")["pool_pre_ping"] is True
+    assert options["connect_args"] == {"prepared_statement_cache_size": 0}
+
+    # Only the asyncpg driver understands the statement cache argument
+    assert "connect_args" not in engine_options("postgresql+psycopg://u:p@db:5432/app")
+
+@pytest.mark.asyncio
+async def test_sessions_share_one_factory():
+    sessions = []
+    for _ in range(2):
+        async for session in get_session():
+            sessions.append(session)
+            break
+    assert sessions[0] is not sessions[1]
+    assert all(session.bind is async_session.kw["bind"] for session in sessions)
+
+# The rule table as created by the first release
+BASELINE_RULE_TABLE = """
+CREATE TABLE rule (
+    name VARCHAR, source VARCHAR NOT NULL, destination VARCHAR NOT NULL, filters JSON, ai_config JSON,
+    delivery_method VARCHAR NOT NULL, is_active BOOLEAN NOT NULL, id INTEGER NOT NULL,
+    created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL, PRIMARY KEY (id)
+)
+"""
+
+# The outbox table before deliveries were sharded between workers
+FIRST_OUTBOX_TABLE = """
+CREATE TABLE outbox (
+    source_chat_id VARCHAR NOT NULL, source_message_id INTEGER NOT NULL, destination VARCHAR NOT NULL,
+    delivery_method VARCHAR NOT NULL, rule_ids JSON, status VARCHAR NOT NULL, attempts INTEGER NOT NULL,
+    next_attempt_at DATETIME NOT NULL, last_error VARCHAR, id INTEGER NOT NULL, created_at DATETIME NOT NULL,
+    claimed_at DATETIME, claimed_by VARCHAR, PRIMARY KEY (id)
+)
+"""
+
+# The peer cache before it was kept per account
+SINGLE_ACCOUNT_PEER_TABLE = """
+CREATE TABLE resolvedpeer (
+    chat VARCHAR NOT NULL, peer_type VARCHAR NOT NULL, peer_id BIGINT NOT NULL, access_hash BIGINT,
+    updated_at DATETIME NOT NULL, PRIMARY KEY (chat)
+)
+"""
+
+@pytest.mark.asyncio
+async def test_existing_tables_get_new_columns():
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.execute(text(BASELINE_RULE_TABLE))
+        await conn.execute(text(FIRST_OUTBOX_TABLE))
+        await conn.execute(text(SINGLE_ACCOUNT_PEER_TABLE))
+        await conn.execute(text("INSERT INTO resolvedpeer VALUES ('-100456', 'channel', 456, 99, '2025-01-01')"))
+        await conn.run_sync(_drop_outdated_caches)
+        await conn.execute(text(
+            "INSERT INTO outbox (source_chat_id, source_message_id, destination, delivery_method, rule_ids, status, "
+            "attempts, next_attempt_at, id, created_at) VALUES ('-100123', 7, '-100456', 'forward', '[1]', 'pending', 0, "
+            "'2025-01-01', 1, '2025-01-01')"
+        ))
+        await conn.execute(text(
+            "INSERT INTO rule VALUES ('old', '-100123', '-100456', NULL, NULL, 'forward', 1, 1, '2025-01-01', '2025-01-01')"
+        ))
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_create_missing_indexes)
+        # Running again on an up-to-date schema changes nothing
+        await conn.run_sync(_add_missing_columns)
+
+    async with engine.connect() as conn:
+        columns = await conn.run_sync(lambda c: {column["name"] for column in inspect(c).get_columns("rule")})
+    assert {name for table, name in ADDED_COLUMNS if table.name == "rule"} <= columns
+
+    async with AsyncSession(engine) as session:
+        index = RuleIndex()
+        await index.load(session)
+        assert [rule.name for rule in index.get_rules("-100123")] == ["old"]
+        # Rows queued before sharding land in shard 0
+        assert (await session.execute(select(Outbox.shard, Outbox.transform))).all() == [(0, None)]
+        # The peer cache was recreated with the per-account key
+        session.add(ResolvedPeer(account="a", chat="-100456", peer_type="channel", peer_id=456))
+        session.add(ResolvedPeer(account="b", chat="-100456", peer_type="channel", peer_id=456))
+        await session.commit()
+    await engine.dispose()
@@ -0,0 +1,38 @@
+from unittest.mock import MagicMock, patch
+from telethon.tl.types import Document, Photo
+from backend.services.dedupe import DedupeCache, content_key
+
+def test_content_key_normalizes_text_and_uses_media_identity():
+    message = MagicMock(photo=None, document=None)
+    assert content_key(message, "Hello   World\n") == content_key(message, "hello world")
+    assert content_key(message, "hello") != content_key(message, "hello world")
+    assert content_key(message, "  ") is None
+
+    photo = MagicMock(spec=Photo, id=42)
+    with_photo = MagicMock(photo=photo, document=None)
+    other_photo = MagicMock(photo=MagicMock(spec=Photo, id=43), document=None)
+    assert content_key(with_photo, "") is not None
+    assert content_key(with_photo, "caption") != content_key(other_photo, "caption")
+    document = MagicMock(photo=None, document=MagicMock(spec=Document, id=42))
+    assert content_key(document, "") != content_key(with_photo, "")
+
+def test_window_and_destinations():
+    cache = DedupeCache(max_entries=10)
+    with patch('backend.services.dedupe.time.monotonic', return_value=100.0):
+        assert cache.check("a", b"k", 30) is False
+        assert cache.check("a", b"k", 30) is True
+        assert cache.check("b", b"k", 30) is False
+    with patch('backend.services.dedupe.time.monotonic', return_value=131.0):
+        # Past the window: delivered again, and the window restarts
+        assert cache.check("a", b"k", 30) is False
+        assert cache.check("a", b"k", 30) is True
+    assert cache.suppressed == 2
+
+def test_memory_is_bounded():
+    cache = DedupeCache(max_entries=3)
+    for i in range(10):
+        cache.check("a", bytes([i]), 60)
+    assert len(cache) == 3
+    # The oldest entries were evicted
+    assert cache.check("a", bytes([0]), 60) is False
+    assert cache.check("a", bytes([9]), 60) is True
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import pytest
+from telethon.errors import FloodWaitError
+from backend.telegram.delivery import DeliveryDispatcher
+from backend.telegram.rate_limiter import RateLimiter
+
+@pytest.mark.asyncio
+async def test_sends_are_ordered_per_destination():
+    dispatcher = DeliveryDispatcher(max_concurrency=8)
+    delivered = []
+
+    def make_send(destination, message, delay):
+        async def send():
+            await asyncio.sleep(delay)
+            delivered.append((destination, message))
+            return message
+        return send
+
+    # Message A is slower than B on the same destination but must still arrive first
+    futures = [
+        dispatcher.submit("X", make_send("X", "A", 0.02)),
+        dispatcher.submit("Y", make_send("Y", "A", 0.0)),
+        dispatcher.submit("X", make_send("X", "B", 0.0)),
+    ]
+    assert await asyncio.gather(*futures) == ["A", "A", "B"]
+    assert [m for d, m in delivered if d == "X"] == ["A", "B"]
+    # Y did not wait behind X's slow send
+    assert delivered[0] == ("Y", "A")
+    assert dispatcher.pending() == {}
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    dispatcher = DeliveryDispatcher(max_concurrency=2)
+    running = 0
+    peak = 0
+
+    async def send():
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    await asyncio.gather(*(dispatcher.submit(f"dest{i}", send) for i in range(6)))
+    assert peak == 2
+
+@pytest.mark.asyncio
+async def test_failure_is_isolated_to_its_send():
+    dispatcher = DeliveryDispatcher()
+
+    async def fail():
+        raise RuntimeError("flood")
+
+    async def ok():
+        return "sent"
+
+    failed = dispatcher.submit("X", fail)
+    succeeded = dispatcher.submit("X", ok)
+    with pytest.raises(RuntimeError):
+        await failed
+    assert await succeeded == "sent"
+
+@pytest.mark.asyncio
+async def test_flood_wait_parks_only_that_destination():
+    limiter = RateLimiter(destination_rate=1000, destination_burst=10, account_rate=1000, account_burst=10)
+    dispatcher = DeliveryDispatcher(limiter=limiter)
+    attempts = {"X": 0}
+    delivered = []
+
+    async def flooded():
+        attempts["X"] += 1
+        if attempts["X"] == 1:
+            raise FloodWaitError(None, capture=0)
+        delivered.append("X")
+        return "X"
+
+    async def other():
+        delivered.append("Y")
+        return "Y"
+
+    x = dispatcher.submit("X", flooded)
+    y = dispatcher.submit("Y", other)
+    assert await asyncio.gather(x, y) == ["X", "Y"]
+    assert attempts["X"] == 2
+    assert limiter.flood_waits == 1
+
+@pytest.mark.asyncio
+async def test_token_bucket_throttles_destination():
+    limiter = RateLimiter(destination_rate=50, destination_burst=1, account_rate=1000, account_burst=100)
+    start = time.monotonic()
+    for _ in range(4):
+        await limiter.acquire("X")
+    # First token is free, the next three wait ~20ms each
+    assert time.monotonic() - start >= 0.05
+
+    limiter.park("Y", 5)
+    state = limiter.state()
+    assert 0 < state["parked_destinations"]["Y"] <= 5
+    assert "X" in state["destinations"]
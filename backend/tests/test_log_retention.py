@@ -0,0 +1,66 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from backend.models import Log, LogRollup
+from backend.services.log_retention import LogRetention
+from backend.services.log_rollup import add_rollups, rollup_counts
+
+NOW = datetime(2026, 3, 10, 12, 30)
+
+def records(start, count, rule_id=1, status="forwarded"):
+    return [
+        {"rule_id": rule_id, "source_message_id": i, "status": status, "details": None,
+         "timestamp": start + timedelta(minutes=i)}
+        for i in range(count)
+    ]
+
+async def rollups(engine):
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(LogRollup))
+        return {(r.hour, r.rule_id, r.status): r.count for r in result.scalars().all()}
+
+@pytest.mark.asyncio
+async def test_expired_hours_are_compacted_then_deleted(engine, session_patch):
+    old = datetime(2026, 3, 1, 8, 0)
+    # Written before rollups were maintained: raw rows only
+    legacy = records(old, 5) + records(old, 2, rule_id=None, status="failed")
+    # Written by the log sink: raw rows plus incremental rollups
+    current = records(old + timedelta(hours=1), 3, rule_id=2)
+    recent = records(NOW - timedelta(days=1), 4)
+    async with AsyncSession(engine) as session:
+        await session.execute(insert(Log), legacy + current + recent)
+        await add_rollups(session, rollup_counts(current + recent))
+        await session.commit()
+
+    retention = LogRetention(retention_days=7, interval=60, max_chunks=10)
+    with session_patch("backend.services.log_retention"):
+        assert await retention.run_once(now=NOW) == 10
+        assert await retention.run_once(now=NOW) == 0
+
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(Log))
+        remaining = result.scalars().all()
+    assert len(remaining) == 4 and all(r.timestamp >= NOW - timedelta(days=7) for r in remaining)
+
+    counts = await rollups(engine)
+    assert counts[(old, 1, "forwarded")] == 5
+    assert counts[(old, 0, "failed")] == 2
+    # Recomputed from the raw rows, not added to the incremental counts
+    assert counts[(old + timedelta(hours=1), 2, "forwarded")] == 3
+
+@pytest.mark.asyncio
+async def test_chunks_per_run_are_bounded(engine, session_patch):
+    old = datetime(2026, 2, 1, 0, 0)
+    async with AsyncSession(engine) as session:
+        for hour in range(3):
+            await session.execute(insert(Log), records(old + timedelta(hours=hour), 2))
+        await session.commit()
+
+    retention = LogRetention(retention_days=7, interval=60, max_chunks=2)
+    with session_patch("backend.services.log_retention"):
+        assert await retention.run_once(now=NOW) == 4
+        assert await retention.run_once(now=NOW) == 2
+    assert retention.deleted == 6
+    assert len(await rollups(engine)) == 3
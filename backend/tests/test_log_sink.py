@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from backend.models import Log, LogRollup
+from backend.services.log_sink import LogSink
+
+async def count_logs(engine):
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(Log))
+        return result.scalars().all()
+
+@pytest.mark.asyncio
+async def test_flush_writes_batches(engine, session_patch):
+    sink = LogSink(max_size=100, batch_size=3, flush_interval=60)
+    with session_patch("backend.services.log_sink"):
+        for i in range(7):
+            await sink.record(1, i, "forwarded", "Forward to 1")
+        assert sink.pending() == 7
+
+        assert await sink.flush() == 7
+        assert sink.pending() == 0
+
+    rows = await count_logs(engine)
+    assert sorted(r.source_message_id for r in rows) == list(range(7))
+    assert all(r.timestamp is not None for r in rows)
+
+@pytest.mark.asyncio
+async def test_drop_policy_bounds_memory():
+    sink = LogSink(max_size=2, batch_size=10, flush_interval=60, full_policy="drop")
+    for i in range(5):
+        await sink.record(1, i, "forwarded")
+    assert sink.pending() == 2
+    assert sink.dropped == 3
+
+@pytest.mark.asyncio
+async def test_stop_drains_buffer(engine, session_patch):
+    sink = LogSink(max_size=100, batch_size=50, flush_interval=60, full_policy="block")
+    with session_patch("backend.services.log_sink"):
+        await sink.start()
+        for i in range(10):
+            await sink.record(2, i, "failed", "boom")
+        await sink.stop()
+
+    assert sink.pending() == 0
+    assert len(await count_logs(engine)) == 10
+
+@pytest.mark.asyncio
+async def test_block_policy_waits_for_flush(engine, session_patch):
+    sink = LogSink(max_size=2, batch_size=2, flush_interval=60, full_policy="block")
+    with session_patch("backend.services.log_sink"):
+        await sink.start()
+        for i in range(6):
+            await sink.record(3, i, "forwarded")
+        await sink.stop()
+
+    assert sink.dropped == 0
+    assert len(await count_logs(engine)) == 6
+
+@pytest.mark.asyncio
+async def test_flush_updates_hourly_rollups(engine, session_patch):
+    sink = LogSink(max_size=100, batch_size=2, flush_interval=60)
+    with session_patch("backend.services.log_sink"):
+        for i in range(5):
+            await sink.record(1, i, "forwarded")
+        await sink.record(2, 9, "failed", "boom")
+        await sink.record(None, 10, "failed")
+        await sink.flush()
+        # A later flush in the same hour adds to the existing counts
+        await sink.record(1, 11, "forwarded")
+        await sink.flush()
+
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(LogRollup))
+        counts = {(r.rule_id, r.status): r.count for r in result.scalars().all()}
+    assert counts == {(1, "forwarded"): 6, (2, "failed"): 1, (0, "failed"): 1}
@@ -0,0 +1,32 @@
+from unittest.mock import MagicMock
+from telethon.tl.types import Document, InputPhoto, Photo
+from backend.telegram.media import MediaCache, media_identity
+
+def photo(file_reference=b"ref", photo_id=1):
+    return Photo(id=photo_id, access_hash=2, file_reference=file_reference, date=None, sizes=[], dc_id=2)
+
+def test_media_identity():
+    assert media_identity(MagicMock(photo=photo(), document=None)) == ("photo", 1)
+    document = Document(id=9, access_hash=2, file_reference=b"", date=None, mime_type="video/mp4", size=1, dc_id=2, attributes=[])
+    assert media_identity(MagicMock(photo=None, document=document)) == ("document", 9)
+    assert media_identity(MagicMock(photo=None, document=None)) is None
+
+def test_references_are_cached_per_account_and_refreshed():
+    cache = MediaCache(max_entries=10)
+    old = MagicMock(photo=photo(b"old"), document=None)
+    assert cache.input_file("a", old) == InputPhoto(id=1, access_hash=2, file_reference=b"old")
+    assert cache.input_file("b", old) is not None
+    assert len(cache) == 2
+
+    cache.refresh("a", MagicMock(photo=photo(b"new"), document=None))
+    # An old message object for the same file now resolves to the fresh reference
+    assert cache.input_file("a", old).file_reference == b"new"
+    assert cache.input_file("b", old).file_reference == b"old"
+    assert cache.hits == 2
+    assert cache.input_file("a", MagicMock(photo=None, document=None)) is None
+
+def test_cache_is_bounded():
+    cache = MediaCache(max_entries=2)
+    for i in range(5):
+        cache.input_file("a", MagicMock(photo=photo(photo_id=i), document=None))
+    assert len(cache) == 2
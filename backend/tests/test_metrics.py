@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from backend.services.metrics import Registry, rule_matches, stage_seconds
+from backend.services.rule_index import RuleIndex
+from backend.models import Rule
+
+def test_render_counter_gauge_and_histogram():
+    registry = Registry()
+    sent = registry.counter("sent_total", "Sends", ("destination",))
+    sent.labels('a "quoted"\nchat').inc()
+    sent.labels("b").inc(2)
+    registry.gauge("queue", "Queue depth", callback=lambda: {(): 3})
+    # Totals kept by a component are read at scrape time but still exposed as counters
+    registry.counter("hits_total", "Hits", callback=lambda: {(): 4})
+    latency = registry.histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+    child = latency.labels("send")
+    for value in (0.05, 0.1, 0.5, 5):
+        child.observe(value)
+
+    lines = registry.render().splitlines()
+    assert "# TYPE sent_total counter" in lines
+    assert 'sent_total{destination="a \\"quoted\\"\\nchat"} 1' in lines
+    assert 'sent_total{destination="b"} 2' in lines
+    assert "queue 3" in lines
+    assert "# TYPE hits_total counter" in lines and "hits_total 4" in lines
+    # Buckets are cumulative and le is inclusive
+    assert 'latency_seconds_bucket{stage="send",le="0.1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="send",le="1"} 3' in lines
+    assert 'latency_seconds_bucket{stage="send",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{stage="send"} 4' in lines
+    assert 'latency_seconds_sum{stage="send"} 5.65' in lines
+
+    with pytest.raises(ValueError):
+        registry.counter("sent_total", "Duplicate")
+
+def test_failing_callback_is_skipped():
+    registry = Registry()
+    registry.gauge("broken", "Broken", callback=lambda: 1 / 0)
+    registry.counter("ok_total", "Fine").inc()
+    assert "ok_total 1" in registry.render().splitlines()
+
+def test_rule_index_records_stages():
+    index = RuleIndex()
+    index.upsert(Rule(id=1, name="A", source="s", destination="d"))
+    before = stage_seconds.labels("evaluate").count
+    lookups = stage_seconds.labels("lookup").count
+    assert [r.id for r in index.match("s", "hello")] == [1]
+    index.match("other", "hello")
+    assert stage_seconds.labels("evaluate").count == before + 1
+    assert stage_seconds.labels("lookup").count == lookups + 2
+
+@pytest.mark.asyncio
+async def test_worker_serves_metrics():
+    from backend.worker import serve_metrics
+    rule_matches.labels("metrics-test").inc()
+    server = await asyncio.start_server(serve_metrics, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+        await writer.drain()
+        response = (await reader.read()).decode()
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+    assert response.startswith("HTTP/1.1 200 OK")
+    assert 'tgforwarder_rule_matches_total{rule="metrics-test"} 1' in response
@@ -0,0 +1,229 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from backend.models import Outbox, OutboxStatus
+from telethon.errors import FileReferenceExpiredError
+from telethon.tl.types import MessageMediaWebPage, Photo, ReplyInlineMarkup, WebPageEmpty
+from backend.telegram.delivery import DeliveryDispatcher
+from backend.telegram.media import MediaCache
+from backend.telegram.outbox import Delivery, OutboxWorker
+
+async def outbox_rows(engine):
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(Outbox).order_by(Outbox.id))
+        return result.scalars().all()
+
+def make_worker(**kwargs):
+    kwargs.setdefault("media", MediaCache())
+    worker = OutboxWorker(dispatcher=DeliveryDispatcher(), **kwargs)
+    worker.client = AsyncMock()
+    return worker
+
+async def run_pass(worker):
+    claimed = await worker.process_once()
+    await worker.dispatcher.wait_idle()
+    await worker._finalize()
+    return claimed
+
+@pytest.mark.asyncio
+async def test_delivered_rows_are_removed_and_logged(engine, session_patch):
+    worker = make_worker()
+    log_sink = MagicMock()
+    log_sink.record = AsyncMock()
+    message = MagicMock()
+
+    with session_patch("backend.telegram.outbox"), patch('backend.telegram.outbox.log_sink', log_sink):
+        await worker.enqueue(message, "-100123", 7, [Delivery("67890", "forward", [1, 2]), Delivery("@copies", "copy", [3])])
+        assert len(await outbox_rows(engine)) == 2
+
+        assert await run_pass(worker) == 2
+
+    worker.client.forward_messages.assert_called_once_with(67890, message)
+    worker.client.send_message.assert_called_once_with("@copies", message)
+    assert await outbox_rows(engine) == []
+    logged = sorted((c.args[0], c.args[2]) for c in log_sink.record.call_args_list)
+    assert logged == [(1, "forwarded"), (2, "forwarded"), (3, "forwarded")]
+
+def photo_message(file_reference):
+    photo = Photo(id=5, access_hash=6, file_reference=file_reference, date=None, sizes=[], dc_id=2)
+    return MagicMock(photo=photo, document=None, message="caption", entities=None, reply_markup=None, silent=False)
+
+@pytest.mark.asyncio
+async def test_copies_reuse_media_reference_and_refresh_expired_ones(engine, session_patch):
+    worker = make_worker()
+    fresh = photo_message(b"new")
+    worker.client.get_messages.return_value = fresh
+
+    async def send_file(entity, file, **kwargs):
+        if file.file_reference != b"new":
+            raise FileReferenceExpiredError(request=None)
+    worker.client.send_file.side_effect = send_file
+
+    with session_patch("backend.telegram.outbox"), patch('backend.telegram.outbox.log_sink', MagicMock(record=AsyncMock())):
+        await worker.enqueue(photo_message(b"old"), "-100123", 7, [Delivery("1", "copy", [1]), Delivery("2", "copy", [2])])
+        await run_pass(worker)
+        assert await outbox_rows(engine) == []
+
+        # The refreshed reference is used straight away for the next copy of the file
+        worker.client.get_messages.reset_mock()
+        await worker.enqueue(photo_message(b"old"), "-100123", 8, [Delivery("3", "copy", [3])])
+        await run_pass(worker)
+
+    worker.client.get_messages.assert_not_called()
+    sent = [(c.args[0], c.args[1].file_reference) for c in worker.client.send_file.call_args_list if c.args[1].file_reference == b"new"]
+    assert sorted(sent) == [(1, b"new"), (2, b"new"), (3, b"new")]
+    assert worker.client.send_file.call_args.kwargs == {
+        "caption": "caption", "formatting_entities": None, "parse_mode": None, "buttons": None, "silent": False
+    }
+    worker.client.send_message.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_transformed_text_is_sent_as_a_copy(engine, session_patch):
+    worker = make_worker()
+    markup = ReplyInlineMarkup(rows=[])
+    message = MagicMock(
+        photo=None, document=None, text="Hallo", reply_markup=markup, silent=True,
+        media=MessageMediaWebPage(webpage=WebPageEmpty(id=1)),
+    )
+    transformer = MagicMock(transform=AsyncMock(side_effect=["Hello", RuntimeError("quota")]))
+
+    with session_patch("backend.telegram.outbox"), patch('backend.telegram.outbox.log_sink', MagicMock(record=AsyncMock())), \
+         patch('backend.telegram.outbox.transformer', transformer):
+        await worker.enqueue(message, "-100123", 7, [Delivery("1", "forward", [1], ("m1", "Translate"))])
+        assert (await outbox_rows(engine))[0].transform == ["m1", "Translate"]
+        await run_pass(worker)
+
+        # A failing transform delivers the message unchanged
+        await worker.enqueue(message, "-100123", 8, [Delivery("1", "forward", [1], ("m1", "Translate"))])
+        await run_pass(worker)
+
+    transformer.transform.assert_called_with("m1", "Translate", "Hallo")
+    # Buttons and the link preview survive the new text
+    worker.client.send_message.assert_called_once_with(1, "Hello", link_preview=True, buttons=markup, silent=True)
+    worker.client.forward_messages.assert_called_once_with(1, message)
+
+@pytest.mark.asyncio
+async def test_slow_transform_keeps_its_place_before_later_messages(engine, session_patch):
+    worker = make_worker()
+    sent = []
+    async def transform(model, instruction, text):
+        await asyncio.sleep(0.1)
+        return text.upper()
+    worker.client.send_message.side_effect = lambda destination, text, **kwargs: sent.append(text)
+    worker.client.forward_messages.side_effect = lambda destination, message: sent.append(message.text)
+
+    with session_patch("backend.telegram.outbox"), patch('backend.telegram.outbox.log_sink', MagicMock(record=AsyncMock())), \
+         patch('backend.telegram.outbox.transformer', MagicMock(transform=transform)):
+        await worker.enqueue(MagicMock(text="first", photo=None, document=None), "1", 1, [Delivery("9", "forward", [1], ("m", "shout"))])
+        await worker.enqueue(MagicMock(text="second"), "1", 2, [Delivery("9", "forward", [2])])
+        assert await run_pass(worker) == 2
+
+    assert sent == ["FIRST", "second"]
+
+@pytest.mark.asyncio
+async def test_uncached_message_is_fetched_or_forwarded_by_id(engine, session_patch):
+    worker = make_worker(message_cache_size=0)
+    fetched = MagicMock()
+    worker.client.get_messages.return_value = fetched
+
+    with session_patch("backend.telegram.outbox"), patch('backend.telegram.outbox.log_sink', MagicMock(record=AsyncMock())):
+        await worker.enqueue(MagicMock(), "-100123", 7, [Delivery("1", "forward", [1]), Delivery("2", "copy", [2])])
+        await run_pass(worker)
+
+    worker.client.forward_messages.assert_called_once_with(1, 7, from_peer=-100123)
+    worker.client.get_messages.assert_called_once_with(-100123, ids=7)
+    worker.client.send_message.assert_called_once_with(2, fetched)
+
+@pytest.mark.asyncio
+async def test_failures_retry_with_backoff_then_dead_letter(engine, session_patch):
+    worker = make_worker(max_attempts=2, backoff_base=0)
+    worker.client.forward_messages.side_effect = Exception("chat not found")
+    log_sink = MagicMock()
+    log_sink.record = AsyncMock()
+
+    with session_patch("backend.telegram.outbox"), patch('backend.telegram.outbox.log_sink', log_sink):
+        await worker.enqueue(MagicMock(), "1", 7, [Delivery("67890", "forward", [1])])
+
+        await run_pass(worker)
+        [row] = await outbox_rows(engine)
+        assert row.status == OutboxStatus.PENDING.value
+        assert row.attempts == 1
+        assert row.last_error == "chat not found"
+        log_sink.record.assert_not_called()
+
+        await run_pass(worker)
+        [row] = await outbox_rows(engine)
+        assert row.status == OutboxStatus.DEAD.value
+        assert row.attempts == 2
+        log_sink.record.assert_called_once_with(1, 7, "failed", "chat not found")
+
+        # Dead-lettered rows are never claimed again
+        assert await run_pass(worker) == 0
+
+@pytest.mark.asyncio
+async def test_backoff_delays_next_claim(engine, session_patch):
+    worker = make_worker(backoff_base=60)
+    worker.client.forward_messages.side_effect = Exception("timeout")
+
+    with session_patch("backend.telegram.outbox"), patch('backend.telegram.outbox.log_sink', MagicMock(record=AsyncMock())):
+        await worker.enqueue(MagicMock(), "1", 7, [Delivery("67890", "forward", [1])])
+        assert await run_pass(worker) == 1
+        assert await run_pass(worker) == 0
+
+@pytest.mark.asyncio
+async def test_rows_wait_for_an_earlier_row_being_retried(engine, session_patch):
+    worker = make_worker(backoff_base=60)
+    sent = []
+    async def forward(destination, message):
+        if message == "first" and not sent:
+            sent.append("failed")
+            raise Exception("timeout")
+        sent.append(message)
+    worker.client.forward_messages.side_effect = forward
+
+    with session_patch("backend.telegram.outbox"), patch('backend.telegram.outbox.log_sink', MagicMock(record=AsyncMock())):
+        await worker.enqueue("first", "1", 7, [Delivery("67890", "forward", [1])])
+        await worker.enqueue("second", "1", 8, [Delivery("67890", "forward", [1]), Delivery("@other", "forward", [2])])
+
+        # The second row was in the same batch, so it is held back rather than sent;
+        # other destinations are not affected
+        assert await run_pass(worker) == 3
+        assert sent == ["failed", "second"]
+        first, second = await outbox_rows(engine)
+        assert (first.status, first.attempts) == (OutboxStatus.PENDING.value, 1)
+        assert (second.destination, second.status, second.attempts) == ("67890", OutboxStatus.PENDING.value, 0)
+
+        # Nor is it claimed while the first row waits out its backoff
+        assert await run_pass(worker) == 0
+
+        async with AsyncSession(engine) as session:
+            row = await session.get(Outbox, first.id)
+            row.next_attempt_at = second.next_attempt_at
+            await session.commit()
+        assert await run_pass(worker) == 2
+        assert sent == ["failed", "second", "first", "second"]
+        assert await outbox_rows(engine) == []
+
+@pytest.mark.asyncio
+async def test_started_worker_delivers_and_drains_on_stop(file_engine, session_patch):
+    worker = OutboxWorker(dispatcher=DeliveryDispatcher(), poll_interval=0.01)
+    client = AsyncMock()
+    log_sink = MagicMock()
+    log_sink.record = AsyncMock()
+
+    with session_patch("backend.telegram.outbox", file_engine), patch('backend.telegram.outbox.log_sink', log_sink):
+        await worker.start(client)
+        for message_id in range(5):
+            await worker.enqueue(MagicMock(), "1", message_id, [Delivery("67890", "forward", [1])])
+        # Rows still unclaimed at stop() stay pending for the next start, so let the loop pick them all up
+        for _ in range(200):
+            if client.forward_messages.call_count == 5:
+                break
+            await asyncio.sleep(0.01)
+        await worker.stop()
+
+    assert client.forward_messages.call_count == 5
+    assert await outbox_rows(file_engine) == []
+    assert [c.args[1] for c in log_sink.record.call_args_list] == [0, 1, 2, 3, 4]
@@ -0,0 +1,88 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from telethon.tl.types import InputPeerChannel, InputPeerUser
+from backend.models import ResolvedPeer
+from backend.telegram.peers import PeerCache
+
+@pytest.mark.asyncio
+async def test_warm_resolves_persists_and_reloads(engine, session_patch):
+    client = AsyncMock()
+    peers = {
+        "@news": InputPeerChannel(channel_id=1, access_hash=11),
+        -100123: InputPeerChannel(channel_id=123, access_hash=22),
+    }
+    seen_dialogs = False
+
+    async def get_input_entity(chat):
+        # Numeric ids only resolve once the dialogs have been fetched
+        if isinstance(chat, int) and not seen_dialogs:
+            raise ValueError("Could not find the input entity")
+        return peers[chat]
+
+    async def get_dialogs():
+        nonlocal seen_dialogs
+        seen_dialogs = True
+
+    client.get_input_entity.side_effect = get_input_entity
+    client.get_dialogs.side_effect = get_dialogs
+
+    cache = PeerCache()
+    cache.client = client
+    with session_patch("backend.telegram.peers"):
+        assert await cache.warm(["@news", "-100123"]) == 2
+        client.get_dialogs.assert_called_once()
+        assert cache.entity("@news") == peers["@news"]
+        assert cache.entity("-100123") == peers[-100123]
+
+        # Already cached chats are not resolved again
+        client.get_input_entity.reset_mock()
+        assert await cache.warm(["@news"]) == 0
+        client.get_input_entity.assert_not_called()
+
+        reloaded = PeerCache()
+        await reloaded.load()
+
+    assert reloaded.get("-100123") == InputPeerChannel(channel_id=123, access_hash=22)
+    async with AsyncSession(engine) as session:
+        result = await session.execute(select(ResolvedPeer).order_by(ResolvedPeer.chat))
+        assert [(p.chat, p.peer_type, p.peer_id) for p in result.scalars().all()] == [
+            ("-100123", "channel", 123),
+            ("@news", "channel", 1),
+        ]
+
+@pytest.mark.asyncio
+async def test_unresolved_chat_falls_back_to_reference(engine, session_patch):
+    client = AsyncMock()
+    client.get_input_entity.side_effect = ValueError("Cannot find any entity")
+
+    cache = PeerCache()
+    cache.client = client
+    with session_patch("backend.telegram.peers"):
+        assert await cache.warm(["@gone", "555"]) == 0
+
+    assert "@gone" not in cache
+    assert cache.entity("@gone") == "@gone"
+    assert cache.entity("555") == 555
+
+@pytest.mark.asyncio
+async def test_outbox_sends_to_cached_peer():
+    from backend.telegram.outbox import OutboxWorker
+    from backend.telegram.delivery import DeliveryDispatcher
+    from backend.models import Outbox
+
+    cache = PeerCache()
+    user = InputPeerUser(user_id=42, access_hash=99)
+    cache._peers = {"@friend": user}
+    worker = OutboxWorker(dispatcher=DeliveryDispatcher())
+    worker.client = AsyncMock()
+    row = Outbox(
+        id=1, source_chat_id="-100123", source_message_id=7, destination="@friend",
+        delivery_method="forward", rule_ids=[1],
+    )
+
+    with patch('backend.telegram.outbox.peer_cache', cache):
+        await worker._send(row)
+
+    worker.client.forward_messages.assert_called_once_with(user, 7, from_peer=-100123)
@@ -0,0 +1,75 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.models import Rule
+from backend.services.regex_guard import RegexGuard, check_pattern, validate_filters
+from backend.services.rule_engine import CompiledRuleSet, RuleEngine
+
+def regex(pattern):
+    return {"type": "condition", "condition": "regex", "value": pattern}
+
+def test_check_pattern():
+    assert check_pattern(r"\bbtc\w*\s+\d{2,4}") is None
+    assert check_pattern(r"(?:ab|cd){1,3}x+") is None
+    assert "Invalid" in check_pattern("(unclosed")
+    assert "nested quantifiers" in check_pattern(r"(a+)+$")
+    assert "nested quantifiers" in check_pattern(r"^(\w+\s?)*$")
+    assert "nested quantifiers" in check_pattern(r"(x|(?:y*))+")
+    assert "overlapping alternatives" in check_pattern(r"^(a|a)*$")
+    assert "overlapping alternatives" in check_pattern(r"(a|aa)+$")
+    assert "overlapping alternatives" in check_pattern(r"(?:\w|ab)+$")
+    assert "overlapping alternatives" in check_pattern(r"(?:x(?:ab|\w))*")
+    # Branches that start differently, or single characters the parser merges into one set
+    assert check_pattern(r"(?:foo|bar)+") is None
+    assert check_pattern(r"(?:ab|a)*c") is None
+    assert check_pattern(r"(\w|\d)+") is None
+    assert "backreferences" in check_pattern(r"(a)\1")
+    assert "longer than" in check_pattern("a" * 10000)
+    assert check_pattern(5) is not None
+
+def test_validate_filters_walks_trees_and_legacy_filters():
+    tree = {"type": "group", "operator": "OR", "children": [
+        {"type": "condition", "condition": "contains", "value": "(a+)+"},
+        {"type": "group", "operator": "AND", "children": [regex("ok"), regex("(a*)*")]},
+    ]}
+    problems = validate_filters(tree)
+    assert len(problems) == 1 and "(a*)*" in problems[0]
+    assert validate_filters({"keywords": ["x"], "regex": "["}) != []
+    assert validate_filters(None) == []
+
+def test_regex_rules_share_the_message_budget():
+    rules = [Rule(id=i, name=str(i), source="s", destination="d", filters=regex("a")) for i in (1, 2)]
+    plain = Rule(id=3, name="3", source="s", destination="d", filters={"keywords": ["a"]})
+    rule_set = CompiledRuleSet(tuple(RuleEngine.compile_rule(r) for r in rules + [plain]))
+    guard = RegexGuard(budget=0, max_strikes=100)
+
+    with patch('backend.services.rule_engine.regex_guard', guard):
+        matched = rule_set.match("a")
+    # The first regex rule spent the (zero) budget; the second is skipped, plain keywords are not
+    assert [r.id for r in matched] == [1, 3]
+    assert guard.strikes == {1: 1}
+
+@pytest.mark.asyncio
+async def test_rule_is_disabled_after_max_strikes(engine, session_patch):
+    rule = Rule(name="slow", source="s", destination="d", filters=regex("a"))
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add(rule)
+        await session.commit()
+
+    guard = RegexGuard(budget=0.01, max_strikes=2)
+    removed = []
+    guard.add_listener(removed.append)
+    with session_patch("backend.services.regex_guard"):
+        guard.strike(rule, 0.5)
+        assert removed == []
+        guard.strike(rule, 0.5)
+        # Further strikes while the rule is being disabled are ignored
+        guard.strike(rule, 0.5)
+        await asyncio.gather(*guard._tasks)
+
+    assert removed == [rule.id]
+    async with AsyncSession(engine) as session:
+        stored = await session.get(Rule, rule.id)
+    assert stored.is_active is False
+    assert "exceeded 10ms" in stored.disabled_reason
@@ -0,0 +1,106 @@
+import random
+import pytest
+from backend.services.rule_engine import RuleEngine, MessageContext, Literals, LiteralMatcher, CompiledRuleSet
+from backend.models import Rule
+
+def condition(cond, value):
+    return {"type": "condition", "condition": cond, "value": value}
+
+def group(operator, *children):
+    return {"type": "group", "operator": operator, "children": list(children)}
+
+NODES = [
+    None,
+    {},
+    {"keywords": ["urgent", "Critical"]},
+    {"keywords": "urgent"},
+    {"keywords": ["urgent"], "blacklist": ["test"]},
+    {"blacklist": "spam"},
+    {"regex": r"\d{3}"},
+    {"regex": "("},
+    condition("contains", "Secret"),
+    condition("contains", ""),
+    condition("not_contains", ""),
+    {"keywords": ["", "x"]},
+    {"blacklist": [""]},
+    condition("not_contains", "secret"),
+    condition("equals", "hello world"),
+    condition("starts_with", "hello"),
+    condition("ends_with", "WORLD"),
+    condition("regex", r"sec\w+"),
+    condition("regex", "["),
+    condition("unknown", "x"),
+    group("AND"),
+    group("AND", condition("contains", "hello"), condition("contains", "world")),
+    group("OR", condition("contains", "nope"), condition("starts_with", "hello")),
+    group("XOR", condition("contains", "hello")),
+    group("AND", group("OR", condition("contains", "a"), condition("contains", "b")), condition("not_contains", "spam")),
+    {"type": "other"},
+]
+
+TEXTS = ["", "hello world", "Hello WORLD 123", "a secret message", "spam and bacon", "This is an urgent test", None]
+
+@pytest.mark.parametrize("node", NODES)
+@pytest.mark.parametrize("scan_limit", [LiteralMatcher.DIRECT_SCAN_LIMIT, 0])
+def test_compiled_matches_interpreter(node, scan_limit, monkeypatch):
+    monkeypatch.setattr(LiteralMatcher, "DIRECT_SCAN_LIMIT", scan_limit)
+    literals = Literals()
+    evaluate = RuleEngine.compile(node, literals)
+    matcher = LiteralMatcher(literals)
+    for text in TEXTS:
+        expected = RuleEngine.evaluate_logic_node(node, text or "")
+        assert evaluate(matcher.context(text)) == expected, (node, text)
+
+def test_automaton_matches_direct_scan(monkeypatch):
+    rng = random.Random(7)
+    alphabet = "abcde "
+    words = {"".join(rng.choice(alphabet) for _ in range(rng.randint(1, 5))) for _ in range(300)}
+    literals = Literals()
+    literals.contains |= words
+    literals.prefixes |= set(list(words)[:100])
+    literals.suffixes |= set(list(words)[100:200])
+
+    automaton = LiteralMatcher(literals)
+    monkeypatch.setattr(LiteralMatcher, "DIRECT_SCAN_LIMIT", len(words) + 1)
+    direct = LiteralMatcher(literals)
+
+    for _ in range(200):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        a, d = automaton.context(text), direct.context(text)
+        assert a.hits >= set(d.hits)
+        assert a.hits & literals.contains == set(d.hits)
+        assert a.prefixes & literals.prefixes == set(d.prefixes)
+        assert a.suffixes & literals.suffixes == set(d.suffixes)
+
+def test_rule_set_shares_one_scan():
+    rules = tuple(
+        RuleEngine.compile_rule(Rule(id=i, source="s", destination="d", filters={"keywords": [f"kw{i}"]}))
+        for i in range(200)
+    )
+    rule_set = CompiledRuleSet(rules)
+    # kw1 and kw15 are substrings of kw150
+    assert [r.id for r in rule_set.match("xx KW17 yy kw150")] == [1, 15, 17, 150]
+
+def test_group_short_circuits():
+    calls = []
+    node = group("OR", condition("equals", "hello world"), condition("equals", "other"))
+    evaluate = RuleEngine.compile(node, Literals())
+
+    class CountingContext(MessageContext):
+        @property
+        def lower(self):
+            calls.append(1)
+            return "hello world"
+
+        @lower.setter
+        def lower(self, value):
+            pass
+
+    assert evaluate(CountingContext("hello world"))
+    assert len(calls) == 1
+
+def test_compile_rule_fails_closed():
+    rule = Rule(id=1, source="s", destination="d", filters={"keywords": [1, 2]})
+    compiled = RuleEngine.compile_rule(rule)
+    assert compiled.matches("anything") is False
+    assert compiled.version == (1, rule.updated_at)
@@ -0,0 +1,89 @@
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.models import Rule
+from backend.services.rule_events import RuleEvents
+from backend.services.rule_index import RuleIndex
+
+@pytest.mark.asyncio
+async def test_changes_from_other_processes_are_applied_by_id(engine, session_patch):
+    index = RuleIndex()
+    ours = RuleEvents(check_interval=0)
+    # Stands in for another replica writing to the same database
+    theirs = RuleEvents(check_interval=0)
+
+    with session_patch("backend.services.rule_events"):
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(Rule(name="a", source="s1", destination="d"))
+            await theirs.publish(session, [])
+            await session.commit()
+        await ours.start(index)
+        assert (ours.version, len(index), ours.reloads) == (1, 1, 1)
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            rule = Rule(name="b", source="s2", destination="d")
+            session.add(rule)
+            await session.flush()
+            await theirs.publish(session, [rule.id])
+            await session.commit()
+        ours.receive({"version": 2, "ids": [rule.id], "origin": theirs.origin})
+        await ours.drain()
+        assert (ours.version, ours.applied, ours.reloads) == (2, 1, 1)
+        assert [r.id for r in index.get_rules("s2")] == [rule.id]
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await session.delete(await session.get(Rule, rule.id))
+            await theirs.publish(session, [rule.id])
+            await session.commit()
+        ours.receive({"version": 3, "ids": [rule.id], "origin": theirs.origin})
+        await ours.drain()
+        assert rule.id not in index
+
+        # A skipped version means a notification was lost: reload everything
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await session.execute(update(Rule).values(is_active=False))
+            await theirs.publish(session, [1])
+            await theirs.publish(session, [1])
+            await session.commit()
+        ours.receive({"version": 5, "ids": [1], "origin": theirs.origin})
+        await ours.drain()
+        assert (ours.version, ours.reloads, len(index)) == (5, 2, 0)
+        await ours.stop()
+
+@pytest.mark.asyncio
+async def test_own_changes_are_delivered_in_process_after_commit(engine, session_patch):
+    index = RuleIndex()
+    events = RuleEvents(check_interval=0)
+
+    with session_patch("backend.services.rule_events"):
+        await events.start(index)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await events.publish(session, [1])
+            await session.rollback()
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await events.publish(session, [1])
+            await session.commit()
+        await events.drain()
+        # The rolled-back change was never delivered; the committed one only advances the version
+        assert (events.version, events.applied, events.reloads) == (1, 1, 1)
+        await events.stop()
+
+@pytest.mark.asyncio
+async def test_version_check_recovers_missed_changes(engine, session_patch):
+    index = RuleIndex()
+    ours = RuleEvents(check_interval=0)
+    theirs = RuleEvents(check_interval=0)
+
+    with session_patch("backend.services.rule_events"):
+        await ours.start(index)
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            session.add(Rule(name="a", source="s1", destination="d"))
+            await theirs.publish(session, [])
+            await session.commit()
+
+        # The notification may still be in flight on the first check
+        assert await ours.check() is False
+        assert await ours.check() is True
+        assert (ours.version, len(index)) == (1, 1)
+        assert await ours.check() is False
+        await ours.stop()
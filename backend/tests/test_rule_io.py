@@ -0,0 +1,58 @@
+import json
+import pytest
+from backend.services.rule_io import iter_csv, iter_json_array
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+async def collect(records):
+    return [record async for record in records]
+
+@pytest.mark.asyncio
+async def test_json_array_is_decoded_item_by_item_across_chunks():
+    items = [{"name": "ünïcode ✓", "source": "1", "destination": "2"}, 5, {"name": "x, ]"}]
+    data = json.dumps(items, ensure_ascii=False).encode()
+    # Three-byte chunks split multi-byte characters and items
+    records = await collect(iter_json_array(chunked(data, 3)))
+    assert records == [(1, items[0], None), (2, None, "Expected an object"), (3, items[2], None)]
+
+    records = await collect(iter_json_array(chunked(b'[{"a": 1}, {"b"', 4)))
+    assert records[0] == (1, {"a": 1}, None)
+    assert records[-1][2] == "Malformed or unterminated JSON array"
+
+    with pytest.raises(ValueError):
+        await collect(iter_json_array(chunked(b'{"a": 1}', 4)))
+
+@pytest.mark.asyncio
+async def test_csv_handles_quoted_newlines_and_json_columns():
+    data = (
+        '﻿name,source,destination,is_active,filters\n'
+        '"multi\nline",1,2,false,"{""keywords"": [""a""]}"\n'
+        'bad,1,2,true,{not json}\n'
+    ).encode()
+    records = await collect(iter_csv(chunked(data, 5)))
+    assert records[0] == (1, {"name": "multi\nline", "source": "1", "destination": "2", "is_active": False, "filters": {"keywords": ["a"]}}, None)
+    assert records[1] == (2, None, "Column filters is not valid JSON")
+
+@pytest.mark.asyncio
+async def test_legacy_sheet_skips_config_row_and_marks_bare_ids():
+    # As exported from the old app's sheet: the /sync settings row, then one row per source
+    data = (
+        'Chat ID,Check for,Forward to,Status\r\n'
+        '1234567890,/sync,-1009876543210\r\n'
+        '1500000001,"BTC, ETH",-1009876543210,on\r\n'
+        '1500000002,SOL,"-1009876543210, 777000",Off\r\n'
+        '-1001500000003,XRP,-1009876543210,\r\n'
+    ).encode()
+    records = await collect(iter_csv(chunked(data, 7), "legacy_sheet"))
+    assert [(position, r["source"], r["destination"], r["is_active"]) for position, r, _ in records] == [
+        (2, "-1001500000001", "-1009876543210", True),
+        (3, "-1001500000002", "-1009876543210", False),
+        (3, "-1001500000002", "777000", False),
+        (4, "-1001500000003", "-1009876543210", True),
+    ]
+    assert records[0][1]["filters"] == {"keywords": ["BTC", "ETH"]}
+
+    records = await collect(iter_csv(chunked(data, 7), "legacy_sheet", bare_ids="chat"))
+    assert records[0][1]["source"] == "-1500000001"
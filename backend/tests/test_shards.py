@@ -0,0 +1,108 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from backend.models import Outbox, Worker, WorkerShard
+from backend.services.shards import ShardCoordinator, shard_of
+from backend.telegram.delivery import DeliveryDispatcher
+from backend.telegram.outbox import Delivery, OutboxWorker
+
+def test_shard_of_is_stable_and_in_range():
+    assert shard_of("-100123", 8) == shard_of("-100123", 8)
+    assert {shard_of(f"-100{i}", 8) for i in range(200)} == set(range(8))
+    assert shard_of("-100123", 1) == 0
+
+@pytest.mark.asyncio
+async def test_shards_are_split_between_workers(file_engine, session_patch):
+    a = ShardCoordinator(shard_count=4, worker_id="a")
+    b = ShardCoordinator(shard_count=4, worker_id="b")
+    changes = []
+    b.add_listener(changes.append)
+
+    with session_patch("backend.services.shards", file_engine):
+        # Alone, a takes everything
+        assert await a.rebalance() == frozenset(range(4))
+        # b joins: nothing is free yet, but a offers its excess on its next round
+        assert await b.rebalance() == frozenset()
+        # a keeps listening to the offered shards until b has taken them
+        assert await a.rebalance() == frozenset(range(4))
+        assert len(a.offered) == 2
+        owned_b = await b.rebalance()
+        assert owned_b == a.offered
+        assert changes == [owned_b]
+        assert await a.rebalance() == frozenset(range(4)) - owned_b
+        assert a.offered == frozenset()
+
+        # b leaves cleanly; its shards are free for a right away
+        await b.stop()
+        assert b.owned == frozenset()
+        assert await a.rebalance() == frozenset(range(4))
+
+@pytest.mark.asyncio
+async def test_offered_shards_are_taken_back_when_nobody_claims_them(file_engine, session_patch):
+    a = ShardCoordinator(shard_count=2, worker_id="a")
+    b = ShardCoordinator(shard_count=2, worker_id="b")
+
+    with session_patch("backend.services.shards", file_engine):
+        await a.rebalance()
+        await b.rebalance()
+        assert await a.rebalance() == frozenset({0, 1}) and len(a.offered) == 1
+        # b goes away without taking the shard
+        async with AsyncSession(file_engine) as session:
+            await session.execute(update(Worker).where(Worker.id == "b").values(heartbeat_at=datetime.utcnow() - timedelta(hours=1)))
+            await session.commit()
+        assert await a.rebalance() == frozenset({0, 1})
+        assert a.offered == frozenset()
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_taken_over(file_engine, session_patch):
+    a = ShardCoordinator(shard_count=2, worker_id="a")
+    b = ShardCoordinator(shard_count=2, worker_id="b")
+
+    with session_patch("backend.services.shards", file_engine):
+        await a.rebalance()
+        # a stops renewing (crashed)
+        async with AsyncSession(file_engine) as session:
+            past = datetime.utcnow() - timedelta(seconds=1)
+            await session.execute(update(WorkerShard).values(lease_expires_at=past))
+            await session.commit()
+        async with AsyncSession(file_engine) as session:
+            await session.execute(update(Worker).values(heartbeat_at=datetime.utcnow() - timedelta(hours=1)))
+            await session.commit()
+
+        assert await b.rebalance() == frozenset({0, 1})
+
+@pytest.mark.asyncio
+async def test_outbox_claims_only_owned_shards(file_engine, session_patch):
+    worker = OutboxWorker(dispatcher=DeliveryDispatcher())
+    worker.client = AsyncMock()
+    sources = ["-1001", "-1002", "-1003", "-1004", "-1005", "-1006"]
+
+    with session_patch("backend.telegram.outbox", file_engine), patch('backend.telegram.outbox.shard_of', lambda s: shard_of(s, 2)):
+        for i, source in enumerate(sources):
+            await worker.enqueue(MagicMock(), source, i, [Delivery("1", "forward", [1])])
+
+        worker.shards = frozenset()
+        assert await worker._claim() == []
+
+        worker.shards = frozenset({0})
+        claimed = await worker._claim()
+
+    expected = [s for s in sources if shard_of(s, 2) == 0]
+    assert [row.source_chat_id for row in claimed] == expected
+    async with AsyncSession(file_engine) as session:
+        result = await session.execute(select(Outbox.shard).order_by(Outbox.id))
+        assert result.scalars().all() == [shard_of(s, 2) for s in sources]
+
+@pytest.mark.asyncio
+async def test_heartbeat_stores_reported_state(file_engine, session_patch):
+    a = ShardCoordinator(shard_count=1, worker_id="a")
+    a.state_provider = lambda: {"accounts": [{"name": "default"}]}
+
+    with session_patch("backend.services.shards", file_engine):
+        await a.rebalance()
+    async with AsyncSession(file_engine) as session:
+        worker = await session.get(Worker, "a")
+        assert worker.state == {"accounts": [{"name": "default"}]}
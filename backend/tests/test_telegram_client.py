@@ -0,0 +1,57 @@
+from unittest.mock import MagicMock, patch
+from telethon import events
+from telethon.tl.types import InputPeerChannel
+from backend.models import Rule
+from backend.services.rule_index import RuleIndex
+from backend.telegram.client import TelegramService
+from backend.telegram.handler import handle_new_message
+from backend.telegram.peers import PeerCache
+
+def make_service(index):
+    with patch('backend.telegram.client.rule_index', index):
+        service = TelegramService()
+    service.client = MagicMock()
+    service.peers = PeerCache()
+    return service
+
+def registered_chats(service):
+    event = service.client.add_event_handler.call_args.args[1]
+    assert service.client.add_event_handler.call_args.args[0] is handle_new_message
+    assert isinstance(event, events.NewMessage)
+    return event.chats
+
+def test_handler_is_filtered_to_rule_sources():
+    index = RuleIndex()
+    service = make_service(index)
+    with patch('backend.telegram.client.rule_index', index):
+        index.upsert(Rule(id=1, name="A", source="-100123", destination="1"))
+        assert registered_chats(service) == [-100123]
+
+        # An unresolved username would make Telethon fail on every update, so it waits
+        service.client.add_event_handler.reset_mock()
+        index.upsert(Rule(id=2, name="B", source="@news", destination="1"))
+        service.client.add_event_handler.assert_not_called()
+
+        # Once resolved it is added, by marked id
+        service.peers._peers = {"@news": InputPeerChannel(777, 1)}
+        service.subscribe()
+        assert registered_chats(service) == [-100123, -1000000000777]
+
+        # Another rule on an already subscribed source leaves the registration alone
+        service.client.add_event_handler.reset_mock()
+        index.upsert(Rule(id=3, name="C", source="@news", destination="2"))
+        service.client.add_event_handler.assert_not_called()
+
+        # Deactivating the last rule of a source drops it from the filter
+        index.upsert(Rule(id=1, name="A", source="-100123", destination="1", is_active=False))
+        assert registered_chats(service) == [-1000000000777]
+
+def test_no_handler_without_active_rules():
+    index = RuleIndex()
+    service = make_service(index)
+    with patch('backend.telegram.client.rule_index', index):
+        index.upsert(Rule(id=1, name="A", source="-100123", destination="1"))
+        index.remove(1)
+
+    service.client.remove_event_handler.assert_called_with(handle_new_message, events.NewMessage)
+    assert service.client.add_event_handler.call_count == 1
@@ -2,6 +2,8 @@ import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from backend.telegram.handler import handle_new_message
 from backend.models import Rule, DeliveryMethod
+from backend.services.dedupe import DedupeCache
+from backend.telegram.outbox import Delivery
 
 # Mock event
 class MockEvent:
@@ -12,6 +14,11 @@ class MockEvent:
         self.message = MagicMock() # The message object itself
         self.client = AsyncMock()
 
+def mock_outbox():
+    outbox = MagicMock()
+    outbox.enqueue = AsyncMock()
+    return outbox
+
 @pytest.mark.asyncio
 async def test_handle_new_message_forward():
     # Setup
@@ -19,7 +26,7 @@ async def test_handle_new_message_forward():
     text = "Important message"
     event = MockEvent(chat_id, text)
 
-    # Mock Rule Engine to return a rule
+    # Mock Rule Index to return a rule
     rule = Rule(
         id=1,
         name="Test Rule",
@@ -29,29 +36,17 @@ async def test_handle_new_message_forward():
         is_active=True
     )
 
-    # Mock database session
-    mock_session = AsyncMock()
-    mock_session.add = MagicMock()
-    mock_session.commit = AsyncMock()
-
-    # We use a generator for get_session mock
-    async def mock_get_session():
-        yield mock_session
+    outbox = mock_outbox()
 
-    with patch('backend.telegram.handler.get_session', side_effect=mock_get_session):
-        with patch('backend.telegram.handler.rule_engine.get_matching_rules', new_callable=AsyncMock) as mock_get_rules:
+    with patch('backend.telegram.handler.outbox', outbox):
+        with patch('backend.telegram.handler.rule_index.match') as mock_get_rules:
             mock_get_rules.return_value = [rule]
 
             await handle_new_message(event)
 
-            # Verify forward_messages was called
-            event.client.forward_messages.assert_called_once()
-            args, _ = event.client.forward_messages.call_args
-            assert args[0] == 67890 # Destination as int
-
-            # Verify log added
-            mock_session.add.assert_called()
-            mock_session.commit.assert_called()
+            # Verify the delivery was queued, not sent inline
+            outbox.enqueue.assert_called_once_with(event.message, chat_id, 123, [Delivery("67890", "forward", [1])])
+            event.client.forward_messages.assert_not_called()
 
 @pytest.mark.asyncio
 async def test_handle_new_message_copy():
@@ -60,7 +55,7 @@ async def test_handle_new_message_copy():
     text = "Important message"
     event = MockEvent(chat_id, text)
 
-    # Mock Rule Engine to return a rule
+    # Mock Rule Index to return a rule
     rule = Rule(
         id=1,
         name="Test Rule",
@@ -70,29 +65,16 @@ async def test_handle_new_message_copy():
         is_active=True
     )
 
-    # Mock database session
-    mock_session = AsyncMock()
-    mock_session.add = MagicMock()
-    mock_session.commit = AsyncMock()
-
-    async def mock_get_session():
-        yield mock_session
+    outbox = mock_outbox()
 
-    with patch('backend.telegram.handler.get_session', side_effect=mock_get_session):
-        with patch('backend.telegram.handler.rule_engine.get_matching_rules', new_callable=AsyncMock) as mock_get_rules:
+    with patch('backend.telegram.handler.outbox', outbox):
+        with patch('backend.telegram.handler.rule_index.match') as mock_get_rules:
             mock_get_rules.return_value = [rule]
 
             await handle_new_message(event)
 
-            # Verify send_message was called instead of forward_messages
-            event.client.send_message.assert_called_once()
-            event.client.forward_messages.assert_not_called()
-            args, _ = event.client.send_message.call_args
-            assert args[0] == 67890
-
-            # Verify log added
-            mock_session.add.assert_called()
-            mock_session.commit.assert_called()
+            outbox.enqueue.assert_called_once_with(event.message, chat_id, 123, [Delivery("67890", "copy", [1])])
+            event.client.send_message.assert_not_called()
 
 @pytest.mark.asyncio
 async def test_handle_new_message_no_match():
@@ -101,17 +83,95 @@ async def test_handle_new_message_no_match():
     text = "Spam"
     event = MockEvent(chat_id, text)
 
-    mock_session = AsyncMock()
-
-    async def mock_get_session():
-        yield mock_session
+    outbox = mock_outbox()
 
-    with patch('backend.telegram.handler.get_session', side_effect=mock_get_session):
-        with patch('backend.telegram.handler.rule_engine.get_matching_rules', new_callable=AsyncMock) as mock_get_rules:
+    with patch('backend.telegram.handler.outbox', outbox):
+        with patch('backend.telegram.handler.rule_index.match') as mock_get_rules:
             mock_get_rules.return_value = []
 
             await handle_new_message(event)
 
             # Verify nothing happened
+            outbox.enqueue.assert_not_called()
             event.client.forward_messages.assert_not_called()
             event.client.send_message.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_handle_new_message_coalesces_same_destination():
+    chat_id = "12345"
+    event = MockEvent(chat_id, "Important message")
+
+    rules = [
+        Rule(id=1, name="A", source=chat_id, destination="67890", delivery_method=DeliveryMethod.FORWARD.value),
+        Rule(id=2, name="B", source=chat_id, destination="67890", delivery_method=DeliveryMethod.FORWARD.value),
+        Rule(id=3, name="C", source=chat_id, destination="67890", delivery_method=DeliveryMethod.COPY.value),
+        Rule(id=4, name="D", source=chat_id, destination="@other", delivery_method=DeliveryMethod.FORWARD.value),
+    ]
+
+    outbox = mock_outbox()
+
+    with patch('backend.telegram.handler.outbox', outbox):
+        with patch('backend.telegram.handler.rule_index.match') as mock_get_rules:
+            mock_get_rules.return_value = rules
+
+            await handle_new_message(event)
+
+            # One delivery per (destination, method) group, carrying every contributing rule
+            deliveries = outbox.enqueue.call_args.args[3]
+            assert deliveries == [
+                Delivery("67890", "forward", [1, 2]),
+                Delivery("67890", "copy", [3]),
+                Delivery("@other", "forward", [4]),
+            ]
+
+@pytest.mark.asyncio
+async def test_cross_posted_duplicates_are_suppressed():
+    rules = [
+        Rule(id=1, name="A", source="111", destination="999", dedupe_window=60),
+        Rule(id=2, name="B", source="222", destination="999", dedupe_window=60),
+        Rule(id=3, name="C", source="222", destination="888"),
+    ]
+    outbox = mock_outbox()
+    sink = MagicMock()
+    sink.record = AsyncMock()
+
+    with patch('backend.telegram.handler.outbox', outbox), \
+         patch('backend.telegram.handler.log_sink', sink), \
+         patch('backend.telegram.handler.dedupe_cache', DedupeCache(max_entries=10)), \
+         patch('backend.telegram.handler.rule_index.match') as mock_match:
+        mock_match.return_value = [rules[0]]
+        await handle_new_message(MockEvent("111", "Big  NEWS today", message_id=1))
+        # Same announcement in another source, differently spaced: 999 already has it,
+        # 888 has no dedupe window
+        mock_match.return_value = [rules[1], rules[2]]
+        await handle_new_message(MockEvent("222", "big news today ", message_id=2))
+
+    assert [c.args[3] for c in outbox.enqueue.call_args_list] == [
+        [Delivery("999", "forward", [1])],
+        [Delivery("888", "forward", [3])],
+    ]
+    sink.record.assert_called_once_with(2, 2, "duplicate", "Already sent to 999 within 60s")
+
+@pytest.mark.asyncio
+async def test_ai_rules_are_queued_with_their_transform():
+    ai = {"enabled": True, "systemInstruction": "Translate to English", "model": "m1"}
+    rules = [
+        Rule(id=1, name="Plain", source="111", destination="999"),
+        Rule(id=2, name="AI", source="111", destination="999", ai_config=ai),
+        Rule(id=3, name="AI too", source="111", destination="888", ai_config=ai),
+        Rule(id=4, name="AI off", source="111", destination="888", ai_config={**ai, "enabled": False}),
+    ]
+    outbox = mock_outbox()
+
+    with patch('backend.telegram.handler.outbox', outbox), \
+         patch('backend.telegram.handler.rule_index.match', return_value=rules):
+        await handle_new_message(MockEvent("111", "Hallo"))
+
+    # The text is rewritten by the outbox worker, in the destination's lane
+    transform = ("m1", "Translate to English")
+    assert outbox.enqueue.call_args.args[3] == [
+        Delivery("999", "forward", [1]),
+        Delivery("999", "forward", [2], transform),
+        Delivery("888", "forward", [3], transform),
+        Delivery("888", "forward", [4]),
+    ]
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import httpx
+import pytest
+from backend.services.transform import EchoBackend, GeminiBackend, Transformer
+
+class UpperBackend(EchoBackend):
+    def __init__(self, delay=0.0, fail=False):
+        super().__init__()
+        self.delay = delay
+        self.fail = fail
+        self.active = 0
+        self.max_active = 0
+
+    async def generate(self, model, instruction, texts):
+        await super().generate(model, instruction, texts)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("model unavailable")
+            return [text.upper() for text in texts]
+        finally:
+            self.active -= 1
+
+@pytest.mark.asyncio
+async def test_concurrent_texts_are_batched_and_cached():
+    backend = UpperBackend()
+    transformer = Transformer(backend, batch_size=10, batch_window=0.01)
+
+    results = await asyncio.gather(*(transformer.transform("m", "shout", t) for t in ["a", "b", "a", "c"]))
+    assert results == ["A", "B", "A", "C"]
+    # One call for the three distinct texts; the repeated "a" shared the in-progress result
+    assert backend.calls == [("m", "shout", ["a", "b", "c"])]
+
+    assert await transformer.transform("m", "shout", "b") == "B"
+    assert len(backend.calls) == 1
+    assert (transformer.hits, transformer.misses) == (2, 3)
+
+    # Instruction and model are part of the cache key
+    await transformer.transform("m", "whisper", "b")
+    await transformer.transform("other", "shout", "b")
+    assert len(backend.calls) == 3
+
+@pytest.mark.asyncio
+async def test_full_batches_go_out_without_waiting_and_concurrency_is_capped():
+    backend = UpperBackend(delay=0.01)
+    transformer = Transformer(backend, max_concurrency=2, batch_size=2, batch_window=60)
+
+    results = await asyncio.wait_for(
+        asyncio.gather(*(transformer.transform("m", "i", str(i)) for i in range(8))), timeout=5
+    )
+    assert results == [str(i) for i in range(8)]
+    assert [len(texts) for _, _, texts in backend.calls] == [2, 2, 2, 2]
+    assert backend.max_active == 2
+
+@pytest.mark.asyncio
+async def test_failures_reach_every_caller_and_are_not_cached():
+    backend = UpperBackend(fail=True)
+    transformer = Transformer(backend, batch_window=0)
+    results = await asyncio.gather(
+        transformer.transform("m", "i", "x"), transformer.transform("m", "i", "x"), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    backend.fail = False
+    assert await transformer.transform("m", "i", "x") == "X"
+
+    # An empty answer fails that text only, and is not cached either
+    results = await asyncio.gather(
+        transformer.transform("m", "i", " \n"), transformer.transform("m", "i", "y"), return_exceptions=True
+    )
+    assert isinstance(results[0], ValueError) and results[1] == "Y"
+    assert transformer.cache_key("m", "i", " \n") not in transformer._cache
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded():
+    transformer = Transformer(UpperBackend(), batch_window=0, cache_size=2)
+    for text in ["a", "b", "c"]:
+        await transformer.transform("m", "i", text)
+    assert len(transformer._cache) == 2
+
+@pytest.mark.asyncio
+async def test_without_backend_transform_raises():
+    with pytest.raises(RuntimeError):
+        await Transformer(None).transform("m", "i", "x")
+
+@pytest.mark.asyncio
+async def test_gemini_batch_request():
+    requests = []
+
+    def handler(request):
+        body = json.loads(request.content)
+        requests.append(body)
+        prompt = body["contents"][0]["parts"][0]["text"]
+        texts = json.loads(prompt[prompt.index("["):])
+        reply = json.dumps([t[::-1] for t in texts])
+        return httpx.Response(200, json={"candidates": [{"content": {"parts": [{"text": reply}]}}]})
+
+    backend = GeminiBackend("key")
+    backend._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    assert await backend.generate("gemini-x", "reverse", ["abc", "de"]) == ["cba", "ed"]
+    assert len(requests) == 1
+    assert requests[0]["systemInstruction"] == {"parts": [{"text": "reverse"}]}
+    assert requests[0]["generationConfig"] == {"responseMimeType": "application/json"}
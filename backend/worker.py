@@ -0,0 +1,126 @@
+"""
+Forwarding worker: runs the Telegram ingest -> evaluate -> deliver loop on its own,
+without the HTTP API.
+
+    python -m backend.worker
+
+Several workers can run side by side. Source chats are split into WORKER_SHARDS hash
+shards, leased to the running workers through the database; each worker only listens
+to and delivers for the sources in the shards it holds.
+"""
+import asyncio
+import logging
+import signal
+from typing import Any, Dict, FrozenSet, Optional
+from backend.config import settings
+from backend.database import init_db
+from backend.services.log_sink import log_sink
+from backend.services.metrics import CONTENT_TYPE, registry
+from backend.services.rule_events import rule_events
+from backend.services.rule_index import rule_index
+from backend.services.shards import ShardCoordinator
+from backend.telegram.client import telegram_service
+from backend.telegram.delivery import delivery_dispatcher
+from backend.telegram.pool import client_pool
+from backend.telegram.rate_limiter import rate_limiter
+from backend.telegram.outbox import outbox
+
+logger = logging.getLogger(__name__)
+
+class ForwardingWorker:
+    def __init__(
+        self,
+        coordinator: Optional[ShardCoordinator] = None,
+        metrics_port: int = settings.WORKER_METRICS_PORT,
+    ):
+        self.coordinator = coordinator or ShardCoordinator()
+        # The API process has no clients of its own; it shows this state from the Worker table
+        self.coordinator.state_provider = delivery_state
+        self.metrics_port = metrics_port
+        self._metrics_server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> bool:
+        if self.metrics_port:
+            # The API's /metrics only covers the API process, so workers serve their own
+            self._metrics_server = await asyncio.start_server(serve_metrics, port=self.metrics_port)
+        await init_db()
+        # Rules are edited through the API process; follow its changes without a restart
+        await rule_events.start(rule_index)
+        await log_sink.start()
+
+        # Nothing is received or claimed until the first shards are leased
+        outbox.shards = frozenset()
+        telegram_service.source_filter = self.coordinator.owns
+        self.coordinator.add_listener(self._on_shards_changed)
+        await self.coordinator.start()
+
+        await telegram_service.start()
+        if not telegram_service.client:
+            logger.error("Telegram client did not start; the worker has nothing to do.")
+            return False
+        logger.info(f"Forwarding worker {self.coordinator.worker_id} started.")
+        return True
+
+    async def stop(self) -> None:
+        await telegram_service.stop()
+        # Give the shards back only after in-flight deliveries were finished or released
+        await self.coordinator.stop()
+        await log_sink.stop()
+        await rule_events.stop()
+        if self._metrics_server is not None:
+            self._metrics_server.close()
+            await self._metrics_server.wait_closed()
+            self._metrics_server = None
+        logger.info(f"Forwarding worker {self.coordinator.worker_id} stopped.")
+
+    def _on_shards_changed(self, owned: FrozenSet[int]) -> None:
+        outbox.shards = owned
+        telegram_service.subscribe()
+
+def delivery_state() -> Dict[str, Any]:
+    rate_limits = rate_limiter.state()
+    rate_limits["queued"] = delivery_dispatcher.pending()
+    return {"rate_limits": rate_limits, "accounts": client_pool.state()}
+
+async def serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """
+    Minimal HTTP responder for Prometheus scrapes: any GET returns the metrics.
+    """
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        if request_line.startswith(b"GET "):
+            body = registry.render().encode()
+            status, content_type = "200 OK", CONTENT_TYPE
+        else:
+            body = b"Method Not Allowed\n"
+            status, content_type = "405 Method Not Allowed", "text/plain"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.error(f"Error serving metrics: {e}")
+    finally:
+        writer.close()
+
+async def main() -> int:
+    worker = ForwardingWorker()
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    try:
+        if await worker.start():
+            await stopping.wait()
+            return 0
+        return 1
+    finally:
+        await worker.stop()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(asyncio.run(main()))
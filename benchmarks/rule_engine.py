@@ -0,0 +1,292 @@
+"""
+Rule engine throughput benchmark.
+
+Generates synthetic rule sets and message corpora and measures per-message evaluation
+time for three paths:
+
+    interpreter  RuleEngine.evaluate_logic_node over every rule
+    compiled     CompiledRuleSet.match (what the message handler uses via the rule index)
+    db           RuleEngine.get_matching_rules against in-memory SQLite, as in tests/
+
+Usage:
+
+    python -m benchmarks.rule_engine                          # full matrix
+    python -m benchmarks.rule_engine --quick                  # small smoke run
+    python -m benchmarks.rule_engine --output before.json
+    python -m benchmarks.rule_engine --output after.json --compare before.json
+
+Results are written as JSON (one entry per target/size/mix/length case) so runs from
+different commits can be compared with --compare.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import string
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from backend.models import Rule
+from backend.services.rule_engine import RuleEngine, CompiledRuleSet
+
+SOURCE = "bench_source"
+SIZES = [10, 100, 1000, 10000]
+MIXES = ["keyword", "regex", "deep", "legacy", "mixed"]
+LENGTHS = {"short": 60, "medium": 600, "long": 4000}
+TARGETS = ["interpreter", "compiled", "db"]
+
+# --- Synthetic data ---
+
+def make_vocabulary(rng: random.Random, size: int = 2000) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))))
+    return sorted(words)
+
+def condition(cond: str, value: str) -> Dict[str, Any]:
+    return {"type": "condition", "condition": cond, "value": value}
+
+def group(operator: str, children: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"type": "group", "operator": operator, "children": children}
+
+def keyword_filter(rng: random.Random, vocab: List[str]) -> Dict[str, Any]:
+    # Shallow: one OR group of plain keywords
+    return group("OR", [condition("contains", rng.choice(vocab)) for _ in range(3)])
+
+def regex_filter(rng: random.Random, vocab: List[str]) -> Dict[str, Any]:
+    word = rng.choice(vocab)
+    return group("AND", [
+        condition("contains", rng.choice(vocab)),
+        condition("regex", rf"\b{word[:3]}\w*\s+\w+"),
+        condition("regex", rf"{rng.choice(vocab)}|\d{{{rng.randint(2, 4)}}}"),
+    ])
+
+def deep_filter(rng: random.Random, vocab: List[str], depth: int = 5) -> Dict[str, Any]:
+    if depth == 0:
+        cond = rng.choice(["contains", "contains", "not_contains", "starts_with", "ends_with"])
+        return condition(cond, rng.choice(vocab))
+    operator = "AND" if depth % 2 else "OR"
+    return group(operator, [deep_filter(rng, vocab, depth - 1) for _ in range(2)])
+
+def legacy_filter(rng: random.Random, vocab: List[str]) -> Dict[str, Any]:
+    filters: Dict[str, Any] = {
+        "keywords": [rng.choice(vocab) for _ in range(3)],
+        "blacklist": [rng.choice(vocab) for _ in range(2)],
+    }
+    if rng.random() < 0.25:
+        filters["regex"] = rf"{rng.choice(vocab)[:4]}\w+"
+    return filters
+
+FILTERS: Dict[str, Callable[[random.Random, List[str]], Dict[str, Any]]] = {
+    "keyword": keyword_filter,
+    "regex": regex_filter,
+    "deep": deep_filter,
+    "legacy": legacy_filter,
+}
+
+def make_rules(count: int, mix: str, rng: random.Random, vocab: List[str]) -> List[Rule]:
+    rules = []
+    for i in range(count):
+        kind = rng.choice(list(FILTERS)) if mix == "mixed" else mix
+        rules.append(Rule(
+            id=i + 1, name=f"bench_{i}", source=SOURCE, destination="bench_destination",
+            filters=FILTERS[kind](rng, vocab), is_active=True,
+        ))
+    return rules
+
+def make_messages(count: int, length: int, rng: random.Random, vocab: List[str]) -> List[str]:
+    messages = []
+    for _ in range(count):
+        words: List[str] = []
+        size = 0
+        while size < length:
+            word = rng.choice(vocab) if rng.random() < 0.9 else str(rng.randint(0, 99999))
+            words.append(word.capitalize() if rng.random() < 0.1 else word)
+            size += len(word) + 1
+        messages.append(" ".join(words)[:length])
+    return messages
+
+# --- Measurement ---
+
+def summarize(timings_ns: List[int], matches: int) -> Dict[str, Any]:
+    ordered = sorted(timings_ns)
+    total = sum(ordered)
+
+    def percentile(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] / 1000
+
+    return {
+        "messages": len(ordered),
+        "msg_per_s": round(len(ordered) / (total / 1e9), 1) if total else None,
+        "p50_us": round(percentile(0.50), 2),
+        "p99_us": round(percentile(0.99), 2),
+        "matches_per_msg": round(matches / len(ordered), 3),
+    }
+
+def bench_sync(evaluate: Callable[[str], int], messages: List[str], budget: float, min_messages: int) -> Dict[str, Any]:
+    evaluate(messages[0])  # Warm up caches (compiled regexes, etc.)
+    timings: List[int] = []
+    matches = 0
+    deadline = time.perf_counter() + budget
+    for i, text in enumerate(messages):
+        start = time.perf_counter_ns()
+        matches += evaluate(text)
+        timings.append(time.perf_counter_ns() - start)
+        if i + 1 >= min_messages and time.perf_counter() > deadline:
+            break
+    return summarize(timings, matches)
+
+async def bench_db(rules: List[Rule], messages: List[str], budget: float, min_messages: int) -> Dict[str, Any]:
+    engine = create_async_engine(
+        "sqlite+aiosqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    async with engine.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async with AsyncSession(engine, expire_on_commit=False) as session:
+        session.add_all(Rule(**rule.model_dump()) for rule in rules)
+        await session.commit()
+
+        await RuleEngine.get_matching_rules(session, SOURCE, messages[0])
+        timings: List[int] = []
+        matches = 0
+        deadline = time.perf_counter() + budget
+        for i, text in enumerate(messages):
+            start = time.perf_counter_ns()
+            matches += len(await RuleEngine.get_matching_rules(session, SOURCE, text))
+            timings.append(time.perf_counter_ns() - start)
+            # Each call loads the rules again; drop them so the identity map does not grow
+            session.expunge_all()
+            if i + 1 >= min_messages and time.perf_counter() > deadline:
+                break
+    await engine.dispose()
+    return summarize(timings, matches)
+
+async def run_case(target: str, rules: List[Rule], messages: List[str], budget: float, min_messages: int) -> Dict[str, Any]:
+    if target == "interpreter":
+        filters = [rule.filters for rule in rules]
+
+        def evaluate(text: str) -> int:
+            return sum(1 for f in filters if RuleEngine.evaluate_logic_node(f, text))
+
+        return bench_sync(evaluate, messages, budget, min_messages)
+
+    if target == "compiled":
+        rule_set = CompiledRuleSet(tuple(RuleEngine.compile_rule(rule) for rule in rules))
+        return bench_sync(lambda text: len(rule_set.match(text)), messages, budget, min_messages)
+
+    return await bench_db(rules, messages, budget, min_messages)
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    vocab = make_vocabulary(rng)
+    corpora = {name: make_messages(args.messages, LENGTHS[name], rng, vocab) for name in args.lengths}
+
+    results = []
+    for size in args.sizes:
+        for mix in args.mixes:
+            rules = make_rules(size, mix, random.Random(f"{args.seed}-{size}-{mix}"), vocab)
+            for length in args.lengths:
+                for target in args.targets:
+                    stats = await run_case(target, rules, corpora[length], args.budget, args.min_messages)
+                    case = {"target": target, "rules": size, "mix": mix, "length": length, **stats}
+                    results.append(case)
+                    print(
+                        f"{target:<12} {size:>6} rules  {mix:<8} {length:<6}  "
+                        f"{stats['msg_per_s'] or 0:>12,.1f} msg/s  p50 {stats['p50_us']:>10,.2f}us  p99 {stats['p99_us']:>10,.2f}us",
+                        file=sys.stderr,
+                    )
+    return {"meta": metadata(args), "results": results}
+
+def metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "messages": args.messages,
+        "budget_s": args.budget,
+    }
+
+def case_key(case: Dict[str, Any]) -> Tuple:
+    return (case["target"], case["rules"], case["mix"], case["length"])
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """
+    Print throughput and p99 ratios (current / baseline) for the cases present in both runs.
+    """
+    base = {case_key(c): c for c in baseline["results"]}
+    print(f"Comparing against {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')})")
+    for case in current["results"]:
+        old = base.get(case_key(case))
+        if not old or not old["msg_per_s"] or not case["msg_per_s"]:
+            continue
+        speedup = case["msg_per_s"] / old["msg_per_s"]
+        p99 = case["p99_us"] / old["p99_us"] if old["p99_us"] else float("nan")
+        print(
+            f"{case['target']:<12} {case['rules']:>6} rules  {case['mix']:<8} {case['length']:<6}  "
+            f"throughput x{speedup:.2f}  p99 x{p99:.2f}"
+        )
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    def csv(cast=str):
+        return lambda value: [cast(v) for v in value.split(",") if v]
+
+    parser = argparse.ArgumentParser(description="Benchmark rule evaluation throughput.")
+    parser.add_argument("--sizes", type=csv(int), default=SIZES, help="Rule set sizes, comma separated")
+    parser.add_argument("--mixes", type=csv(), default=MIXES, help=f"Rule mixes: {','.join(MIXES)}")
+    parser.add_argument("--lengths", type=csv(), default=list(LENGTHS), help=f"Message lengths: {','.join(LENGTHS)}")
+    parser.add_argument("--targets", type=csv(), default=TARGETS, help=f"Paths to measure: {','.join(TARGETS)}")
+    parser.add_argument("--messages", type=int, default=500, help="Messages per corpus")
+    parser.add_argument("--budget", type=float, default=2.0, help="Seconds per case before stopping early")
+    parser.add_argument("--min-messages", type=int, default=20, help="Messages measured per case even past the budget")
+    parser.add_argument("--seed", type=int, default=2026)
+    parser.add_argument("--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="Baseline JSON results to compare against")
+    parser.add_argument("--quick", action="store_true", help="Small matrix for a fast smoke run")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.sizes = [10, 100]
+        args.messages = min(args.messages, 50)
+        args.budget = min(args.budget, 0.2)
+    for name, values, allowed in (("mixes", args.mixes, MIXES), ("lengths", args.lengths, list(LENGTHS)), ("targets", args.targets, TARGETS)):
+        unknown = set(values) - set(allowed)
+        if unknown:
+            parser.error(f"unknown {name}: {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,3 +1,4 @@
+import json
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -11,7 +12,12 @@ from backend.database import get_session, init_db
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlmodel import SQLModel
+from sqlalchemy import delete, insert
+from datetime import datetime, timedelta
+from backend.models import Log, Worker
+from backend.services.log_rollup import add_rollups, rollup_counts
 from backend.config import settings
+from backend.services.rule_index import RuleIndex, rule_index
 from sqlalchemy.pool import StaticPool
 
 # Use in-memory SQLite for testing
@@ -124,3 +130,332 @@ async def test_test_rule(client):
         json={"rule_id": 999, "message_text": "Any text"}
     )
     assert resp.status_code == 404
+
+@pytest.mark.anyio
+async def test_backtest(client):
+    rule_resp = await client.post(
+        "/rules/",
+        json={"name": "Backtest", "source": "bt_src", "destination": "bt_dest", "filters": {"keywords": ["urgent"]}}
+    )
+    rule_id = rule_resp.json()["id"]
+    adhoc = {"type": "condition", "condition": "starts_with", "value": "Normal"}
+
+    # JSON body
+    resp = await client.post(
+        "/rules/backtest",
+        json={"rule_ids": [rule_id], "filters": [adhoc], "messages": ["urgent fix", {"id": 7, "text": "Normal day"}, "nothing"]}
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in resp.text.splitlines()]
+    assert [r["matches"] for r in records[:3]] == [[f"rule:{rule_id}"], ["filter:0"], []]
+    assert records[1]["id"] == 7
+    summary = records[-1]
+    assert summary["type"] == "summary" and summary["messages"] == 3
+    assert [(r["key"], r["hits"]) for r in summary["rules"]] == [(f"rule:{rule_id}", 1), ("filter:0", 1)]
+
+    # NDJSON body: header line, then one message per line
+    lines = [{"rule_ids": [rule_id], "only_matches": True}, "urgent one", {"text": "calm"}, "URGENT two"]
+    resp = await client.post(
+        "/rules/backtest",
+        content="\n".join(json.dumps(line) for line in lines),
+        headers={"content-type": "application/x-ndjson"}
+    )
+    assert resp.status_code == 200
+    records = [json.loads(line) for line in resp.text.splitlines()]
+    assert [r["index"] for r in records if r["type"] == "message"] == [0, 2]
+    assert records[-1]["messages"] == 3
+
+    resp = await client.post("/rules/backtest", json={"rule_ids": [999], "messages": ["x"]})
+    assert resp.status_code == 404
+    resp = await client.post("/rules/backtest", json={"messages": ["x"]})
+    assert resp.status_code == 422
+
+@pytest.mark.anyio
+async def test_logs(client):
+    rule_resp = await client.post("/rules/", json={"name": "Logged", "source": "log_src", "destination": "log_dest"})
+    rule_id = rule_resp.json()["id"]
+    start = datetime(2026, 1, 1, 12, 0)
+    records = [
+        {"rule_id": rule_id, "source_message_id": i, "status": "failed" if i % 3 == 0 else "forwarded",
+         "details": None, "timestamp": start + timedelta(minutes=10 * i)}
+        for i in range(10)
+    ]
+    async with AsyncSession(engine) as session:
+        await session.execute(insert(Log), records)
+        await add_rollups(session, rollup_counts(records))
+        await session.commit()
+
+    # Newest first, three pages of four
+    seen = []
+    cursor = None
+    for _ in range(3):
+        params = {"rule_id": rule_id, "limit": 4}
+        if cursor:
+            params["cursor"] = cursor
+        resp = await client.get("/logs/", params=params)
+        assert resp.status_code == 200
+        page = resp.json()
+        seen += [log["source_message_id"] for log in page["items"]]
+        cursor = page["next_cursor"]
+    assert seen == list(range(9, -1, -1))
+    assert cursor is None
+
+    resp = await client.get("/logs/", params={"rule_id": rule_id, "status": "failed", "since": (start + timedelta(minutes=15)).isoformat()})
+    assert [log["source_message_id"] for log in resp.json()["items"]] == [9, 6, 3]
+    assert (await client.get("/logs/", params={"cursor": "bogus"})).status_code == 400
+
+    resp = await client.get("/logs/stats", params={
+        "rule_id": rule_id, "since": start.isoformat(), "until": (start + timedelta(hours=2)).isoformat()
+    })
+    assert resp.status_code == 200
+    # Minutes 0-110 all fall in the two hours; 0, 3, 6 and 9 failed
+    assert resp.json()["rules"] == [{"rule_id": rule_id, "forwarded": 6, "failed": 4}]
+
+    # Aware values ("Z" or another offset) are read as the UTC instant they denote
+    resp = await client.get("/logs/stats", params={"rule_id": rule_id, "since": "2026-01-01T12:00:00Z", "until": "2026-01-01T15:00:00+01:00"})
+    assert resp.status_code == 200
+    assert resp.json()["rules"] == [{"rule_id": rule_id, "forwarded": 6, "failed": 4}]
+    resp = await client.get("/logs/stats", params={"since": "2026-03-01T00:00:00Z"})
+    assert resp.status_code == 200
+    resp = await client.get("/logs/", params={"rule_id": rule_id, "status": "failed", "since": "2026-01-01T12:15:00Z"})
+    assert [log["source_message_id"] for log in resp.json()["items"]] == [9, 6, 3]
+
+@pytest.mark.anyio
+async def test_regex_filters_are_validated(client):
+    bad = {"type": "condition", "condition": "regex", "value": "(a+)+$"}
+    resp = await client.post("/rules/", json={"name": "Slow", "source": "rx_src", "destination": "rx_dest", "filters": bad})
+    assert resp.status_code == 422
+    assert "nested quantifiers" in resp.json()["detail"][0]
+
+    resp = await client.post("/rules/", json={"name": "Ok", "source": "rx_src", "destination": "rx_dest", "filters": {"regex": "^btc"}})
+    assert resp.status_code == 200
+    rule_id = resp.json()["id"]
+    resp = await client.patch(f"/rules/{rule_id}", json={"filters": {"regex": "(unclosed"}})
+    assert resp.status_code == 422
+    assert (await client.get(f"/rules/{rule_id}")).json()["filters"] == {"regex": "^btc"}
+
+@pytest.mark.anyio
+async def test_bulk_import_and_export(client):
+    tag = f"bulk_{id(client)}_{datetime.utcnow().timestamp()}"
+    rules = [{"name": f"{tag}_{i}", "source": f"{tag}_src", "destination": f"dest_{i}"} for i in range(5)]
+    rules[2]["filters"] = {"regex": "(a+)+"}
+    rules[3] = {"name": "missing source"}
+    resp = await client.post("/rules/import", json=rules)
+    assert resp.status_code == 200
+    summary = resp.json()
+    assert (summary["created"], summary["updated"], summary["failed"]) == (3, 0, 2)
+    assert sorted(error["row"] for error in summary["errors"]) == [3, 4]
+    assert len(rule_index.get_rules(f"{tag}_src")) == 3
+
+    # Export, edit and re-import as NDJSON: records with an id update the rule
+    resp = await client.get("/rules/export")
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    exported = [json.loads(line) for line in resp.text.splitlines()]
+    mine = [rule for rule in exported if rule["name"].startswith(tag)]
+    assert len(mine) == 3
+    for rule in mine:
+        rule["is_active"] = False
+    mine.append({"id": 10 ** 9, "name": "ghost"})
+    mine.append({"id": mine[0]["id"], "nmae": "typo"})
+    resp = await client.post(
+        "/rules/import",
+        content="\n".join(json.dumps(rule) for rule in mine),
+        headers={"content-type": "application/x-ndjson"}
+    )
+    assert (resp.json()["updated"], resp.json()["failed"]) == (3, 2)
+    assert {"row": 5, "error": "Unknown fields: nmae"} in resp.json()["errors"]
+    assert rule_index.get_rules(f"{tag}_src") == ()
+
+    # CSV round trip
+    resp = await client.get("/rules/export", params={"format": "csv"})
+    assert resp.text.splitlines()[0] == "id,name,source,destination,delivery_method,is_active,dedupe_window,filters,ai_config"
+    header, *lines = resp.text.splitlines()
+    mine_csv = [line for line in lines if tag in line]
+    assert len(mine_csv) == 3
+    resp = await client.post(
+        "/rules/import", content="\n".join([header] + mine_csv).replace("False", "true"), headers={"content-type": "text/csv"}
+    )
+    assert resp.json()["updated"] == 3
+    assert len(rule_index.get_rules(f"{tag}_src")) == 3
+    resp = await client.get("/rules/export", params={"format": "json"})
+    assert len([r for r in resp.json() if r["name"].startswith(tag)]) == 3
+
+    # Old Google Sheet layout: one rule per destination
+    sheet = (
+        f'chat,tags,forward to,status\n{tag}_sync,/sync,x\n'
+        f'{tag}_old,"btc, eth","-1001, -1002",on\n{tag}_off,x,-1003,off\n'
+    )
+    resp = await client.post(
+        "/rules/import", params={"layout": "legacy_sheet"}, content=sheet, headers={"content-type": "text/csv"}
+    )
+    assert resp.json()["created"] == 3
+    imported = rule_index.get_rules(f"{tag}_old")
+    assert sorted(r.destination for r in imported) == ["-1001", "-1002"]
+    assert imported[0].filters == {"keywords": ["btc", "eth"]}
+    assert rule_index.get_rules(f"{tag}_off") == ()
+    assert rule_index.get_rules(f"{tag}_sync") == ()
+
+@pytest.mark.anyio
+async def test_export_imports_into_an_empty_database(client):
+    tag = f"move_{id(client)}_{datetime.utcnow().timestamp()}"
+    for i in range(3):
+        await client.post("/rules/", json={"name": f"{tag}_{i}", "source": f"{tag}_src", "destination": f"d{i}"})
+    resp = await client.get("/rules/export")
+    exported = [line for line in resp.text.splitlines() if tag in line]
+    old_ids = [json.loads(line)["id"] for line in exported]
+
+    empty = create_async_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    async with empty.begin() as conn:
+        await conn.run_sync(SQLModel.metadata.create_all)
+    async def empty_session():
+        async with AsyncSession(empty, expire_on_commit=False) as session:
+            yield session
+
+    # A separate index too, as the new ids overlap those of the shared test database
+    index = RuleIndex()
+    app.dependency_overrides[get_session] = empty_session
+    try:
+        with patch("backend.routes.rules.rule_index", index):
+            resp = await client.post(
+                "/rules/import", content="\n".join(exported), headers={"content-type": "application/x-ndjson"}
+            )
+            rules = (await client.get("/rules/", params={"source": f"{tag}_src"})).json()
+    finally:
+        app.dependency_overrides[get_session] = override_get_session
+        await empty.dispose()
+
+    summary = resp.json()
+    assert (summary["created"], summary["updated"], summary["failed"]) == (3, 0, 0)
+    assert [(r["row"], r["id"]) for r in summary["renumbered"]] == [(1, old_ids[0]), (2, old_ids[1]), (3, old_ids[2])]
+    assert sorted(r["id"] for r in rules) == sorted(r["new_id"] for r in summary["renumbered"])
+    assert sorted(r["name"] for r in rules) == [f"{tag}_{i}" for i in range(3)]
+    assert len(index.get_rules(f"{tag}_src")) == 3
+
+@pytest.mark.anyio
+async def test_rules_list_pages_filters_and_revalidates(client):
+    tag = f"page_{id(client)}_{datetime.utcnow().timestamp()}"
+    ids = []
+    for i in range(5):
+        resp = await client.post("/rules/", json={"name": f"{tag} Rule {i}", "source": f"{tag}_src", "destination": f"d{i % 2}"})
+        ids.append(resp.json()["id"])
+    await client.patch(f"/rules/{ids[1]}", json={"is_active": False})
+
+    # Keyset pages by id, the cursor coming back in a header
+    seen, cursor = [], None
+    while True:
+        params = {"source": f"{tag}_src", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        resp = await client.get("/rules/", params=params)
+        seen += [rule["id"] for rule in resp.json()]
+        cursor = resp.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert seen == ids
+
+    resp = await client.get("/rules/", params={"source": f"{tag}_src", "order_by": "updated_at", "limit": 1})
+    assert [rule["id"] for rule in resp.json()] == [ids[1]]
+    resp = await client.get("/rules/", params={"name": tag.upper(), "destination": "d0", "is_active": True})
+    assert [rule["id"] for rule in resp.json()] == [ids[0], ids[2], ids[4]]
+    resp = await client.get("/rules/", params={"name": "100%"})
+    assert resp.json() == []
+    assert (await client.get("/rules/", params={"cursor": "!!"})).status_code == 400
+
+    # Unchanged polls are answered from the rule-set version alone
+    etag = resp.headers["etag"]
+    resp = await client.get("/rules/", headers={"If-None-Match": f"W/{etag}"})
+    assert resp.status_code == 304
+    assert resp.headers["etag"] == etag
+    await client.delete(f"/rules/{ids[0]}")
+    resp = await client.get("/rules/", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["etag"] != etag
+
+@pytest.mark.anyio
+async def test_rule_index_follows_crud(client):
+    resp = await client.post(
+        "/rules/",
+        json={
+            "name": "Indexed",
+            "source": "idx_src",
+            "destination": "idx_dst",
+            "filters": {"keywords": ["deal"]}
+        }
+    )
+    rule_id = resp.json()["id"]
+    assert [r.id for r in rule_index.match("idx_src", "Hot deal today")] == [rule_id]
+    assert rule_index.match("idx_src", "nothing here") == []
+
+    # Moving the rule to another source re-keys it
+    await client.patch(f"/rules/{rule_id}", json={"source": "idx_src2"})
+    assert rule_index.get_rules("idx_src") == ()
+    assert [r.id for r in rule_index.get_rules("idx_src2")] == [rule_id]
+
+    # Deactivating drops it from the index
+    await client.patch(f"/rules/{rule_id}", json={"is_active": False})
+    assert rule_id not in rule_index
+
+    await client.patch(f"/rules/{rule_id}", json={"is_active": True})
+    assert rule_id in rule_index
+
+    await client.delete(f"/rules/{rule_id}")
+    assert rule_id not in rule_index
+    assert rule_index.get_rules("idx_src2") == ()
+
+@pytest.mark.anyio
+async def test_rule_index_load(client):
+    resp = await client.post(
+        "/rules/",
+        json={"name": "Loaded", "source": "load_src", "destination": "load_dst"}
+    )
+    rule_id = resp.json()["id"]
+
+    async for session in override_get_session():
+        await rule_index.load(session)
+
+    assert rule_id in [r.id for r in rule_index.get_rules("load_src")]
+
+@pytest.mark.anyio
+async def test_rate_limit_state(client):
+    response = await client.get("/delivery/rate-limits")
+    assert response.status_code == 200
+    data = response.json()
+    assert "parked_destinations" in data
+    assert "queued" in data
+
+@pytest.mark.anyio
+async def test_account_state(client):
+    response = await client.get("/delivery/accounts")
+    assert response.status_code == 200
+    # Telegram is not started in tests, so the pool is empty
+    assert response.json() == []
+
+@pytest.mark.anyio
+async def test_delivery_state_reported_by_workers(client):
+    worker_id = f"w_{id(client)}_{datetime.utcnow().timestamp()}"
+    state = {
+        "rate_limits": {"parked_destinations": {"-100456": 12.5}, "queued": {"-100456": 3}},
+        "accounts": [{"name": "default", "healthy": True, "sent": 7}],
+    }
+    async for session in override_get_session():
+        session.add(Worker(id=worker_id, state=state))
+        # A worker that stopped heartbeating is left out
+        session.add(Worker(id=f"{worker_id}_dead", heartbeat_at=datetime.utcnow() - timedelta(hours=1), state=state))
+        await session.commit()
+
+    try:
+        data = (await client.get("/delivery/rate-limits")).json()
+        assert list(data["workers"]) == [worker_id]
+        assert data["workers"][worker_id]["parked_destinations"] == {"-100456": 12.5}
+        accounts = (await client.get("/delivery/accounts")).json()
+        assert accounts == [{"name": "default", "healthy": True, "sent": 7, "worker": worker_id}]
+    finally:
+        async for session in override_get_session():
+            await session.execute(delete(Worker).where(Worker.id.startswith(worker_id)))
+            await session.commit()
+
+@pytest.mark.anyio
+async def test_metrics(client):
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE tgforwarder_stage_seconds histogram" in response.text